@@ -0,0 +1,252 @@
+"""
+Asynchronous MongoDB writer for sync runs
+
+Writes go through PyMongo's AsyncMongoClient so they overlap with fetches
+on one event loop instead of blocking it. Diffing and update documents are
+shared with MongoDBHandler; only the I/O differs.
+"""
+
+import asyncio
+import importlib.util
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import PyMongoError
+
+from src.mongodb_handler import (
+    SNAPSHOT_COLLECTION,
+    MongoDBHandler,
+    database_uri,
+    history_codec_setting,
+)
+from src.profiling import stage
+
+# Wire compressors in order of preference, with the module each one needs
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def available_compressors(
+    preferred: Sequence[str] = ("zstd", "snappy", "zlib")
+) -> List[str]:
+    """Preferred network compressors whose libraries are installed"""
+    return [
+        name
+        for name in preferred
+        if name in COMPRESSOR_MODULES
+        and importlib.util.find_spec(COMPRESSOR_MODULES[name]) is not None
+    ]
+
+
+class AsyncMongoDBHandler:
+    """
+    Async counterpart of MongoDBHandler's write path
+    Args:
+        pool_size: Maximum connections in the pool
+        min_pool_size: Connections opened by warm_up() and kept open
+        compressors: Preferred wire compressors; unavailable ones are skipped
+            and the server picks the first one it also supports
+        write_concern: "w" value for writes (1 acknowledges on the primary,
+            0 skips acknowledgement, "majority" waits for replication)
+        journal: Wait for the journal before acknowledging (None: server default)
+        history_codec: Pack numeric histories with this codec (see
+            MongoDBHandler; default MONGODB_HISTORY_CODEC)
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 32,
+        min_pool_size: int = 4,
+        compressors: Sequence[str] = ("zstd", "snappy", "zlib"),
+        write_concern: Union[int, str] = 1,
+        journal: Optional[bool] = None,
+        history_codec: Optional[str] = None,
+    ):
+        self.uri = database_uri()
+        self.pool_size = pool_size
+        self.min_pool_size = min(min_pool_size, pool_size)
+        self.compressors = available_compressors(compressors)
+        self.write_concern = write_concern
+        self.journal = journal
+        self.history_codec = history_codec_setting(history_codec)
+
+        self.client = None
+        self.collection = None
+        self.snapshots = None
+        self._stored_docs: Dict[str, Optional[Dict]] = {}
+        self.last_bytes_saved = 0
+        self.total_bytes_full = 0
+        self.total_bytes_sent = 0
+
+    async def connect(self):
+        """Create the client and warm up the connection pool"""
+        options = {
+            "tls": True,
+            "tlsAllowInvalidCertificates": True,  # Disable SSL verification for development
+            "maxPoolSize": self.pool_size,
+            "minPoolSize": self.min_pool_size,
+            "w": self.write_concern,
+        }
+        if self.compressors:
+            options["compressors"] = ",".join(self.compressors)
+        if self.journal is not None:
+            options["journal"] = self.journal
+
+        try:
+            self.client = AsyncMongoClient(self.uri, **options)
+            database = self.client.get_database()
+            self.collection = database["companies"]
+            self.snapshots = database[SNAPSHOT_COLLECTION]
+            await self.warm_up()
+            print(
+                "Successfully connected to MongoDB (cse-data.companies, async, "
+                f"pool {self.pool_size}, compressors {self.compressors or 'none'})"
+            )
+        except PyMongoError as e:
+            print(f"Error connecting to MongoDB: {e}")
+            raise
+
+    async def warm_up(self):
+        """Open min_pool_size connections now so the first writes do not pay for them"""
+        await asyncio.gather(
+            *(self.client.admin.command("ping") for _ in range(self.min_pool_size))
+        )
+
+    async def close(self):
+        """Close MongoDB connection"""
+        if self.client:
+            await self.client.close()
+            self.client = None
+            self.collection = None
+            self.snapshots = None
+            print("MongoDB connection closed")
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def prefetch_companies(
+        self, symbols: Iterable[str], batch_size: int = 500
+    ) -> int:
+        """
+        Bulk-load the stored tradingViewData of many companies so later
+        writes can be diffed without a round trip per symbol
+        Args:
+            symbols: Company symbols (e.g., ["AAF.N0000", "HAYL.N0000"])
+            batch_size: Number of symbols per $in query
+        Returns:
+            int: Number of stored documents found
+        """
+        symbols = list(symbols)
+        found = 0
+        try:
+            for start in range(0, len(symbols), batch_size):
+                batch = symbols[start : start + batch_size]
+                for symbol in batch:
+                    self._stored_docs[symbol] = None
+
+                cursor = self.collection.find(
+                    {"basicInfo.symbol": {"$in": batch}},
+                    {"_id": 0, "basicInfo.symbol": 1, "tradingViewData": 1},
+                )
+                async for doc in cursor:
+                    symbol = doc.get("basicInfo", {}).get("symbol")
+                    self._stored_docs[symbol] = doc.get("tradingViewData") or {}
+                    found += 1
+        except PyMongoError as e:
+            print(f"Error prefetching stored company data: {e}")
+            self._stored_docs.clear()
+        return found
+
+    async def _get_stored_financials(self, symbol: str) -> Optional[Dict]:
+        """Return stored tradingViewData for a symbol, or None if no company matches"""
+        if symbol in self._stored_docs:
+            return self._stored_docs.pop(symbol)
+
+        doc = await self.collection.find_one(
+            {"basicInfo.symbol": symbol}, {"_id": 0, "tradingViewData": 1}
+        )
+        if doc is None:
+            return None
+        return doc.get("tradingViewData") or {}
+
+    async def update_company_financials(
+        self,
+        symbol: str,
+        financial_data: Optional[Dict],
+        update_doc: Optional[Dict] = None,
+    ) -> Optional[Dict]:
+        """
+        Update company financial data in MongoDB
+        Args:
+            symbol: Company symbol (e.g., "AAF.N0000")
+            financial_data: Dictionary from TradingView
+            update_doc: build_update_doc(financial_data) if already built
+        Returns:
+            dict: Field-level changes of the write (see
+                MongoDBHandler.field_changes), or None if it failed. Writes
+                run concurrently, so there is no last_changes attribute.
+        """
+        if not financial_data and update_doc is None:
+            print(f"No data provided for {symbol}")
+            return None
+
+        try:
+            if update_doc is None:
+                with stage("transform"):
+                    update_doc = MongoDBHandler.build_update_doc(financial_data)
+
+            stored_raw = await self._get_stored_financials(symbol)
+            if stored_raw is None:
+                print(f"No matching company found for symbol {symbol}")
+                return None
+
+            # Same guarded $push and $set fallback as MongoDBHandler
+            for allow_push in (True, False):
+                with stage("transform"):
+                    plan = MongoDBHandler.plan_update(
+                        symbol, update_doc, stored_raw, self.history_codec, allow_push
+                    )
+
+                with stage("write"):
+                    result = await self.collection.update_one(
+                        plan["filter"], plan["update"], upsert=False
+                    )
+                # Unacknowledged writes (w=0) report no counts, so they cannot
+                # be checked; the guard still prevents a double prepend
+                if (
+                    not result.acknowledged
+                    or result.matched_count > 0
+                    or "$push" not in plan["update"]
+                ):
+                    break
+                stored_raw = await self._get_stored_financials(symbol)
+                if stored_raw is None:
+                    break
+
+            self.last_bytes_saved = plan["bytes_full"] - plan["bytes_sent"]
+            self.total_bytes_full += plan["bytes_full"]
+            self.total_bytes_sent += plan["bytes_sent"]
+
+            # Unacknowledged writes (w=0) report no counts
+            if not result.acknowledged or result.modified_count > 0:
+                changes = plan["changes"]
+                snapshot = MongoDBHandler.snapshot_update(
+                    symbol, update_doc, plan["stored"], changes
+                )
+                if snapshot is not None:
+                    snapshot["updatedAt"] = datetime.utcnow()
+                    with stage("write"):
+                        await self.snapshots.replace_one(
+                            {"_id": symbol}, snapshot, upsert=True
+                        )
+                return changes
+            print(f"No matching company found for symbol {symbol}")
+            return None
+
+        except PyMongoError as e:
+            print(f"Error updating financial data for {symbol}: {e}")
+            return None
@@ -0,0 +1,215 @@
+"""
+Benchmark results store and regression checks
+
+Every tracked benchmark run is appended to a JSONL file together with the
+git commit it ran on. A new run is compared metric by metric against a
+rolling baseline: the median of the per-commit medians over the last few
+commits. A metric regresses when it is worse than the baseline by more
+than the larger of a relative tolerance and a few standard deviations of
+the baseline commits, so noisy metrics get a wider band than stable ones.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+DEFAULT_HISTORY_PATH = os.path.join("bench_results", "history.jsonl")
+
+# Benchmark -> metric -> "higher" or "lower" (which direction is better)
+TRACKED_METRICS = {
+    "perf": {
+        "fetches_per_second": "higher",
+        "fetch_p50_ms": "lower",
+        "fetch_p95_ms": "lower",
+        "fetch_p99_ms": "lower",
+        "fetch_cpu_ms_per_symbol": "lower",
+        "write_p50_ms": "lower",
+        "write_p95_ms": "lower",
+        "write_cpu_ms_per_symbol": "lower",
+        "peak_rss_mb": "lower",
+    },
+    "soak": {"fetches_per_second": "higher"},
+}
+
+
+def git_revision(cwd: Optional[str] = None) -> Dict:
+    """
+    Current commit and whether the tree has uncommitted changes
+    Returns:
+        dict: "commit" (short hash, or "unknown" outside git) and "dirty"
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "unknown", "dirty": False}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def _run_key(run: Dict) -> str:
+    return run["commit"] + ("+dirty" if run.get("dirty") else "")
+
+
+def record_run(
+    name: str,
+    metrics: Dict,
+    path: str = DEFAULT_HISTORY_PATH,
+    revision: Optional[Dict] = None,
+) -> Dict:
+    """
+    Append one benchmark run to the results store
+    Args:
+        name: Benchmark name
+        metrics: Metric name -> number
+        path: JSONL results file (created with its directory if missing)
+        revision: git_revision() result (looked up if not given)
+    Returns:
+        dict: The stored record
+    """
+    revision = revision or git_revision()
+    record = {
+        "benchmark": name,
+        "commit": revision["commit"],
+        "dirty": revision["dirty"],
+        "recordedAt": datetime.utcnow().isoformat(),
+        "metrics": metrics,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+def load_runs(name: str, path: str = DEFAULT_HISTORY_PATH) -> List[Dict]:
+    """Stored runs of one benchmark, oldest first"""
+    if not os.path.exists(path):
+        return []
+    runs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Partially written line
+            if record.get("benchmark") == name:
+                runs.append(record)
+    return runs
+
+
+def compare_to_baseline(
+    name: str,
+    metrics: Dict,
+    runs: List[Dict],
+    revision: Optional[Dict] = None,
+    window: int = 10,
+    tolerance: float = 0.1,
+    sigmas: float = 3.0,
+    min_commits: int = 2,
+) -> Dict:
+    """
+    Compare a run against the rolling baseline of earlier commits
+    Args:
+        name: Benchmark name (selects TRACKED_METRICS)
+        metrics: Metric name -> number for the new run
+        runs: load_runs() result
+        revision: Commit of the new run; its own earlier runs are not baseline
+        window: Earlier commits in the baseline
+        tolerance: Allowed relative slowdown
+        sigmas: Allowed slowdown in standard deviations of the baseline commits
+        min_commits: Commits needed before metrics can fail
+    Returns:
+        dict: "commit", "baseline_commits", per-metric "metrics" and "passed"
+    """
+    revision = revision or git_revision()
+    current_key = _run_key(revision)
+
+    # One value per commit (the median of its runs), newest commits last
+    per_commit: Dict[str, List[Dict]] = {}
+    for run in runs:
+        key = _run_key(run)
+        if key != current_key:
+            per_commit.setdefault(key, []).append(run["metrics"])
+    commits = list(per_commit)[-window:]
+
+    report = {
+        "benchmark": name,
+        "commit": current_key,
+        "baseline_commits": commits,
+        "metrics": {},
+        "passed": True,
+    }
+    for metric, direction in TRACKED_METRICS.get(name, {}).items():
+        value = metrics.get(metric)
+        if value is None:
+            continue
+        history = [
+            statistics.median(
+                run[metric] for run in per_commit[key] if run.get(metric) is not None
+            )
+            for key in commits
+            if any(run.get(metric) is not None for run in per_commit[key])
+        ]
+        entry = {"value": value, "better": direction}
+        report["metrics"][metric] = entry
+        if len(history) < min_commits:
+            entry["status"] = "no baseline"
+            continue
+
+        baseline = statistics.median(history)
+        spread = statistics.stdev(history)
+        allowed = max(abs(baseline) * tolerance, spread * sigmas)
+        worse_by = value - baseline if direction == "lower" else baseline - value
+        entry.update(
+            {
+                "baseline": round(baseline, 4),
+                "allowed": round(allowed, 4),
+                "change_pct": (
+                    round((value - baseline) / baseline * 100, 1) if baseline else None
+                ),
+            }
+        )
+        if worse_by > allowed:
+            entry["status"] = "regressed"
+            report["passed"] = False
+        elif worse_by < -allowed:
+            entry["status"] = "improved"
+        else:
+            entry["status"] = "ok"
+    return report
+
+
+def format_report(report: Dict) -> str:
+    """Readable pass/fail report from compare_to_baseline()"""
+    status = "PASS" if report["passed"] else "FAIL"
+    lines = [
+        f"Regression check: {report['benchmark']} @ {report['commit']} [{status}] "
+        f"(baseline: {len(report['baseline_commits'])} commits)"
+    ]
+    for metric, entry in report["metrics"].items():
+        if "baseline" not in entry:
+            lines.append(f"  {metric}: {entry['value']} ({entry['status']})")
+            continue
+        change = entry["change_pct"]
+        change_text = f"{change:+.1f}%" if change is not None else "n/a"
+        lines.append(
+            f"  {metric}: {entry['value']} vs {entry['baseline']} "
+            f"({change_text}, {entry['better']} is better) {entry['status'].upper()}"
+        )
+    return "\n".join(lines)
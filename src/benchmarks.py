@@ -0,0 +1,480 @@
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+# Heavy third-party packages that must not load just by importing the CLI
+LAZY_IMPORTS = ("pymongo", "bson", "websocket", "requests", "tqdm", "dotenv", "pyarrow")
+
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {lazy!r} if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def bench_import_time(
+    modules: Iterable[str] = (
+        "src.cli",
+        "src.financial_sync",
+        "src.fetch_tradingview_financials",
+        "src.fetch_companies",
+    ),
+    budget_ms: float = 50.0,
+    repeat: int = 5,
+) -> Dict:
+    """
+    Measure cold import time of each module in a fresh interpreter
+    Args:
+        modules: Dotted module names to import
+        budget_ms: Maximum allowed best-of-N import time per module
+        repeat: Number of fresh interpreters per module
+    Returns:
+        dict: Per-module timings, eagerly loaded heavy packages and a pass flag
+    """
+    results = {"budget_ms": budget_ms, "modules": {}, "passed": True}
+
+    for module in modules:
+        timings = []
+        eager = set()
+        for _ in range(repeat):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-c",
+                    _IMPORT_PROBE.format(module=module, lazy=LAZY_IMPORTS),
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split()
+            timings.append(float(output[0]) * 1000)
+            if len(output) > 1:
+                eager.update(output[1].split(","))
+
+        best_ms = min(timings)
+        passed = best_ms <= budget_ms and not eager
+        results["modules"][module] = {
+            "best_ms": round(best_ms, 2),
+            "median_ms": round(statistics.median(timings), 2),
+            "eager_imports": sorted(eager),
+            "passed": passed,
+        }
+        results["passed"] = results["passed"] and passed
+
+    return results
+
+
+def print_bench_results(name: str, results: Dict):
+    """Print benchmark results in a readable format"""
+    status = "PASS" if results.get("passed", True) else "FAIL"
+    print(f"\n{'=' * 50}")
+    print(f"Benchmark: {name} [{status}]")
+    print(f"{'=' * 50}")
+    for key, value in results.items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for sub_key, sub_value in value.items():
+                print(f"  {sub_key}: {sub_value}")
+        elif key != "passed":
+            print(f"{key}: {value}")
+    print(f"{'=' * 50}\n")
+
+
+def _start_mock_server_process(
+    per_symbol_delay: float,
+    history_length: int,
+    port: int = 0,
+    compression: bool = True,
+    reuse_port: bool = False,
+):
+    """Run the mock server in its own process so it does not share our GIL"""
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    from src.mock_tradingview import serve
+
+    process = context.Process(
+        target=serve,
+        args=(port, per_symbol_delay, history_length, ready, compression, reuse_port),
+        daemon=True,
+    )
+    process.start()
+    port = ready.get(timeout=30)
+    return process, f"ws://127.0.0.1:{port}/socket.io/websocket"
+
+
+def bench_universe_scaling(
+    total_symbols: int = 10000,
+    connection_counts: Iterable[int] = (1, 2, 4, 8),
+    symbols_per_connection: int = 250,
+    per_symbol_delay: float = 0.004,
+    history_length: int = 8,
+    min_efficiency: float = 0.7,
+) -> Dict:
+    """
+    Synthetic multi-exchange run against the local mock server
+
+    Each run gives every connection the same number of shards, so the
+    largest connection count covers the whole universe while smaller counts
+    finish in similar wall time. Throughput is bounded by decode CPU of a
+    single interpreter (a few thousand symbols per second), so the mock
+    server's per-connection rate is kept well below that.
+    Args:
+        total_symbols: Symbols in the synthetic universe (split over 4 exchanges)
+        connection_counts: Concurrent connection counts to compare
+        symbols_per_connection: Per-connection symbol cap (shard size)
+        per_symbol_delay: Mock server time per symbol on one connection
+        history_length: Periods per synthetic history array
+        min_efficiency: Required throughput per connection relative to one connection
+    Returns:
+        dict: Symbols per second and scaling efficiency per connection count
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from src.fetch_tradingview_financials import fetch_financial_data_batch
+    from src.universe import StaticUniverseProvider, load_universe, shard_symbols
+
+    exchanges = ("XA", "XB", "XC", "XD")
+    per_exchange = total_symbols // len(exchanges)
+    universe = load_universe(
+        StaticUniverseProvider(
+            exchange, (f"SYM{index:05d}" for index in range(per_exchange))
+        )
+        for exchange in exchanges
+    )
+    shards = shard_symbols(universe, symbols_per_connection)
+
+    process, url = _start_mock_server_process(per_symbol_delay, history_length)
+    results = {
+        "symbols": len(universe),
+        "shards": len(shards),
+        "runs": {},
+        "passed": True,
+    }
+    try:
+
+        def run_shard(shard):
+            fetched = fetch_financial_data_batch(
+                [entry["tradingview_symbol"] for entry in shard],
+                timeout=120,
+                websocket_url=url,
+            )
+            return sum(1 for data in fetched.values() if data)
+
+        connection_counts = sorted(connection_counts)
+        shards_per_connection = max(1, len(shards) // connection_counts[-1])
+        baseline_rate = None
+        for connections in connection_counts:
+            run_shards = shards[: connections * shards_per_connection]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                received = sum(executor.map(run_shard, run_shards))
+            elapsed = time.perf_counter() - start
+            expected = sum(len(shard) for shard in run_shards)
+
+            rate = received / elapsed
+            baseline_rate = baseline_rate or rate / connections
+            efficiency = rate / (baseline_rate * connections)
+            results["runs"][connections] = {
+                "seconds": round(elapsed, 2),
+                "symbols": expected,
+                "received": received,
+                "symbols_per_second": round(rate, 1),
+                "efficiency": round(efficiency, 2),
+            }
+            if received != expected or efficiency < min_efficiency:
+                results["passed"] = False
+    finally:
+        process.terminate()
+        process.join()
+
+    return results
+
+
+def bench_process_scaling(
+    total_symbols: int = 20000,
+    process_counts: Optional[Iterable[int]] = None,
+    connections_per_process: int = 4,
+    symbols_per_connection: int = 250,
+    history_length: int = 8,
+    min_efficiency: float = 0.7,
+) -> Dict:
+    """
+    Decode-bound sync against the local mock server with 1..N worker processes
+
+    The mock server sends without delay, so every run is limited by the CPU
+    spent parsing frames and building update documents. The server runs as
+    several processes sharing one port so that it does not become the
+    bottleneck itself, and compression is off so that inflating is not
+    counted against the workers.
+    Args:
+        total_symbols: Symbols fetched in every run
+        process_counts: Worker process counts to compare (default: powers of
+            two up to the number of cores)
+        connections_per_process: Concurrent connections in each worker
+        symbols_per_connection: Shard size
+        history_length: Periods per synthetic history array
+        min_efficiency: Required throughput per process relative to one process
+    Returns:
+        dict: Symbols per second and scaling efficiency per process count
+    """
+    import os
+
+    from src.financial_sync import FetchOptions
+    from src.process_sharding import (
+        default_process_count,
+        iter_process_results,
+        worker_options,
+    )
+    from src.universe import StaticUniverseProvider, load_universe, shard_symbols
+
+    if process_counts is None:
+        cores = default_process_count()
+        process_counts = [1]
+        while process_counts[-1] * 2 <= cores:
+            process_counts.append(process_counts[-1] * 2)
+    process_counts = sorted(process_counts)
+
+    universe = load_universe(
+        [
+            StaticUniverseProvider(
+                "XA", (f"SYM{index:05d}" for index in range(total_symbols))
+            )
+        ]
+    )
+    shards = shard_symbols(universe, symbols_per_connection)
+
+    servers = []
+    process, url = _start_mock_server_process(
+        0, history_length, compression=False, reuse_port=True
+    )
+    servers.append(process)
+    port = int(url.split(":")[2].split("/")[0])
+    for _ in range(max(1, process_counts[-1] // 2) - 1):
+        servers.append(
+            _start_mock_server_process(
+                0, history_length, port, compression=False, reuse_port=True
+            )[0]
+        )
+
+    results = {
+        "symbols": len(universe),
+        "cores": default_process_count(),
+        "runs": {},
+        "passed": True,
+    }
+    previous_url = os.environ.get("TRADINGVIEW_WEBSOCKET_URL")
+    # Workers read the URL from the environment they inherit
+    os.environ["TRADINGVIEW_WEBSOCKET_URL"] = url
+    try:
+        baseline_rate = None
+        for processes in process_counts:
+            options = worker_options(
+                FetchOptions(
+                    rate_limit=0.0,
+                    retry_delay=0.1,
+                    max_retries=1,
+                    max_concurrency=connections_per_process * processes,
+                    breaker_threshold=1000,
+                    breaker_cooldown=1.0,
+                    compression=False,
+                    processes=processes,
+                ),
+                timeout=120,
+                initial_concurrency=connections_per_process * processes,
+                time_budget=None,
+                keep_payloads=False,
+            )
+            start = time.perf_counter()
+            received = sum(
+                len(shard_results or {})
+                for _, shard_results in iter_process_results(shards, processes, options)
+            )
+            elapsed = time.perf_counter() - start
+
+            rate = received / elapsed
+            baseline_rate = baseline_rate or rate
+            efficiency = rate / (baseline_rate * processes)
+            results["runs"][processes] = {
+                "seconds": round(elapsed, 2),
+                "received": received,
+                "symbols_per_second": round(rate, 1),
+                "efficiency": round(efficiency, 2),
+            }
+            # More processes than cores cannot scale, so only count them as failures
+            # when symbols went missing
+            oversubscribed = processes > results["cores"]
+            if received != len(universe) or (
+                efficiency < min_efficiency and not oversubscribed
+            ):
+                results["passed"] = False
+    finally:
+        if previous_url is None:
+            os.environ.pop("TRADINGVIEW_WEBSOCKET_URL", None)
+        else:
+            os.environ["TRADINGVIEW_WEBSOCKET_URL"] = previous_url
+        for process in servers:
+            process.terminate()
+            process.join()
+
+    return results
+
+
+def bench_soak(
+    fetches: int = 2000,
+    concurrency: int = 4,
+    warmup: int = 100,
+    samples: int = 8,
+    max_rss_growth_mb: float = 20.0,
+) -> Dict:
+    """
+    Thousands of single-symbol fetches against the local mock server,
+    checking that threads, sockets and memory stay flat
+
+    The baseline is taken after a warm-up so that pools, caches and lazy
+    imports are already in place. Every fetch opens and closes its own
+    connection, which is where leaked threads and sockets would pile up.
+    Args:
+        fetches: Fetches after the warm-up
+        concurrency: Fetches in flight at once
+        warmup: Fetches before the baseline is taken
+        samples: Resource samples taken during the run
+        max_rss_growth_mb: Allowed RSS growth over the baseline
+    Returns:
+        dict: Baseline, samples and final usage, failures and a pass flag
+    """
+    import gc
+    from concurrent.futures import ThreadPoolExecutor
+
+    from src.fetch_tradingview_financials import fetch_financial_data
+    from src.resources import resource_usage
+
+    process, url = _start_mock_server_process(0.0, 8)
+
+    def fetch(index):
+        data = fetch_financial_data(f"SOAK:S{index}", timeout=10, websocket_url=url)
+        return data["total_revenue_fy_h"] is not None
+
+    def settled_usage():
+        # Closed sockets and finished threads are released asynchronously
+        time.sleep(0.5)
+        gc.collect()
+        return resource_usage()
+
+    results = {"fetches": fetches, "samples": {}, "passed": True}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            ok = sum(executor.map(fetch, range(warmup)))
+            baseline = settled_usage()
+            results["baseline"] = baseline
+
+            step = max(1, fetches // samples)
+            done = 0
+            start = time.perf_counter()
+            while done < fetches:
+                count = min(step, fetches - done)
+                ok += sum(executor.map(fetch, range(done, done + count)))
+                done += count
+                results["samples"][done] = resource_usage()
+            elapsed = time.perf_counter() - start
+            final = settled_usage()
+    finally:
+        process.terminate()
+        process.join()
+
+    rss_growth = (final["rss_bytes"] or 0) - (baseline["rss_bytes"] or 0)
+    results.update(
+        {
+            "final": final,
+            "failures": warmup + fetches - ok,
+            "fetches_per_second": round(fetches / elapsed, 1),
+            "rss_growth_mb": round(rss_growth / 1024 / 1024, 2),
+        }
+    )
+    results["passed"] = (
+        results["failures"] == 0
+        and final["threads"] <= baseline["threads"]
+        and (final["sockets"] or 0) <= (baseline["sockets"] or 0)
+        and final["websockets"] == 0
+        and rss_growth <= max_rss_growth_mb * 1024 * 1024
+    )
+    return results
+
+
+def _percentile_ms(seconds: List[float], percentile: int) -> float:
+    cuts = statistics.quantiles(seconds, n=100, method="inclusive")
+    return round(cuts[percentile - 1] * 1000, 3)
+
+
+def bench_fetch_write(fetches: int = 300, writes: int = 2000) -> Dict:
+    """
+    Latency, throughput and CPU of the fetch and write paths
+
+    Fetches are sequential fetch_financial_data calls against the local mock
+    server (in its own process, so CPU time is the client's). The write path
+    is everything update_company_financials does apart from the MongoDB round
+    trip: building the update document, MongoDBHandler.plan_update() and the
+    snapshot, for a stored document one period behind.
+    Args:
+        fetches: Fetches to time
+        writes: Write-path runs to time
+    Returns:
+        dict: Flat metrics (see bench_history.TRACKED_METRICS) and a pass flag
+    """
+    from src.fetch_tradingview_financials import fetch_financial_data
+    from src.mongodb_handler import MongoDBHandler
+    from src.resources import peak_rss_bytes
+
+    process, url = _start_mock_server_process(0.0, 8)
+    try:
+        fetch_financial_data("PERF:WARMUP", timeout=10, websocket_url=url)
+        latencies = []
+        failures = 0
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for index in range(fetches):
+            fetch_start = time.perf_counter()
+            data = fetch_financial_data(f"PERF:S{index}", timeout=10, websocket_url=url)
+            latencies.append(time.perf_counter() - fetch_start)
+            failures += data["total_revenue_fy_h"] is None
+        elapsed = time.perf_counter() - start
+        fetch_cpu = time.process_time() - cpu_start
+    finally:
+        process.terminate()
+        process.join()
+
+    update_doc = MongoDBHandler.build_update_doc(data)
+    stored = {
+        path.split(".", 1)[1]: value[1:] if isinstance(value, list) else value
+        for path, value in update_doc.items()
+        if path.startswith("tradingViewData.")
+    }
+    write_latencies = []
+    cpu_start = time.process_time()
+    for _ in range(writes):
+        write_start = time.perf_counter()
+        doc = MongoDBHandler.build_update_doc(data)
+        plan = MongoDBHandler.plan_update("PERF", doc, stored)
+        MongoDBHandler.snapshot_update("PERF", doc, plan["stored"], plan["changes"])
+        write_latencies.append(time.perf_counter() - write_start)
+    write_cpu = time.process_time() - cpu_start
+
+    peak = peak_rss_bytes()
+    return {
+        "fetches_per_second": round(fetches / elapsed, 1),
+        "fetch_p50_ms": _percentile_ms(latencies, 50),
+        "fetch_p95_ms": _percentile_ms(latencies, 95),
+        "fetch_p99_ms": _percentile_ms(latencies, 99),
+        "fetch_cpu_ms_per_symbol": round(fetch_cpu / fetches * 1000, 3),
+        "write_p50_ms": _percentile_ms(write_latencies, 50),
+        "write_p95_ms": _percentile_ms(write_latencies, 95),
+        "write_cpu_ms_per_symbol": round(write_cpu / writes * 1000, 3),
+        "peak_rss_mb": round(peak / 1024 / 1024, 1) if peak is not None else None,
+        "failures": failures,
+        "passed": failures == 0,
+    }
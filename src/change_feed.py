@@ -0,0 +1,185 @@
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class ChangeOutbox(ABC):
+    """
+    Append-only feed of per-symbol field deltas written by the sync
+
+    Records are {"cursor", "run_id", "symbol", "changedAt", "changes"} where
+    changes maps tradingViewData field names to {"old", "new"} (or
+    {"prepended"} for histories). Consumers keep the cursor of the last
+    record they processed and resume from it.
+    """
+
+    @abstractmethod
+    def append(self, symbol: str, changes: Dict, run_id: str) -> Optional[int]:
+        """Record the delta for one symbol; empty deltas are skipped"""
+
+    @abstractmethod
+    def read(self, cursor: int = 0, limit: int = 500) -> Tuple[List[Dict], int]:
+        """
+        Read records after a cursor
+        Args:
+            cursor: Cursor returned by the previous read (0 for the start)
+            limit: Maximum records to return
+        Returns:
+            tuple: (records, next cursor)
+        """
+
+    def iter_changes(self, cursor: int = 0, batch_size: int = 500) -> Iterator[Dict]:
+        """Iterate over every record after cursor"""
+        while True:
+            records, cursor = self.read(cursor, batch_size)
+            if not records:
+                return
+            yield from records
+
+    def close(self):
+        pass
+
+
+class SQLiteOutbox(ChangeOutbox):
+    """Outbox stored in a SQLite table; the cursor is the row id"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " run_id TEXT NOT NULL,"
+            " symbol TEXT NOT NULL,"
+            " changed_at TEXT NOT NULL,"
+            " changes TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS changes_symbol ON changes (symbol, id)"
+        )
+        self._conn.commit()
+
+    def append(self, symbol: str, changes: Dict, run_id: str) -> Optional[int]:
+        if not changes:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "INSERT INTO changes (run_id, symbol, changed_at, changes)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    run_id,
+                    symbol,
+                    datetime.utcnow().isoformat(),
+                    json.dumps(changes, default=str, separators=(",", ":")),
+                ),
+            )
+            self._conn.commit()
+            return row.lastrowid
+
+    def read(self, cursor: int = 0, limit: int = 500) -> Tuple[List[Dict], int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, run_id, symbol, changed_at, changes FROM changes"
+                " WHERE id > ? ORDER BY id LIMIT ?",
+                (cursor, limit),
+            ).fetchall()
+        records = [
+            {
+                "cursor": row[0],
+                "run_id": row[1],
+                "symbol": row[2],
+                "changedAt": row[3],
+                "changes": json.loads(row[4]),
+            }
+            for row in rows
+        ]
+        return records, (rows[-1][0] if rows else cursor)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JsonlOutbox(ChangeOutbox):
+    """Outbox stored as JSON lines; the cursor is the byte offset after a record"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, symbol: str, changes: Dict, run_id: str) -> Optional[int]:
+        if not changes:
+            return None
+        record = {
+            "run_id": run_id,
+            "symbol": symbol,
+            "changedAt": datetime.utcnow().isoformat(),
+            "changes": changes,
+        }
+        line = json.dumps(record, default=str, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(line.encode())
+            self._file.flush()
+            return self._file.tell()
+
+    def read(self, cursor: int = 0, limit: int = 500) -> Tuple[List[Dict], int]:
+        records = []
+        if not os.path.exists(self.path):
+            return records, cursor
+        with open(self.path, "rb") as f:
+            f.seek(cursor)
+            while len(records) < limit:
+                line = f.readline()
+                # A partial trailing line is still being written; stop before it
+                if not line.endswith(b"\n"):
+                    break
+                cursor = f.tell()
+                record = json.loads(line)
+                record["cursor"] = cursor
+                records.append(record)
+        return records, cursor
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def open_outbox(path: str) -> ChangeOutbox:
+    """Open a JSONL outbox for *.jsonl paths, SQLite otherwise"""
+    if path.endswith(".jsonl"):
+        return JsonlOutbox(path)
+    return SQLiteOutbox(path)
+
+
+def read_changes(
+    path: str, cursor: int = 0, limit: int = 500
+) -> Tuple[List[Dict], int]:
+    """
+    Read change records after a cursor
+    Args:
+        path: Outbox file (.jsonl or SQLite)
+        cursor: Cursor returned by the previous read (0 for the start)
+        limit: Maximum records to return
+    Returns:
+        tuple: (records, next cursor)
+    Raises:
+        FileNotFoundError: If path does not exist (reading never creates it)
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No change outbox at {path}")
+    outbox = open_outbox(path)
+    try:
+        return outbox.read(cursor, limit)
+    finally:
+        outbox.close()
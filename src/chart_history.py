@@ -0,0 +1,374 @@
+"""
+Daily (or other timeframe) OHLCV bar history via TradingView chart sessions
+
+Bars are downloaded in bulk over pooled connections, each connection
+opening one chart session with a series per symbol, and stored in
+BarStore: one append-only binary file of fixed-size records per symbol.
+Loading memory-maps those files, so reading the whole universe's history
+copies nothing until the values are used.
+"""
+
+import json
+import os
+import ssl
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+from src.config import get_env
+from src.fetch_tradingview_financials import (
+    WEBSOCKET_HEADERS,
+    create_message,
+    new_session_id,
+    parse_tradingview_message,
+)
+from src.profiling import stage
+
+BAR_FIELDS = ("time", "open", "high", "low", "close", "volume")
+BAR_FILE_SUFFIX = ".bars"
+
+_TIMEFRAME_SECONDS = {"D": 86400, "W": 7 * 86400, "M": 31 * 86400}
+
+
+def _require_numpy():
+    """Import numpy lazily; it is only needed for bar history"""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "Bar history requires numpy. Install it with: pip3 install numpy"
+        ) from e
+    return numpy
+
+
+def bar_dtype():
+    """Record layout of one bar: int64 epoch seconds, float64 OHLCV"""
+    np = _require_numpy()
+    return np.dtype([("time", "<i8")] + [(name, "<f8") for name in BAR_FIELDS[1:]])
+
+
+def timeframe_seconds(timeframe: str) -> int:
+    """Length of one bar for TradingView resolutions like "1D", "1W" or "60" """
+    unit = timeframe[-1]
+    if unit in _TIMEFRAME_SECONDS:
+        count = int(timeframe[:-1] or 1)
+        return count * _TIMEFRAME_SECONDS[unit]
+    return int(timeframe) * 60
+
+
+def chart_session_messages(
+    session_id: str,
+    symbols: List[str],
+    timeframe: str = "1D",
+    bars: Union[int, Dict[str, int]] = 5000,
+) -> List[str]:
+    """
+    Handshake, symbol resolution and one series per symbol for a chart session
+    (bars is a count for every symbol or a per-symbol mapping)
+    """
+    messages = [
+        create_message('{"m":"set_auth_token","p":["unauthorized_user_token"]}'),
+        create_message(f'{{"m":"chart_create_session","p":["{session_id}",""]}}'),
+    ]
+    for index, symbol in enumerate(symbols):
+        resolve = json.dumps({"symbol": symbol, "adjustment": "splits"})
+        messages.append(
+            create_message(
+                json.dumps(
+                    {
+                        "m": "resolve_symbol",
+                        "p": [session_id, f"sds_sym_{index}", "=" + resolve],
+                    }
+                )
+            )
+        )
+        messages.append(
+            create_message(
+                json.dumps(
+                    {
+                        "m": "create_series",
+                        "p": [
+                            session_id,
+                            f"sds_{index}",
+                            "s1",
+                            f"sds_sym_{index}",
+                            timeframe,
+                            bars[symbol] if isinstance(bars, dict) else bars,
+                            "",
+                        ],
+                    }
+                )
+            )
+        )
+    return messages
+
+
+def fetch_bars_batch(
+    symbols: List[str],
+    bars: Union[int, Dict[str, int]] = 5000,
+    timeframe: str = "1D",
+    timeout: float = 60,
+    websocket_url: Optional[str] = None,
+    compression: bool = True,
+):
+    """
+    Fetch bar history for many symbols over one connection and chart session
+    Args:
+        symbols: TradingView symbols (e.g., ['CSELK:HAYL.N0000', ...])
+        bars: Number of most recent bars to request (or a per-symbol mapping)
+        timeframe: TradingView resolution ("1D", "1W", "60", ...)
+        timeout: Maximum time for the whole batch in seconds
+        websocket_url: Override TRADINGVIEW_WEBSOCKET_URL
+        compression: Offer permessage-deflate to the server
+    Returns:
+        dict: Symbol -> structured array of bars (oldest first), or None if
+            the symbol failed or no bars arrived
+    """
+    import websocket
+
+    from src.ws_transport import open_connection
+
+    np = _require_numpy()
+    dtype = bar_dtype()
+    websocket_url = websocket_url or get_env("TRADINGVIEW_WEBSOCKET_URL")
+    series_symbols = {f"sds_{index}": symbol for index, symbol in enumerate(symbols)}
+    rows: Dict[str, Dict[int, List[float]]] = {symbol: {} for symbol in symbols}
+    completed = set()
+    failed = set()
+
+    ws = open_connection(
+        websocket_url,
+        WEBSOCKET_HEADERS,
+        compression=compression,
+        sslopt={"cert_reqs": ssl.CERT_NONE},
+        timeout=0.2,
+        connect_timeout=min(timeout, 10.0),
+    )
+    try:
+        session_id = new_session_id("cs")
+        for message in chart_session_messages(session_id, symbols, timeframe, bars):
+            ws.send(message)
+
+        deadline = time.monotonic() + timeout
+        while len(completed) + len(failed) < len(symbols):
+            if time.monotonic() >= deadline:
+                break
+            try:
+                raw_message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except (websocket.WebSocketException, OSError) as e:
+                # A dropped connection keeps the bars that have arrived
+                print(
+                    f"Connection lost with {len(completed)}/{len(symbols)} "
+                    f"series completed: {e}"
+                )
+                break
+
+            with stage("parse"):
+                for segment in parse_tradingview_message(raw_message):
+                    if segment.startswith("~h~"):
+                        try:
+                            ws.send(create_message(segment))
+                        except (websocket.WebSocketException, OSError):
+                            pass  # Reported by the next recv()
+                        continue
+                    try:
+                        data = json.loads(segment)
+                    except ValueError:
+                        continue
+
+                    method = data.get("m")
+                    p_data = data.get("p", [])
+                    if method in ("timescale_update", "du") and len(p_data) >= 2:
+                        for series_id, series in p_data[1].items():
+                            symbol = series_symbols.get(series_id)
+                            if symbol is None or not isinstance(series, dict):
+                                continue
+                            for bar in series.get("s", []):
+                                values = bar.get("v", [])
+                                if len(values) >= 5:
+                                    # Volume is missing for some indices
+                                    values = (list(values) + [0.0])[:6]
+                                    rows[symbol][int(values[0])] = values
+                    elif method == "series_completed" and len(p_data) >= 2:
+                        if p_data[1] in series_symbols:
+                            completed.add(series_symbols[p_data[1]])
+                    elif (
+                        method in ("symbol_error", "series_error") and len(p_data) >= 2
+                    ):
+                        series_id = p_data[1].replace("sds_sym_", "sds_")
+                        if series_id in series_symbols:
+                            failed.add(series_symbols[series_id])
+    finally:
+        ws.close()
+
+    results = {}
+    for symbol in symbols:
+        if symbol in failed or not rows[symbol]:
+            results[symbol] = None
+            continue
+        results[symbol] = np.array(
+            [tuple(rows[symbol][key]) for key in sorted(rows[symbol])], dtype=dtype
+        )
+    return results
+
+
+class BarStore:
+    """
+    Per-symbol append-only bar files under one directory
+
+    Each file is a plain array of bar_dtype() records sorted by time, so it
+    can be memory-mapped as is. Appends write only bars newer than the last
+    stored one; a bar with the same time as the last one (e.g. today's bar
+    while the session is still open) replaces it in place.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.dtype = bar_dtype()
+
+    def path(self, symbol: str) -> str:
+        return os.path.join(self.directory, symbol.replace(":", "_") + BAR_FILE_SUFFIX)
+
+    def symbols(self) -> List[str]:
+        """Stored symbols (file names mapped back to TradingView symbols)"""
+        return sorted(
+            name[: -len(BAR_FILE_SUFFIX)].replace("_", ":", 1)
+            for name in os.listdir(self.directory)
+            if name.endswith(BAR_FILE_SUFFIX)
+        )
+
+    def last_time(self, symbol: str) -> Optional[int]:
+        """Time of the newest stored bar, read without mapping the whole file"""
+        path = self.path(symbol)
+        if not os.path.exists(path) or os.path.getsize(path) < self.dtype.itemsize:
+            return None
+        np = _require_numpy()
+        with open(path, "rb") as f:
+            f.seek(-self.dtype.itemsize, os.SEEK_END)
+            return int(
+                np.frombuffer(f.read(self.dtype.itemsize), self.dtype)["time"][0]
+            )
+
+    def append(self, symbol: str, bars) -> int:
+        """
+        Append bars newer than the stored history
+        Args:
+            symbol: TradingView symbol
+            bars: Structured array of bar_dtype() records, oldest first
+        Returns:
+            int: Number of new bars written
+        """
+        last = self.last_time(symbol)
+        path = self.path(symbol)
+        if last is None:
+            new_bars = bars
+            mode = "ab"
+        else:
+            new_bars = bars[bars["time"] > last]
+            mode = "r+b"
+
+        with open(path, mode) as f:
+            if last is not None:
+                same = bars[bars["time"] == last]
+                f.seek(0, os.SEEK_END)
+                if len(same):
+                    f.seek(-self.dtype.itemsize, os.SEEK_END)
+                    f.write(same[-1:].astype(self.dtype).tobytes())
+            f.write(new_bars.astype(self.dtype, copy=False).tobytes())
+        return len(new_bars)
+
+    def load(self, symbol: str):
+        """Memory-mapped bars of one symbol (read-only), or None if not stored"""
+        np = _require_numpy()
+        path = self.path(symbol)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        return np.memmap(path, dtype=self.dtype, mode="r")
+
+    def load_all(self) -> Dict:
+        """Memory-mapped bars of every stored symbol; no data is copied"""
+        return {
+            symbol: bars
+            for symbol in self.symbols()
+            if (bars := self.load(symbol)) is not None
+        }
+
+
+def bars_to_request(
+    store: BarStore,
+    symbol: str,
+    timeframe: str,
+    max_bars: int,
+    now: Optional[float] = None,
+) -> int:
+    """Bars needed to cover the gap since the last stored bar (plus a margin)"""
+    last = store.last_time(symbol)
+    if last is None:
+        return max_bars
+    elapsed = (now or time.time()) - last
+    return max(2, min(max_bars, int(elapsed // timeframe_seconds(timeframe)) + 2))
+
+
+def download_bar_history(
+    symbols: Iterable[str],
+    store_dir: str,
+    timeframe: str = "1D",
+    max_bars: int = 5000,
+    connections: int = 4,
+    symbols_per_connection: int = 50,
+    timeout: float = 120,
+    websocket_url: Optional[str] = None,
+) -> Dict:
+    """
+    Download or incrementally update bar history for many symbols
+    Args:
+        symbols: TradingView symbols
+        store_dir: BarStore directory
+        timeframe: TradingView resolution ("1D", "1W", "60", ...)
+        max_bars: Bars requested for a symbol with no stored history
+        connections: Concurrent connections
+        symbols_per_connection: Series per chart session
+        timeout: Maximum time per connection in seconds
+        websocket_url: Override TRADINGVIEW_WEBSOCKET_URL
+    Returns:
+        dict: Counts of "symbols", "updated", "failed" and "new_bars"
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    store = BarStore(store_dir)
+    symbols = list(symbols)
+    batches = [
+        symbols[index : index + symbols_per_connection]
+        for index in range(0, len(symbols), symbols_per_connection)
+    ]
+    summary = {"symbols": len(symbols), "updated": 0, "failed": 0, "new_bars": 0}
+
+    def run_batch(batch):
+        requested = {
+            symbol: bars_to_request(store, symbol, timeframe, max_bars)
+            for symbol in batch
+        }
+        return fetch_bars_batch(
+            batch, requested, timeframe, timeout, websocket_url=websocket_url
+        )
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = {executor.submit(run_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error downloading bars: {e}")
+                summary["failed"] += len(futures[future])
+                continue
+            for symbol, bars in results.items():
+                if bars is None:
+                    summary["failed"] += 1
+                    continue
+                with stage("write"):
+                    summary["new_bars"] += store.append(symbol, bars)
+                summary["updated"] += 1
+
+    return summary
@@ -0,0 +1,576 @@
+import argparse
+import sys
+from typing import Dict, List, Optional
+
+# Subcommand handlers import their subsystems lazily so that
+# `python -m src fetch ...` does not pay for pymongo, tqdm, etc.
+
+
+def _parse_pairs(pairs: Optional[List[str]]) -> Dict[str, str]:
+    """Parse repeated KEY=VALUE options"""
+    parsed = {}
+    for pair in pairs or []:
+        key, separator, value = pair.partition("=")
+        if not separator:
+            raise SystemExit(f"Expected KEY=VALUE, got {pair!r}")
+        parsed[key] = value
+    return parsed
+
+
+def _exchange_rates(pairs: Optional[List[str]]) -> Dict[str, float]:
+    """Parse repeated --exchange-rate EXCHANGE=SYMBOLS_PER_SECOND options"""
+    rates = {}
+    for exchange, value in _parse_pairs(pairs).items():
+        try:
+            rate = float(value)
+        except ValueError:
+            rate = 0.0
+        if not rate > 0:
+            raise SystemExit(
+                f"--exchange-rate {exchange}={value}: expected a positive "
+                "number of symbols per second"
+            )
+        rates[exchange] = rate
+    return rates
+
+
+def _universe_providers(universe: Optional[List[str]]):
+    """Providers for repeated --universe EXCHANGE=FILE options (None: default)"""
+    from src.universe import CSEUniverseProvider, StaticUniverseProvider
+
+    if not universe:
+        return None
+    providers = []
+    for exchange, path in _parse_pairs(universe).items():
+        if exchange == "CSELK" and path == "api":
+            providers.append(CSEUniverseProvider())
+            continue
+        with open(path) as f:
+            symbols = [line.strip() for line in f if line.strip()]
+        providers.append(StaticUniverseProvider(exchange, symbols))
+    return providers
+
+
+def _cmd_sync(args) -> int:
+    from src.financial_sync import (
+        FetchOptions,
+        ProfileOptions,
+        WriteOptions,
+        process_all_companies,
+    )
+    from src.process_sharding import default_process_count
+
+    providers = _universe_providers(args.universe)
+
+    process_all_companies(
+        max_companies=args.max_companies,
+        time_budget=args.time_budget,
+        providers=providers,
+        fetch_options=FetchOptions(
+            rate_limit=args.rate_limit,
+            retry_delay=args.retry_delay,
+            max_retries=args.max_retries,
+            timeout=args.fetch_timeout,
+            max_concurrency=args.max_concurrency,
+            settle_time=args.settle_time,
+            hedge=args.hedge,
+            hedge_max_extra=args.hedge_max_extra,
+            symbols_per_connection=args.symbols_per_connection,
+            exchange_rate_budgets=_exchange_rates(args.exchange_rate),
+            compression=not args.no_compression,
+            bandwidth_per_field=args.bandwidth_per_field,
+            processes=args.processes or default_process_count(),
+            latency_history=args.latency_history,
+            timeout_options={
+                "margin": args.timeout_margin,
+                "floor": args.timeout_floor,
+                "cap": args.timeout_cap,
+            },
+        ),
+        profile_options=ProfileOptions(
+            mode=args.profile,
+            rate=args.profile_rate,
+            output_dir=args.profile_dir,
+            allocations=args.profile_allocations,
+        ),
+        write_options=WriteOptions(
+            async_writer=args.async_writer,
+            async_options={
+                "pool_size": args.mongo_pool_size,
+                "compressors": args.mongo_compressors.split(","),
+                "write_concern": (
+                    int(args.write_concern)
+                    if args.write_concern.isdigit()
+                    else args.write_concern
+                ),
+            },
+            history_codec=args.history_codec,
+            change_feed=args.change_feed,
+            snapshot_dir=args.snapshot_dir,
+        ),
+    )
+    return 0
+
+
+def _cmd_fetch(args) -> int:
+    from src.fetch_tradingview_financials import (
+        fetch_financial_data,
+        print_financial_data,
+    )
+
+    from src.profiling import profile_run, stage
+
+    symbol = args.symbol if ":" in args.symbol else f"{args.exchange}:{args.symbol}"
+    with profile_run(
+        "fetch",
+        args.profile,
+        args.profile_rate,
+        args.profile_dir,
+        args.profile_allocations,
+    ):
+        with stage("fetch"):
+            data = fetch_financial_data(symbol, timeout=args.timeout)
+    print_financial_data(data)
+
+    if args.store:
+        from src.mongodb_handler import MongoDBHandler
+
+        db_handler = MongoDBHandler()
+        try:
+            if not db_handler.update_company_financials(symbol.split(":", 1)[1], data):
+                return 1
+        finally:
+            db_handler.close()
+    return 0
+
+
+def _cmd_export(args) -> int:
+    from src.mongodb_handler import MongoDBHandler
+    from src.snapshot_export import export_mongo_snapshot
+
+    db_handler = MongoDBHandler()
+    try:
+        export_mongo_snapshot(db_handler, args.output_dir, formats=args.formats)
+    finally:
+        db_handler.close()
+    return 0
+
+
+def _cmd_bars(args) -> int:
+    from src.chart_history import download_bar_history
+    from src.universe import CSEUniverseProvider, load_universe
+
+    entries = load_universe(
+        _universe_providers(args.universe) or [CSEUniverseProvider()]
+    )
+    if args.max_companies:
+        entries = entries[: args.max_companies]
+    summary = download_bar_history(
+        [entry["tradingview_symbol"] for entry in entries],
+        args.store_dir,
+        timeframe=args.timeframe,
+        max_bars=args.max_bars,
+        connections=args.connections,
+        symbols_per_connection=args.symbols_per_connection,
+    )
+    print(
+        f"Updated {summary['updated']}/{summary['symbols']} symbols "
+        f"({summary['new_bars']} new bars, {summary['failed']} failed)"
+    )
+    return 0 if summary["updated"] or not summary["symbols"] else 1
+
+
+def _cmd_screen(args) -> int:
+    import json
+    from src.mongodb_handler import MongoDBHandler
+
+    ranges = {}
+    for field, bounds in _parse_pairs(args.range).items():
+        low, _, high = bounds.partition(":")
+        ranges[field] = (float(low) if low else None, float(high) if high else None)
+
+    db_handler = MongoDBHandler()
+    try:
+        if args.rebuild:
+            db_handler.ensure_indexes()
+            print(
+                f"Rebuilt {db_handler.rebuild_snapshots()} snapshots", file=sys.stderr
+            )
+        for snapshot in db_handler.screen(ranges, args.sort, args.desc, args.limit):
+            print(json.dumps(snapshot, default=str))
+    finally:
+        db_handler.close()
+    return 0
+
+
+def _cmd_migrate_histories(args) -> int:
+    from src.mongodb_handler import MongoDBHandler, history_codec_setting
+
+    codec = history_codec_setting(args.codec)
+    db_handler = MongoDBHandler()
+    try:
+        stats = db_handler.migrate_history_encoding(codec, args.batch_size)
+    finally:
+        db_handler.close()
+    print(
+        f"Rewrote {stats['fields']} fields in {stats['updated']}/"
+        f"{stats['documents']} documents as {codec or 'plain arrays'}; "
+        f"tradingViewData {stats['bytes_before']} -> {stats['bytes_after']} bytes"
+    )
+    return 0
+
+
+def _cmd_changes(args) -> int:
+    import json
+    from src.change_feed import read_changes
+
+    try:
+        records, cursor = read_changes(args.path, args.cursor, args.limit)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for record in records:
+        print(json.dumps(record, default=str))
+    print(f"next cursor: {cursor}", file=sys.stderr)
+    return 0
+
+
+def _cmd_serve(args) -> int:
+    from src.fetch_service import serve
+
+    serve(
+        args.host,
+        args.port,
+        cache_size=args.cache_size,
+        ttl=args.ttl,
+        timeout=args.timeout,
+        max_connections=args.max_connections,
+    )
+    return 0
+
+
+def _cmd_bench(args) -> int:
+    from src import bench_history, benchmarks
+
+    if args.name == "import":
+        results = benchmarks.bench_import_time(budget_ms=args.budget_ms)
+    elif args.name == "scale":
+        results = benchmarks.bench_universe_scaling(total_symbols=args.symbols)
+    elif args.name == "soak":
+        results = benchmarks.bench_soak(fetches=args.fetches or 2000)
+    elif args.name == "cores":
+        results = benchmarks.bench_process_scaling(
+            total_symbols=args.symbols, process_counts=args.processes
+        )
+    elif args.name == "perf":
+        results = benchmarks.bench_fetch_write(fetches=args.fetches or 300)
+    benchmarks.print_bench_results(args.name, results)
+    passed = results["passed"]
+
+    if args.name in bench_history.TRACKED_METRICS:
+        metrics = {
+            key: value
+            for key, value in results.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+        revision = bench_history.git_revision()
+        report = bench_history.compare_to_baseline(
+            args.name,
+            metrics,
+            bench_history.load_runs(args.name, args.history),
+            revision,
+            window=args.baseline_window,
+            tolerance=args.tolerance,
+        )
+        print(bench_history.format_report(report))
+        passed = passed and report["passed"]
+        if args.record:
+            bench_history.record_run(args.name, metrics, args.history, revision)
+    return 0 if passed else 1
+
+
+def _add_profile_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--profile",
+        choices=["cprofile", "sample"],
+        default=None,
+        help="Write a per-stage profile report for this run",
+    )
+    parser.add_argument(
+        "--profile-rate",
+        type=float,
+        default=1.0,
+        help="Fraction of runs to profile (e.g. 0.1 for one in ten)",
+    )
+    parser.add_argument("--profile-dir", default="profiles")
+    parser.add_argument(
+        "--profile-allocations",
+        action="store_true",
+        default=None,
+        help="Also trace allocations in sample mode (always on with cprofile)",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m src", description="TradingView financial data extractor"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    sync = subparsers.add_parser("sync", help="Fetch all companies and update MongoDB")
+    sync.add_argument("--rate-limit", type=float, default=2.0)
+    sync.add_argument("--max-companies", type=int, default=None)
+    sync.add_argument("--retry-delay", type=float, default=10.0)
+    sync.add_argument(
+        "--fetch-timeout",
+        type=float,
+        default=15,
+        help="Timeout per fetch (the default for symbols without latency history)",
+    )
+    sync.add_argument(
+        "--latency-history",
+        default=None,
+        metavar="PATH",
+        help="JSON file of per-symbol latencies; timeouts and retry delays adapt to it",
+    )
+    sync.add_argument(
+        "--timeout-margin",
+        type=float,
+        default=1.5,
+        help="Adaptive timeout is the p99 completion time times this margin",
+    )
+    sync.add_argument("--timeout-floor", type=float, default=2.0)
+    sync.add_argument("--timeout-cap", type=float, default=60.0)
+    sync.add_argument("--max-retries", type=int, default=1)
+    sync.add_argument("--snapshot-dir", default=None)
+    sync.add_argument("--max-concurrency", type=int, default=8)
+    sync.add_argument(
+        "--settle-time",
+        type=float,
+        default=None,
+        help="Finish a fetch once no new data has arrived for this many seconds",
+    )
+    sync.add_argument(
+        "--hedge", action="store_true", help="Hedge fetches slower than the p95"
+    )
+    sync.add_argument(
+        "--hedge-max-extra",
+        type=float,
+        default=0.1,
+        help="Cap on hedged requests as a fraction of symbols",
+    )
+    sync.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Wall-clock budget in seconds; lower-priority symbols are deferred",
+    )
+    sync.add_argument(
+        "--universe",
+        action="append",
+        metavar="EXCHANGE=FILE",
+        help="Symbols file (one per line) for an exchange; CSELK=api for the CSE list",
+    )
+    sync.add_argument(
+        "--symbols-per-connection",
+        type=int,
+        default=1,
+        help="Subscribe this many symbols per connection and quote session",
+    )
+    sync.add_argument(
+        "--exchange-rate",
+        action="append",
+        metavar="EXCHANGE=SYMBOLS_PER_SECOND",
+        help="Rate budget for an exchange",
+    )
+    sync.add_argument(
+        "--change-feed",
+        default=None,
+        metavar="PATH",
+        help="Append per-symbol field deltas to this outbox (.jsonl or SQLite)",
+    )
+    sync.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Fetch in this many worker processes (0: one per core)",
+    )
+    sync.add_argument(
+        "--async-writer",
+        action="store_true",
+        help="Write to MongoDB with the async client while fetches continue",
+    )
+    sync.add_argument("--mongo-pool-size", type=int, default=32)
+    sync.add_argument(
+        "--mongo-compressors",
+        default="zstd,snappy,zlib",
+        help="Preferred MongoDB wire compressors (installed ones are used)",
+    )
+    sync.add_argument(
+        "--write-concern",
+        default="1",
+        help='Write concern "w" for the async writer (0, 1, majority)',
+    )
+    sync.add_argument(
+        "--no-compression",
+        action="store_true",
+        help="Do not offer permessage-deflate to the server",
+    )
+    sync.add_argument(
+        "--history-codec",
+        choices=["none", "float64", "float64-zlib", "delta", "delta-zlib"],
+        default=None,
+        help="Write numeric histories as packed binary (default: MONGODB_HISTORY_CODEC)",
+    )
+    sync.add_argument(
+        "--bandwidth-per-field",
+        action="store_true",
+        help="Also report decoded bytes per field in the run summary",
+    )
+    _add_profile_arguments(sync)
+    sync.set_defaults(handler=_cmd_sync)
+
+    fetch = subparsers.add_parser("fetch", help="Fetch and print a single symbol")
+    fetch.add_argument("symbol", help="e.g. AAF.N0000 or CSELK:AAF.N0000")
+    fetch.add_argument("--exchange", default="CSELK")
+    fetch.add_argument("--timeout", type=float, default=15)
+    fetch.add_argument("--store", action="store_true", help="Also write to MongoDB")
+    _add_profile_arguments(fetch)
+    fetch.set_defaults(handler=_cmd_fetch)
+
+    export = subparsers.add_parser(
+        "export", help="Export MongoDB state to Arrow/Parquet"
+    )
+    export.add_argument("--output-dir", default="snapshots")
+    export.add_argument(
+        "--formats",
+        nargs="+",
+        choices=["arrow", "parquet"],
+        default=["arrow", "parquet"],
+    )
+    export.set_defaults(handler=_cmd_export)
+
+    bars = subparsers.add_parser(
+        "bars", help="Download or update OHLCV bar history for the universe"
+    )
+    bars.add_argument("--store-dir", default="bars")
+    bars.add_argument("--timeframe", default="1D", help="e.g. 1D, 1W, 60")
+    bars.add_argument(
+        "--max-bars", type=int, default=5000, help="Bars for symbols not yet stored"
+    )
+    bars.add_argument("--connections", type=int, default=4)
+    bars.add_argument("--symbols-per-connection", type=int, default=50)
+    bars.add_argument("--max-companies", type=int, default=None)
+    bars.add_argument(
+        "--universe",
+        action="append",
+        metavar="EXCHANGE=FILE",
+        help="Symbols file (one per line) for an exchange; CSELK=api for the CSE list",
+    )
+    bars.set_defaults(handler=_cmd_bars)
+
+    screen = subparsers.add_parser(
+        "screen", help="Filter companies by ranges on the latest-value snapshots"
+    )
+    screen.add_argument(
+        "--range",
+        action="append",
+        metavar="FIELD=MIN:MAX",
+        help="e.g. priceEarningsRatio=0:10 or dividendYield=5: (repeatable)",
+    )
+    screen.add_argument("--sort", default=None)
+    screen.add_argument("--desc", action="store_true")
+    screen.add_argument("--limit", type=int, default=50)
+    screen.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Create indexes and rebuild all snapshots from the companies collection",
+    )
+    screen.set_defaults(handler=_cmd_screen)
+
+    migrate = subparsers.add_parser(
+        "migrate-histories",
+        help="Rewrite stored history arrays with a binary codec (or back to arrays)",
+    )
+    migrate.add_argument(
+        "codec",
+        choices=["none", "float64", "float64-zlib", "delta", "delta-zlib"],
+        help="none decodes packed histories back to plain arrays",
+    )
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.set_defaults(handler=_cmd_migrate_histories)
+
+    changes = subparsers.add_parser("changes", help="Read the change feed outbox")
+    changes.add_argument("path", help="Outbox file (.jsonl or SQLite)")
+    changes.add_argument("--cursor", type=int, default=0)
+    changes.add_argument("--limit", type=int, default=500)
+    changes.set_defaults(handler=_cmd_changes)
+
+    serve = subparsers.add_parser(
+        "serve", help="Run the local fetch service (cached, deduplicated fetches)"
+    )
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--ttl", type=float, default=300.0, help="Cache TTL in seconds")
+    serve.add_argument("--cache-size", type=int, default=4096)
+    serve.add_argument("--timeout", type=float, default=15)
+    serve.add_argument(
+        "--max-connections",
+        type=int,
+        default=8,
+        help="Upstream WebSocket connections open at once",
+    )
+    serve.set_defaults(handler=_cmd_serve)
+
+    bench = subparsers.add_parser("bench", help="Run a benchmark")
+    bench.add_argument("name", choices=["import", "scale", "cores", "soak", "perf"])
+    bench.add_argument("--budget-ms", type=float, default=50.0)
+    bench.add_argument("--symbols", type=int, default=10000)
+    bench.add_argument(
+        "--fetches",
+        type=int,
+        default=None,
+        help="Fetches for the soak (default 2000) and perf (default 300) benchmarks",
+    )
+    bench.add_argument(
+        "--processes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Worker process counts for the cores benchmark",
+    )
+    bench.add_argument(
+        "--history",
+        default="bench_results/history.jsonl",
+        help="Results store for tracked benchmarks (perf, soak)",
+    )
+    bench.add_argument(
+        "--no-record",
+        dest="record",
+        action="store_false",
+        help="Compare against the baseline without storing this run",
+    )
+    bench.add_argument(
+        "--baseline-window",
+        type=int,
+        default=10,
+        help="Earlier commits in the baseline",
+    )
+    bench.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed relative regression before a tracked metric fails",
+    )
+    bench.set_defaults(handler=_cmd_bench)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+import os
+from typing import Optional
+
+_config_loaded = False
+
+
+def load_config():
+    """Load environment variables from .env once per process"""
+    global _config_loaded
+    if _config_loaded:
+        return
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _config_loaded = True
+
+
+def get_env(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a configuration value, loading .env on first use"""
+    load_config()
+    return os.getenv(name, default)
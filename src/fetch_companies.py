@@ -1,11 +1,6 @@
-import os
-import requests
 from datetime import datetime
 from typing import List, Optional, TypedDict
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from src.config import get_env
 
 
 class TAllCompanyCodes(TypedDict):
@@ -16,13 +11,15 @@ class TAllCompanyCodes(TypedDict):
 
 def fetch_all_company_codes() -> Optional[List[TAllCompanyCodes]]:
     # Check API availability
-    api_url = os.getenv("CSE_ALL_COMPANY_CODES_API_URL")
+    api_url = get_env("CSE_ALL_COMPANY_CODES_API_URL")
     if not api_url:
         print(
             "Error: Please define the CSE_ALL_COMPANY_CODES_API_URL environment variable"
         )
         return None
 
+    import requests
+
     try:
         # Make GET request
         response = requests.get(api_url, headers={"Content-Type": "application/json"})
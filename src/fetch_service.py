@@ -0,0 +1,344 @@
+"""
+Local fetch service shared by tools that need TradingView data
+
+Wraps the fetchers behind a TTL cache and single-flight deduplication:
+concurrent requests for the same symbol share one upstream fetch, and
+batch requests put all their uncached symbols on one connection. Upstream
+load therefore scales with unique symbols rather than with callers.
+
+Connections are not pooled: each upstream batch opens its own WebSocket and
+quote session and closes it when the batch completes, with at most
+max_connections open at once. A quote session streams every later update
+for its symbols, so a kept-open session would have to be drained between
+requests; opening one per cache miss is cheaper at the request rates this
+service is meant for.
+
+Endpoints (JSON):
+    GET  /symbol/<tradingview symbol>
+    GET  /batch?symbols=CSELK:JKH.N0000,CSELK:HAYL.N0000
+    POST /batch  {"symbols": [...]}
+    GET  /metrics
+    GET  /health
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from src.financial_sync import has_financial_data
+from src.ttl_cache import TTLCache
+
+
+class SingleFlight:
+    """Tracks in-flight calls so that one caller fetches and the rest wait"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "Future"] = {}
+
+    def claim(self, key: Hashable) -> Tuple["Future", bool]:
+        """
+        Join the in-flight call for key, or become its leader
+        Returns:
+            (future, leader): the leader must call resolve() for key
+        """
+        from concurrent.futures import Future
+
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def resolve(self, key: Hashable, value=None, error: Optional[BaseException] = None):
+        """Finish the call for key and wake its waiters"""
+        with self._lock:
+            future = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class FetchService:
+    """
+    Cached, deduplicated access to TradingView financial data
+    Args:
+        cache_size: Maximum cached symbols
+        ttl: Seconds a fetched payload stays fresh
+        timeout: Upstream timeout per connection in seconds
+        settle_time: Passed to the fetchers (see QuoteStream)
+        max_connections: Upstream connections open at once
+        symbols_per_connection: Largest batch sent over one connection
+        websocket_url: Override TRADINGVIEW_WEBSOCKET_URL
+        wait_timeout: Longest a request waits for symbols that another
+            request is fetching, in seconds
+    """
+
+    def __init__(
+        self,
+        cache_size: int = 4096,
+        ttl: float = 300.0,
+        timeout: float = 15,
+        settle_time: Optional[float] = None,
+        max_connections: int = 8,
+        symbols_per_connection: int = 200,
+        websocket_url: Optional[str] = None,
+        wait_timeout: float = 120,
+    ):
+        from src.ws_transport import BandwidthStats
+
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.flights = SingleFlight()
+        self.timeout = timeout
+        self.settle_time = settle_time
+        self.symbols_per_connection = symbols_per_connection
+        self.websocket_url = websocket_url
+        self.wait_timeout = wait_timeout
+        self.bandwidth = BandwidthStats()
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.started_at = time.time()
+        self.requests = 0
+        self.deduplicated = 0
+        self.upstream_fetches = 0
+        self.upstream_symbols = 0
+        self.upstream_errors = 0
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        """Financial data for one symbol, or None if upstream had none"""
+        return self.get_many([symbol])[symbol]
+
+    def get_many(self, symbols: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Financial data for many symbols; uncached ones share one upstream batch
+        Args:
+            symbols: TradingView symbols
+        Returns:
+            dict: Symbol -> data, or None if upstream had none
+        """
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+
+        symbols = list(dict.fromkeys(symbols))
+        results = {}
+        waiting = {}
+        leading = {}
+        with self._lock:
+            self.requests += len(symbols)
+
+        for symbol in symbols:
+            cached = self.cache.get(symbol)
+            if cached is not None:
+                results[symbol] = cached
+                continue
+            future, leader = self.flights.claim(symbol)
+            if leader:
+                leading[symbol] = future
+            else:
+                waiting[symbol] = future
+        if waiting:
+            with self._lock:
+                self.deduplicated += len(waiting)
+
+        batch = list(leading)
+        try:
+            for start in range(0, len(batch), self.symbols_per_connection):
+                results.update(
+                    self._fetch_upstream(
+                        batch[start : start + self.symbols_per_connection]
+                    )
+                )
+        finally:
+            # If a batch raised, later batches never ran; their waiters must
+            # still be released (only this caller can resolve its flights)
+            for symbol, future in leading.items():
+                if not future.done():
+                    self.flights.resolve(symbol, None)
+
+        deadline = time.monotonic() + self.wait_timeout
+        for symbol, future in waiting.items():
+            try:
+                results[symbol] = future.result(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except FutureTimeoutError:
+                print(f"Timed out waiting for another request to fetch {symbol}")
+                results[symbol] = None
+            except Exception:
+                results[symbol] = None
+        return results
+
+    def _fetch_upstream(self, symbols: List[str]) -> Dict[str, Optional[Dict]]:
+        """Fetch symbols this caller leads, then resolve their flights"""
+        from src.fetch_tradingview_financials import fetch_financial_data_batch
+
+        fetched = {}
+        error = None
+        start = time.monotonic()
+        try:
+            with self._connections:
+                fetched = fetch_financial_data_batch(
+                    symbols,
+                    timeout=self.timeout,
+                    settle_time=self.settle_time,
+                    websocket_url=self.websocket_url,
+                    bandwidth=self.bandwidth,
+                )
+        except Exception as e:
+            print(f"Error fetching {len(symbols)} symbols upstream: {e}")
+            error = e
+
+        with self._lock:
+            self.upstream_fetches += 1
+            self.upstream_symbols += len(symbols)
+            self._latencies.append(time.monotonic() - start)
+            if error is not None:
+                self.upstream_errors += 1
+
+        results = {}
+        for symbol in symbols:
+            data = fetched.get(symbol)
+            if not has_financial_data(data):
+                data = None
+            else:
+                self.cache.set(symbol, data)
+            results[symbol] = data
+            # Waiters get None on errors too; the next request retries upstream
+            self.flights.resolve(symbol, data)
+        return results
+
+    def metrics(self) -> Dict:
+        """Request, cache and upstream counters"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "requests": self.requests,
+                "deduplicated": self.deduplicated,
+                "upstream_fetches": self.upstream_fetches,
+                "upstream_symbols": self.upstream_symbols,
+                "upstream_errors": self.upstream_errors,
+            }
+        if latencies:
+            metrics["upstream_latency_p50"] = round(latencies[len(latencies) // 2], 3)
+            metrics["upstream_latency_p95"] = round(
+                latencies[int(len(latencies) * 0.95)], 3
+            )
+        metrics["in_flight"] = len(self.flights)
+        metrics["cache"] = self.cache.stats()
+        metrics["wire_bytes"], metrics["decoded_bytes"] = self.bandwidth.totals()
+        return metrics
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    server: "FetchServiceServer"
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the console
+
+    def _send_json(self, status: int, body):
+        payload = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path.startswith("/symbol/"):
+            symbol = unquote(url.path[len("/symbol/") :])
+            data = service.get(symbol)
+            if data is None:
+                self._send_json(404, {"error": f"no data for {symbol}"})
+            else:
+                self._send_json(200, data)
+        elif url.path == "/batch":
+            symbols = [
+                symbol
+                for value in parse_qs(url.query).get("symbols", [])
+                for symbol in value.split(",")
+                if symbol
+            ]
+            self._send_json(200, service.get_many(symbols))
+        elif url.path == "/metrics":
+            self._send_json(200, service.metrics())
+        elif url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/batch":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            symbols = json.loads(self.rfile.read(length) or b"{}")["symbols"]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {"error": 'expected {"symbols": [...]}'})
+            return
+        self._send_json(200, self.server.service.get_many(symbols))
+
+
+class FetchServiceServer(ThreadingHTTPServer):
+    """HTTP front end of a FetchService (one thread per request)"""
+
+    daemon_threads = True
+
+    def __init__(
+        self, service: FetchService, host: str = "127.0.0.1", port: int = 8765
+    ):
+        super().__init__((host, port), _ServiceHandler)
+        self.service = service
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, **service_options):
+    """Run the fetch service until interrupted"""
+    server = FetchServiceServer(FetchService(**service_options), host, port)
+    print(f"Fetch service listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def fetch_from_service(
+    symbols: List[str], base_url: str = "http://127.0.0.1:8765", timeout: float = 60
+) -> Dict[str, Optional[Dict]]:
+    """
+    Client for tools: fetch symbols through a running service
+    Args:
+        symbols: TradingView symbols
+        base_url: Service address
+        timeout: HTTP timeout in seconds
+    Returns:
+        dict: Symbol -> data, or None if upstream had none
+    """
+    from urllib.request import Request, urlopen
+
+    request = Request(
+        f"{base_url}/batch",
+        data=json.dumps({"symbols": symbols}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
@@ -1,250 +1,532 @@
-import os
-import websocket
 import json
+import queue
 import ssl
-import _thread
 import time
 import re
 import random
 import string
 import threading
-from dotenv import load_dotenv
+from src.config import get_env
+from src.profiling import stage
+
+# Fields requested from TradingView, mapped to tradingViewData paths in
+# MongoDBHandler.build_update_doc
+EMPTY_FINANCIAL_DATA = {
+    # ======================
+    # COMPANY INFORMATION
+    # ======================
+    "business_description": None,  # tradingViewData.businessSummary
+    "web_site_url": None,  # tradingViewData.website
+    "symbol": None,
+    # ======================
+    # SHARES INFORMATION
+    # ======================
+    "total_shares_outstanding_fy": None,  # tradingViewData.numberOfShares
+    # ======================
+    # FINANCIAL YEAR INFORMATION
+    # ======================
+    "fiscal_period_fy_h": None,  # tradingViewData.financialYearHistoryYearly
+    "fiscal_period_fq_h": None,  # tradingViewData.financialYearHistoryQuarterly
+    "fiscal_period_end_fy_h": None,  # tradingViewData.financialYearEndHistoryYearly
+    "fiscal_period_end_fq_h": None,  # tradingViewData.financialYearEndHistoryQuarterly
+    # ======================
+    # BALANCE SHEET ITEMS
+    # ======================
+    # Assets
+    "total_assets_fy_h": None,  # tradingViewData.totalAssetsHistoryYearly
+    "total_assets_fq_h": None,  # tradingViewData.totalAssetsHistoryQuarterly
+    "total_current_assets_fy_h": None,  # tradingViewData.totalCurrentAssetsHistoryYearly
+    "total_current_assets_fq_h": None,  # tradingViewData.totalCurrentAssetsHistoryQuarterly
+    # Liabilities
+    "total_liabilities_fy_h": None,  # tradingViewData.totalLiabilitiesHistoryYearly
+    "total_liabilities_fq_h": None,  # tradingViewData.totalLiabilitiesHistoryQuarterly
+    "total_current_liabilities_fy_h": None,  # tradingViewData.totalCurrentLiabilitiesHistoryYearly
+    "total_current_liabilities_fq_h": None,  # tradingViewData.totalCurrentLiabilitiesHistoryQuarterly
+    # Equity
+    "total_equity_fy_h": None,  # tradingViewData.totalEquityHistoryYearly
+    "total_equity_fq_h": None,  # tradingViewData.totalEquityHistoryQuarterly
+    "shrhldrs_equity_fy_h": None,  # tradingViewData.shareHoldersEquityHistoryYearly
+    "shrhldrs_equity_fq_h": None,  # tradingViewData.shareHoldersEquityHistoryQuarterly
+    # Debt
+    "total_debt_fy_h": None,  # tradingViewData.totalDebtHistoryYearly
+    "total_debt_fq_h": None,  # tradingViewData.totalDebtHistoryQuarterly
+    "net_debt_fy_h": None,  # tradingViewData.netDebtHistoryYearly
+    "net_debt_fq_h": None,  # tradingViewData.netDebtHistoryQuarterly
+    # ======================
+    # INCOME STATEMENT ITEMS
+    # ======================
+    "total_revenue_fy_h": None,  # tradingViewData.totalRevenueHistoryYearly
+    "total_revenue_fq_h": None,  # tradingViewData.totalRevenueHistoryQuarterly
+    "net_income_starting_line_fy_h": None,  # tradingViewData.totalProfitBeforeTaxHistoryYearly
+    "net_income_starting_line_fq_h": None,  # tradingViewData.totalProfitBeforeTaxHistoryQuarterly
+    "net_income_fy_h": None,  # tradingViewData.netIncomeHistoryYearly
+    "net_income_fq_h": None,  # tradingViewData.netIncomeHistoryQuarterly
+    "income_tax_fy_h": None,  # tradingViewData.incomeTaxHistoryYearly
+    "income_tax_fq_h": None,  # tradingViewData.incomeTaxHistoryQuarterly
+    # ======================
+    # PROFITABILITY RATIOS
+    # ======================
+    "return_on_assets_fy_h": None,  # tradingViewData.returnOnAssetsHistoryYearly
+    "return_on_assets_fq_h": None,  # tradingViewData.returnOnAssetsHistoryQuarterly
+    "return_on_equity_fy_h": None,  # tradingViewData.returnOnEquityHistoryYearly
+    "return_on_equity_fq_h": None,  # tradingViewData.returnOnEquityHistoryQuarterly
+    "net_margin_fy_h": None,  # tradingViewData.netMarginHistoryYearly
+    "net_margin_fq_h": None,  # tradingViewData.netMarginHistoryQuarterly
+    # ======================
+    # LEVERAGE/SOLVENCY RATIOS
+    # ======================
+    "debt_to_asset_fy_h": None,  # tradingViewData.debtToAssetHistoryYearly
+    "debt_to_asset_fq_h": None,  # tradingViewData.debtToAssetHistoryQuarterly
+    "debt_to_equity_fy_h": None,  # tradingViewData.debtToEquityHistoryYearly
+    "debt_to_equity_fq_h": None,  # tradingViewData.debtToEquityHistoryQuarterly
+    # ======================
+    # LIQUIDITY RATIOS
+    # ======================
+    "current_ratio_fy_h": None,  # tradingViewData.currentRatioHistoryYearly
+    "current_ratio_fq_h": None,  # tradingViewData.currentRatioHistoryQuarterly
+    # ======================
+    # PER SHARE METRICS
+    # ======================
+    "book_value_per_share_fy_h": None,  # tradingViewData.netAssetsPerShareHistoryYearly
+    "book_value_per_share_fq_h": None,  # tradingViewData.netAssetsPerShareHistoryQuarterly
+    "earnings_per_share_diluted_fy_h": None,  # tradingViewData.earningsPerShareHistoryYearly
+    "earnings_per_share_diluted_fq_h": None,  # tradingViewData.earningsPerShareHistoryQuarterly
+    # ======================
+    # VALUATION RATIOS
+    # ======================
+    "price_earnings_fy_h": None,  # tradingViewData.priceEarningsRatioHistoryYearly
+    "price_earnings_fq_h": None,  # tradingViewData.priceEarningsRatioHistoryQuarterly
+    "price_book_fy_h": None,  # tradingViewData.priceToBookValueHistoryYearly
+    "price_book_fq_h": None,  # tradingViewData.priceToBookValueHistoryQuarterly
+    # ======================
+    # DIVIDEND INFORMATION
+    # ======================
+    "dividends_availability": None,  # tradingViewData.dividendsAvailability
+    "dividend_type_h": None,  # tradingViewData.dividendTypeHistory
+    "dividend_amount_h": None,  # tradingViewData.dividendPerShareHistory
+    "dividends_yield_fy_h": None,  # tradingViewData.dividendYieldHistoryYearly
+    "dividend_payment_date_h": None,  # tradingViewData.dividendPaymentDateHistory
+    "dividend_ex_date_h": None,  # tradingViewData.dividendXdDateHistory
+    "dps_common_stock_prim_issue_fy_h": None,  # tradingViewData.dividendPerShareHistoryYearly
+    "dps_common_stock_prim_issue_fq_h": None,  # tradingViewData.dividendPerShareHistoryQuarterly
+    "dividend_payout_ratio_fy_h": None,  # tradingViewData.dividendPayoutRatioHistoryYearly
+    "dividend_payout_ratio_fq_h": None,  # tradingViewData.dividendPayoutRatioHistoryQuarterly
+}
+
+WEBSOCKET_HEADERS = {
+    "Origin": "https://www.tradingview.com",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+}
+
+_MESSAGE_HEADER = re.compile(r"~m~(\d+)~m~")
+
+
+def create_message(content):
+    """Frame a message with TradingView's ~m~<length>~m~ prefix"""
+    return f"~m~{len(content)}~m~{content}"
+
+
+def parse_tradingview_message(raw_message):
+    """Split a raw WebSocket message into its ~m~ framed segments"""
+    segments = []
+    index = 0
+
+    while index < len(raw_message):
+        match = _MESSAGE_HEADER.match(raw_message, index)
+        if not match:
+            break
+
+        length = int(match.group(1))
+        start_pos = match.end()
+        end_pos = start_pos + length
+
+        if end_pos > len(raw_message):
+            break
+
+        segments.append(raw_message[start_pos:end_pos])
+        index = end_pos
+
+    return segments
+
+
+def new_session_id(prefix="qs"):
+    """Generate a unique quote/chart session ID"""
+    return f"{prefix}_{''.join(random.choices(string.ascii_letters + string.digits, k=12))}"
+
+
+def quote_session_messages(session_id, symbols):
+    """Handshake and subscription messages for one quote session"""
+    symbol_args = "".join(f',"{symbol}"' for symbol in symbols)
+    return [
+        create_message('{"m":"set_data_quality","p":["low"]}'),
+        create_message('{"m":"set_auth_token","p":["unauthorized_user_token"]}'),
+        create_message('{"m":"set_locale","p":["en","US"]}'),
+        create_message(f'{{"m":"quote_create_session","p":["{session_id}"]}}'),
+        create_message(
+            f'{{"m":"quote_add_symbols","p":["{session_id}"{symbol_args}]}}'
+        ),
+        create_message(
+            f'{{"m":"quote_fast_symbols","p":["{session_id}"{symbol_args}]}}'
+        ),
+    ]
+
+
+_DONE = object()
+
+
+class QuoteStream:
+    """
+    Incremental results of one quote session
+
+    The session runs on a background thread. Iterating (or async iterating)
+    the stream yields (symbol, field, value) as each qsd frame arrives, and
+    result is a Future resolving to {symbol: financial data, or None if no
+    data arrived} once every symbol has completed, the timeout has passed or
+    the stream is cancelled. A symbol completes on quote_completed, on an
+    error status, or after settle_time seconds without new data.
+    Args:
+        symbols (list): TradingView symbols (e.g., ['CSELK:HAYL.N0000', ...])
+        timeout (float): Maximum time for the whole session in seconds
+        settle_time (float): Completion grace period without quote_completed
+        cancel_event (threading.Event): Stops the session early when set
+        websocket_url (str): Override TRADINGVIEW_WEBSOCKET_URL
+        compression (bool): Offer permessage-deflate to the server
+        bandwidth (BandwidthStats): Records wire and decoded bytes for the
+            session and each symbol
+        keep_updates (bool): Queue updates for iteration; turn off when only
+            the result is needed
+        latency (LatencyHistory): Records each symbol's time to first data
+            and to completion (symbols without data are not recorded)
+    """
+
+    def __init__(
+        self,
+        symbols,
+        timeout=30,
+        settle_time=None,
+        cancel_event=None,
+        websocket_url=None,
+        compression=True,
+        bandwidth=None,
+        keep_updates=True,
+        latency=None,
+    ):
+        self.symbols = list(symbols)
+        self.timeout = timeout
+        self.settle_time = settle_time
+        self.cancel_event = cancel_event
+        self.websocket_url = websocket_url or get_env("TRADINGVIEW_WEBSOCKET_URL")
+        self.compression = compression
+        self.bandwidth = bandwidth
+        self.latency = latency
+        # Imported here to keep this module cheap to import for the CLI
+        from concurrent.futures import Future
+
+        self.result = Future()
+        self._updates = queue.Queue() if keep_updates else None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Open the connection and start receiving in the background"""
+        self._thread = threading.Thread(
+            target=self._run, name="quote-stream", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Cancel the session if still running and wait for its thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self if self._thread else self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        if self._updates is None:
+            raise RuntimeError("stream was created with keep_updates=False")
+        while True:
+            update = self._updates.get()
+            if update is _DONE:
+                return
+            yield update
+
+    async def __aiter__(self):
+        if self._updates is None:
+            raise RuntimeError("stream was created with keep_updates=False")
+        import asyncio
+
+        while True:
+            update = await asyncio.to_thread(self._updates.get)
+            if update is _DONE:
+                return
+            yield update
+
+    def _emit(self, symbol, field, value):
+        if self._updates is not None:
+            self._updates.put((symbol, field, value))
+
+    def _finish(self, results):
+        return results
+
+    def _run(self):
+        try:
+            self.result.set_result(self._finish(self._receive()))
+        except Exception as e:
+            self.result.set_exception(e)
+        finally:
+            if self._updates is not None:
+                self._updates.put(_DONE)
+
+    def _receive(self):
+        import websocket
+
+        from src.ws_transport import open_connection
+
+        bandwidth = self.bandwidth
+        results = {
+            symbol: dict(EMPTY_FINANCIAL_DATA, symbol=symbol) for symbol in self.symbols
+        }
+        first_data_at = {}
+        last_data_at = {}
+        # Symbol -> time its data was complete
+        completed = {}
+
+        # UTF-8 validation is skipped by the transport: websocket-client does
+        # it in pure Python, which dominates CPU on large frames, and str
+        # decoding already validates in C
+        ws = open_connection(
+            self.websocket_url,
+            WEBSOCKET_HEADERS,
+            compression=self.compression,
+            sslopt={"cert_reqs": ssl.CERT_NONE},
+            timeout=0.2,
+            connect_timeout=min(self.timeout, 10.0),
+        )
+        session_id = new_session_id()
+        seen_wire = 0
+        try:
+            for msg in quote_session_messages(session_id, self.symbols):
+                ws.send(msg)
+
+            subscribed_at = time.monotonic()
+            deadline = subscribed_at + self.timeout
+            while len(completed) < len(results) and not self._stop.is_set():
+                now = time.monotonic()
+                if now >= deadline or (
+                    self.cancel_event and self.cancel_event.is_set()
+                ):
+                    break
+                if self.settle_time is not None:
+                    for symbol, seen_at in last_data_at.items():
+                        if now - seen_at >= self.settle_time:
+                            completed.setdefault(symbol, seen_at)
+
+                try:
+                    raw_message = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    continue
+                except (websocket.WebSocketException, OSError) as e:
+                    # A dropped connection ends the fetch with what has arrived
+                    print(
+                        f"Connection lost with {len(last_data_at)}/{len(results)} "
+                        f"symbols received: {e}"
+                    )
+                    break
+                message_wire = ws.wire_bytes - seen_wire
+                seen_wire = ws.wire_bytes
+
+                with stage("parse"):
+                    for segment in parse_tradingview_message(raw_message):
+                        if segment.startswith("~h~"):
+                            # Heartbeats must be echoed or the server drops the connection
+                            try:
+                                ws.send(create_message(segment))
+                            except (websocket.WebSocketException, OSError):
+                                pass  # Reported by the next recv()
+                            continue
+                        try:
+                            data = json.loads(segment)
+                        except ValueError:
+                            continue
+
+                        method = data.get("m")
+                        p_data = data.get("p", [])
+                        if (
+                            method == "qsd"
+                            and len(p_data) >= 2
+                            and isinstance(p_data[1], dict)
+                        ):
+                            symbol_data = p_data[1]
+                            name = symbol_data.get("n")
+                            if name not in results:
+                                continue
+                            if bandwidth is not None:
+                                share = len(segment) / max(len(raw_message), 1)
+                                bandwidth.record_symbol(
+                                    name, message_wire * share, len(segment)
+                                )
+                            if symbol_data.get("s") == "ok":
+                                v_data = symbol_data.get("v", {})
+                                if bandwidth is not None:
+                                    bandwidth.record_fields(v_data)
+                                financial_data = results[name]
+                                for key, value in v_data.items():
+                                    if key in financial_data and key != "symbol":
+                                        financial_data[key] = value
+                                        self._emit(name, key, value)
+                                last_data_at[name] = time.monotonic()
+                                first_data_at.setdefault(name, last_data_at[name])
+                            else:
+                                completed.setdefault(name, time.monotonic())
+                        elif method == "quote_completed" and len(p_data) >= 2:
+                            completed.setdefault(p_data[1], time.monotonic())
+        finally:
+            ws.close()
+            if bandwidth is not None:
+                bandwidth.record_session(
+                    session_id, ws.wire_bytes, ws.decoded_bytes, ws.compression
+                )
+
+        if self.latency is not None:
+            # Symbols cut off before completing are recorded at the cut-off
+            # and flagged, so they do not count as completion times
+            ended_at = time.monotonic()
+            for symbol, first_at in first_data_at.items():
+                self.latency.record(
+                    symbol,
+                    first_at - subscribed_at,
+                    completed.get(symbol, ended_at) - subscribed_at,
+                    symbol in completed,
+                )
+
+        return {
+            symbol: (data if symbol in last_data_at else None)
+            for symbol, data in results.items()
+        }
+
+
+class FinancialDataStream(QuoteStream):
+    """
+    QuoteStream for one symbol: yields (field, value) and result resolves to
+    the financial data dictionary (fields still None if no data arrived)
+    """
+
+    def __init__(self, symbol, **kwargs):
+        super().__init__([symbol], **kwargs)
+        self.symbol = symbol
+
+    def _emit(self, symbol, field, value):
+        if self._updates is not None:
+            self._updates.put((field, value))
+
+    def _finish(self, results):
+        return results[self.symbol] or dict(EMPTY_FINANCIAL_DATA, symbol=self.symbol)
 
-# Load environment variables
-load_dotenv()
 
+def stream_financial_data(symbol, timeout=15, **kwargs):
+    """
+    Starts fetching a symbol and returns its updates as they arrive
+    Args:
+        symbol (str): TradingView symbol (e.g., 'CSELK:HAYL.N0000')
+        timeout (int): Maximum time to wait for data in seconds (default: 15)
+        kwargs: settle_time, cancel_event, websocket_url, compression,
+            bandwidth, latency (see QuoteStream)
+    Returns:
+        FinancialDataStream: Iterate for (field, value); .result for the dict
 
-def fetch_financial_data(symbol, timeout=15):
+    Example:
+        with stream_financial_data("CSELK:HAYL.N0000") as stream:
+            for field, value in stream:
+                ...
+            data = stream.result.result()
+    """
+    return FinancialDataStream(symbol, timeout=timeout, **kwargs).start()
+
+
+def fetch_financial_data(
+    symbol,
+    timeout=15,
+    cancel_event=None,
+    settle_time=None,
+    bandwidth=None,
+    compression=True,
+    websocket_url=None,
+    latency=None,
+):
     """
     Fetches financial data for a given TradingView symbol
     Args:
         symbol (str): TradingView symbol (e.g., 'CSELK:HAYL.N0000')
         timeout (int): Maximum time to wait for data in seconds (default: 15)
+        cancel_event (threading.Event): Stops the fetch early when set
+        settle_time (float): Finish once data has arrived and no new data
+            has followed for this many seconds, even without quote_completed
+        bandwidth (BandwidthStats): Records the bytes received for the symbol
+        compression (bool): Offer permessage-deflate to the server
+        websocket_url (str): Override TRADINGVIEW_WEBSOCKET_URL
+        latency (LatencyHistory): Records time to first data and to completion
     Returns:
         dict: Financial data dictionary
     """
-    websocket_url = os.getenv("TRADINGVIEW_WEBSOCKET_URL")
-
-    # Generate unique session ID
-    session_id = (
-        f"qs_{''.join(random.choices(string.ascii_letters + string.digits, k=12))}"
-    )
-
-    # Build messages with proper formatting
-    def create_message(content):
-        return f"~m~{len(content)}~m~{content}"
-
-    messages = [
-        create_message('{"m":"set_data_quality","p":["low"]}'),
-        create_message('{"m":"set_auth_token","p":["unauthorized_user_token"]}'),
-        create_message('{"m":"set_locale","p":["en","US"]}'),
-        create_message(f'{{"m":"quote_create_session","p":["{session_id}"]}}'),
-        create_message(f'{{"m":"quote_add_symbols","p":["{session_id}","{symbol}"]}}'),
-        create_message(f'{{"m":"quote_fast_symbols","p":["{session_id}","{symbol}"]}}'),
-    ]
-
-    # Data storage
-    financial_data = {
-        # ======================
-        # COMPANY INFORMATION
-        # ======================
-        "business_description": None,  # tradingViewData.businessSummary
-        "web_site_url": None,  # tradingViewData.website
-        "symbol": symbol,
-        # ======================
-        # SHARES INFORMATION
-        # ======================
-        "total_shares_outstanding_fy": None,  # tradingViewData.numberOfShares
-        # ======================
-        # FINANCIAL YEAR INFORMATION
-        # ======================
-        "fiscal_period_fy_h": None,  # tradingViewData.financialYearHistoryYearly
-        "fiscal_period_fq_h": None,  # tradingViewData.financialYearHistoryQuarterly
-        "fiscal_period_end_fy_h": None,  # tradingViewData.financialYearEndHistoryYearly
-        "fiscal_period_end_fq_h": None,  # tradingViewData.financialYearEndHistoryQuarterly
-        # ======================
-        # BALANCE SHEET ITEMS
-        # ======================
-        # Assets
-        "total_assets_fy_h": None,  # tradingViewData.totalAssetsHistoryYearly
-        "total_assets_fq_h": None,  # tradingViewData.totalAssetsHistoryQuarterly
-        "total_current_assets_fy_h": None,  # tradingViewData.totalCurrentAssetsHistoryYearly
-        "total_current_assets_fq_h": None,  # tradingViewData.totalCurrentAssetsHistoryQuarterly
-        # Liabilities
-        "total_liabilities_fy_h": None,  # tradingViewData.totalLiabilitiesHistoryYearly
-        "total_liabilities_fq_h": None,  # tradingViewData.totalLiabilitiesHistoryQuarterly
-        "total_current_liabilities_fy_h": None,  # tradingViewData.totalCurrentLiabilitiesHistoryYearly
-        "total_current_liabilities_fq_h": None,  # tradingViewData.totalCurrentLiabilitiesHistoryQuarterly
-        # Equity
-        "total_equity_fy_h": None,  # tradingViewData.totalEquityHistoryYearly
-        "total_equity_fq_h": None,  # tradingViewData.totalEquityHistoryQuarterly
-        "shrhldrs_equity_fy_h": None,  # tradingViewData.shareHoldersEquityHistoryYearly
-        "shrhldrs_equity_fq_h": None,  # tradingViewData.shareHoldersEquityHistoryQuarterly
-        # Debt
-        "total_debt_fy_h": None,  # tradingViewData.totalDebtHistoryYearly
-        "total_debt_fq_h": None,  # tradingViewData.totalDebtHistoryQuarterly
-        "net_debt_fy_h": None,  # tradingViewData.netDebtHistoryYearly
-        "net_debt_fq_h": None,  # tradingViewData.netDebtHistoryQuarterly
-        # ======================
-        # INCOME STATEMENT ITEMS
-        # ======================
-        "total_revenue_fy_h": None,  # tradingViewData.totalRevenueHistoryYearly
-        "total_revenue_fq_h": None,  # tradingViewData.totalRevenueHistoryQuarterly
-        "net_income_starting_line_fy_h": None,  # tradingViewData.totalProfitBeforeTaxHistoryYearly
-        "net_income_starting_line_fq_h": None,  # tradingViewData.totalProfitBeforeTaxHistoryQuarterly
-        "net_income_fy_h": None,  # tradingViewData.netIncomeHistoryYearly
-        "net_income_fq_h": None,  # tradingViewData.netIncomeHistoryQuarterly
-        "income_tax_fy_h": None,  # tradingViewData.incomeTaxHistoryYearly
-        "income_tax_fq_h": None,  # tradingViewData.incomeTaxHistoryQuarterly
-        # ======================
-        # PROFITABILITY RATIOS
-        # ======================
-        "return_on_assets_fy_h": None,  # tradingViewData.returnOnAssetsHistoryYearly
-        "return_on_assets_fq_h": None,  # tradingViewData.returnOnAssetsHistoryQuarterly
-        "return_on_equity_fy_h": None,  # tradingViewData.returnOnEquityHistoryYearly
-        "return_on_equity_fq_h": None,  # tradingViewData.returnOnEquityHistoryQuarterly
-        "net_margin_fy_h": None,  # tradingViewData.netMarginHistoryYearly
-        "net_margin_fq_h": None,  # tradingViewData.netMarginHistoryQuarterly
-        # ======================
-        # LEVERAGE/SOLVENCY RATIOS
-        # ======================
-        "debt_to_asset_fy_h": None,  # tradingViewData.debtToAssetHistoryYearly
-        "debt_to_asset_fq_h": None,  # tradingViewData.debtToAssetHistoryQuarterly
-        "debt_to_equity_fy_h": None,  # tradingViewData.debtToEquityHistoryYearly
-        "debt_to_equity_fq_h": None,  # tradingViewData.debtToEquityHistoryQuarterly
-        # ======================
-        # LIQUIDITY RATIOS
-        # ======================
-        "current_ratio_fy_h": None,  # tradingViewData.currentRatioHistoryYearly
-        "current_ratio_fq_h": None,  # tradingViewData.currentRatioHistoryQuarterly
-        # ======================
-        # PER SHARE METRICS
-        # ======================
-        "book_value_per_share_fy_h": None,  # tradingViewData.netAssetsPerShareHistoryYearly
-        "book_value_per_share_fq_h": None,  # tradingViewData.netAssetsPerShareHistoryQuarterly
-        "earnings_per_share_diluted_fy_h": None,  # tradingViewData.earningsPerShareHistoryYearly
-        "earnings_per_share_diluted_fq_h": None,  # tradingViewData.earningsPerShareHistoryQuarterly
-        # ======================
-        # VALUATION RATIOS
-        # ======================
-        "price_earnings_fy_h": None,  # tradingViewData.priceEarningsRatioHistoryYearly
-        "price_earnings_fq_h": None,  # tradingViewData.priceEarningsRatioHistoryQuarterly
-        "price_book_fy_h": None,  # tradingViewData.priceToBookValueHistoryYearly
-        "price_book_fq_h": None,  # tradingViewData.priceToBookValueHistoryQuarterly
-        # ======================
-        # DIVIDEND INFORMATION
-        # ======================
-        "dividends_availability": None,  # tradingViewData.dividendsAvailability
-        "dividend_type_h": None,  # tradingViewData.dividendTypeHistory
-        "dividend_amount_h": None,  # tradingViewData.dividendPerShareHistory
-        "dividends_yield_fy_h": None,  # tradingViewData.dividendYieldHistoryYearly
-        "dividend_payment_date_h": None,  # tradingViewData.dividendPaymentDateHistory
-        "dividend_ex_date_h": None,  # tradingViewData.dividendXdDateHistory
-        "dps_common_stock_prim_issue_fy_h": None,  # tradingViewData.dividendPerShareHistoryYearly
-        "dps_common_stock_prim_issue_fq_h": None,  # tradingViewData.dividendPerShareHistoryQuarterly
-        "dividend_payout_ratio_fy_h": None,  # tradingViewData.dividendPayoutRatioHistoryYearly
-        "dividend_payout_ratio_fq_h": None,  # tradingViewData.dividendPayoutRatioHistoryQuarterly
-    }
-    # Event to signal when we're done
-    done_event = threading.Event()
-
-    def parse_tradingview_message(raw_message):
-        segments = []
-        pattern = re.compile(r"~m~(\d+)~m~")
-        index = 0
-
-        while index < len(raw_message):
-            match = pattern.match(raw_message[index:])
-            if not match:
-                break
-
-            length_str = match.group(1)
-            try:
-                length = int(length_str)
-            except ValueError:
-                break
-
-            header_length = len(f"~m~{length_str}~m~")
-            start_pos = index + header_length
-            end_pos = start_pos + length
-
-            if end_pos > len(raw_message):
-                break
-
-            content = raw_message[start_pos:end_pos]
-            segments.append(content)
-            index = end_pos
-
-        return segments
-
-    def on_message(ws, message):
-        if message.startswith("~h~"):
-            return
-
-        segments = parse_tradingview_message(message)
-
-        for segment in segments:
-            try:
-                data = json.loads(segment)
-                if data.get("m") == "qsd":
-                    p_data = data.get("p", [])
-                    if len(p_data) >= 2 and isinstance(p_data[1], dict):
-                        symbol_data = p_data[1]
-                        if symbol_data.get("s") == "ok":
-                            v_data = symbol_data.get("v", {})
-                            for key in financial_data.keys():
-                                if key in v_data:
-                                    financial_data[key] = v_data[key]
-            except:
-                continue
-
-    def on_error(ws, error):
-        done_event.set()
-
-    def on_close(ws, close_status_code, close_msg):
-        done_event.set()
-
-    def on_open(ws):
-        def run(*args):
-            for msg in messages:
-                ws.send(msg)
-                time.sleep(0.5)
-
-        _thread.start_new_thread(run, ())
-
-    # Create WebSocket connection
-    ws = websocket.WebSocketApp(
-        websocket_url,
-        on_open=on_open,
-        on_message=on_message,
-        on_error=on_error,
-        on_close=on_close,
-        header={
-            "Origin": "https://www.tradingview.com",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        },
-    )
-
-    # Start WebSocket in a separate thread
-    ws_thread = threading.Thread(
-        target=ws.run_forever,
-        kwargs={
-            "sslopt": {"cert_reqs": ssl.CERT_NONE},
-            "ping_interval": 20,
-            "ping_timeout": 10,
-        },
-        daemon=True,
-    )
-    ws_thread.start()
-
-    # Wait for completion or timeout
-    done_event.wait(timeout=timeout)
-
-    # Close connection if still open
-    if ws.sock and ws.sock.connected:
-        ws.close()
-
-    return financial_data
+    with FinancialDataStream(
+        symbol,
+        timeout=timeout,
+        cancel_event=cancel_event,
+        settle_time=settle_time,
+        bandwidth=bandwidth,
+        compression=compression,
+        websocket_url=websocket_url,
+        keep_updates=False,
+        latency=latency,
+    ) as stream:
+        return stream.result.result()
+
+
+def fetch_financial_data_batch(
+    symbols,
+    timeout=30,
+    settle_time=None,
+    cancel_event=None,
+    websocket_url=None,
+    compression=True,
+    bandwidth=None,
+    latency=None,
+):
+    """
+    Fetches financial data for many symbols over one connection and quote session
+    Args:
+        symbols (list): TradingView symbols (e.g., ['CSELK:HAYL.N0000', ...])
+        timeout (int): Maximum time to wait for the whole batch in seconds
+        settle_time (float): Treat a symbol as complete once no new data has
+            followed for this many seconds, even without quote_completed
+        cancel_event (threading.Event): Stops the fetch early when set
+        websocket_url (str): Override TRADINGVIEW_WEBSOCKET_URL
+        compression (bool): Offer permessage-deflate to the server
+        bandwidth (BandwidthStats): Records wire and decoded bytes for the
+            session and each symbol
+        latency (LatencyHistory): Records each symbol's time to first data
+            and to completion
+    Returns:
+        dict: Symbol -> financial data dictionary, or None if no data arrived
+    """
+    with QuoteStream(
+        symbols,
+        timeout=timeout,
+        settle_time=settle_time,
+        cancel_event=cancel_event,
+        websocket_url=websocket_url,
+        compression=compression,
+        bandwidth=bandwidth,
+        keep_updates=False,
+        latency=latency,
+    ) as stream:
+        return stream.result.result()
 
 
 def print_financial_data(data):
@@ -1,24 +1,708 @@
+import queue
+import statistics
+import threading
 import time
-from typing import List, Optional
-from tqdm import tqdm
-from src.fetch_companies import fetch_all_company_codes
-from src.mongodb_handler import MongoDBHandler
-from src.fetch_tradingview_financials import fetch_financial_data
+from collections import deque
+from functools import partial
+from typing import Callable, Dict, List, Optional
+from src.profiling import finish_profiler, maybe_start_profiler, stage
+from src.resources import format_usage, resource_usage
+from src.universe import (
+    CSEUniverseProvider,
+    ExchangeRateBudgets,
+    UniverseProvider,
+    load_universe,
+    shard_symbols,
+)
+from src.scheduler import (
+    Deadline,
+    DeadlineExceeded,
+    PriorityWeights,
+    deferred_report,
+    plan_concurrency,
+    priority_scores,
+)
 
 
-def process_all_companies(
-    rate_limit: float = 5.0,  # Increased from 1.0 to 5.0
-    max_companies: Optional[int] = None,
+class AdaptiveConcurrencyController:
+    """
+    AIMD limit on in-flight fetches
+
+    The limit grows by about one slot per round of successful fetches and is
+    multiplied by decrease_factor when a fetch fails or when recent latency
+    exceeds latency_tolerance times the best latency seen so far. Decreases
+    happen at most once per window of completions so a burst of failures
+    from one slowdown does not collapse the limit to the floor.
+    """
+
+    # Slow start: limit before any fetch has completed
+    DEFAULT_INITIAL_LIMIT = 2.0
+
+    def __init__(
+        self,
+        initial_limit: float = DEFAULT_INITIAL_LIMIT,
+        min_limit: float = 1.0,
+        max_limit: float = 8.0,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window: int = 10,
+        min_interval: float = 0.0,
+    ):
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.min_interval = min_interval
+
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._baseline_latency: Optional[float] = None
+        self._completions_since_decrease = window
+        self._window = window
+        self._next_start = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Block until a fetch slot is free and min_interval has passed"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            delay = self._next_start - time.monotonic()
+            self._next_start = (
+                max(self._next_start, time.monotonic()) + self.min_interval
+            )
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, latency: float, success: bool):
+        """Record the outcome of a fetch and adjust the limit"""
+        with self._cond:
+            self.in_flight -= 1
+            self._outcomes.append(success)
+            self._completions_since_decrease += 1
+            if success:
+                self._latencies.append(latency)
+
+            if not success or self._latency_degraded():
+                if self._completions_since_decrease >= self._window:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._completions_since_decrease = 0
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def abandon(self):
+        """Give back a slot that was acquired but never used for a fetch"""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def _latency_degraded(self) -> bool:
+        if len(self._latencies) < self._latencies.maxlen:
+            return False
+        median = statistics.median(self._latencies)
+        if self._baseline_latency is None or median < self._baseline_latency:
+            self._baseline_latency = median
+        return median > self._baseline_latency * self.latency_tolerance
+
+    def stats(self) -> Dict:
+        """Current limit and recent error rate for reporting"""
+        with self._cond:
+            errors = self._outcomes.count(False)
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "error_rate": (
+                    round(errors / len(self._outcomes), 2) if self._outcomes else 0.0
+                ),
+            }
+
+
+class CircuitBreaker:
+    """
+    Pauses all fetches after too many consecutive failures
+
+    Once failure_threshold consecutive failures are seen the breaker opens
+    and every caller waits out cooldown seconds. A single probe fetch is then
+    let through; its success closes the breaker, its failure reopens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._cond = threading.Condition()
+
+    # Longest single wait, so waiting callers notice a used-up deadline
+    POLL_INTERVAL = 1.0
+
+    def wait_until_allowed(self, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Block while the breaker is open or a half-open probe is running
+        Args:
+            deadline: Run budget; waiting stops once it is used up
+        Returns:
+            bool: True if the caller holds the half-open probe, which it must
+                finish with record_success(), record_failure() or abandon_probe()
+        Raises:
+            DeadlineExceeded: If the budget ran out while waiting
+        """
+        with self._cond:
+            while True:
+                if deadline and not deadline.allows_start():
+                    raise DeadlineExceeded("circuit breaker wait")
+                if self.state == self.CLOSED:
+                    return False
+                if self.state == self.OPEN:
+                    remaining = self._opened_at + self.cooldown - time.monotonic()
+                    if remaining > 0:
+                        self._cond.wait(min(remaining, self.POLL_INTERVAL))
+                        continue
+                    self.state = self.HALF_OPEN
+                if not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return True
+                self._cond.wait(self.POLL_INTERVAL)
+
+    def abandon_probe(self):
+        """Give up a half-open probe that was never sent, letting another caller probe"""
+        with self._cond:
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+    def record_success(self):
+        with self._cond:
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+    def record_failure(self):
+        with self._cond:
+            self.consecutive_failures += 1
+            reopen = self.state == self.HALF_OPEN
+            if reopen or (
+                self.state == self.CLOSED
+                and self.consecutive_failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self.trips += 1
+                print(
+                    f"\nCircuit breaker open after {self.consecutive_failures} "
+                    f"consecutive failures, pausing fetches for {self.cooldown}s"
+                )
+            self._probe_in_flight = False
+            self._cond.notify_all()
+
+
+class HedgedFetcher:
+    """
+    Wraps a fetch function with hedged requests
+
+    If a symbol has not completed by the p95 of recently observed fetch
+    latencies, a duplicate fetch is started on its own socket and session.
+    Whichever returns data first wins and the other is cancelled. Hedges are
+    capped at max_extra_ratio of primary fetches, and none are sent until
+    min_samples latencies have been observed.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[..., Optional[Dict]],
+        max_extra_ratio: float = 0.1,
+        min_samples: int = 20,
+        min_hedge_delay: float = 0.5,
+        history: int = 200,
+    ):
+        self.fetch = fetch
+        self.max_extra_ratio = max_extra_ratio
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self._latencies = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self.primaries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 of recent latencies, or None while there are too few samples"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            p95 = statistics.quantiles(self._latencies, n=20)[-1]
+        return max(p95, self.min_hedge_delay)
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.max_extra_ratio * self.primaries:
+                return False
+            self.hedges += 1
+            return True
+
+    def _start(self, name: str, symbol: str, results: queue.Queue, **kwargs):
+        cancel_event = threading.Event()
+
+        def run():
+            try:
+                results.put(
+                    (name, self.fetch(symbol, cancel_event=cancel_event, **kwargs))
+                )
+            except Exception as e:
+                print(f"\nError fetching {symbol} ({name}): {e}")
+                results.put((name, None))
+
+        threading.Thread(target=run, name=f"{name}-{symbol}", daemon=True).start()
+        return cancel_event
+
+    def __call__(self, symbol: str, **kwargs) -> Optional[Dict]:
+        with self._lock:
+            self.primaries += 1
+
+        start = time.monotonic()
+        results: queue.Queue = queue.Queue()
+        cancels = {"primary": self._start("primary", symbol, results, **kwargs)}
+
+        delay = self.hedge_delay()
+        pending = 1
+        tv_data = None
+        while pending:
+            try:
+                timeout = (
+                    delay if delay is not None and "hedge" not in cancels else None
+                )
+                name, tv_data = results.get(timeout=timeout)
+            except queue.Empty:
+                if self._hedge_allowed():
+                    cancels["hedge"] = self._start("hedge", symbol, results, **kwargs)
+                    pending += 1
+                else:
+                    delay = None
+                continue
+
+            pending -= 1
+            if has_financial_data(tv_data):
+                if name == "hedge":
+                    with self._lock:
+                        self.hedge_wins += 1
+                with self._lock:
+                    self._latencies.append(time.monotonic() - start)
+                break
+
+        # Cancel whichever fetch lost the race (or is still running)
+        for cancel_event in cancels.values():
+            cancel_event.set()
+        return tv_data
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "primaries": self.primaries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+def has_financial_data(tv_data: Optional[Dict]) -> bool:
+    """True when a fetch returned at least one field besides the symbol"""
+    if not tv_data:
+        return False
+    return any(value is not None for key, value in tv_data.items() if key != "symbol")
+
+
+def batch_has_data(results: Optional[Dict[str, Optional[Dict]]]) -> bool:
+    """True when a batch fetch returned data for at least one symbol"""
+    return bool(results) and any(
+        has_financial_data(tv_data) for tv_data in results.values()
+    )
+
+
+def fetch_with_controls(
+    fetch: Callable,
+    target,
+    controller: AdaptiveConcurrencyController,
+    breaker: CircuitBreaker,
+    retry_delay: float = 10.0,
+    max_retries: int = 3,
+    deadline: Optional[Deadline] = None,
+    before_attempt: Optional[Callable[[], None]] = None,
+    is_success: Callable = has_financial_data,
+    attempt_timeout: Optional[Callable] = None,
+):
+    """
+    Fetch one symbol or batch under the concurrency controller and circuit breaker
+    Args:
+        fetch: Function taking target and returning its data
+        target: TradingView symbol (e.g., 'CSELK:HAYL.N0000') or batch of symbols
+        controller: Shared in-flight limit
+        breaker: Shared circuit breaker
+        retry_delay: Base delay between retries in seconds
+        max_retries: Maximum fetch attempts
+        deadline: Run budget; no attempt starts once it is used up
+        before_attempt: Called before each attempt (e.g. to spend a rate budget)
+        is_success: Decides whether a fetch result counts as a success
+        attempt_timeout: Called with (target, attempt) for the attempt's
+            timeout, which is passed to fetch as timeout= and also caps
+            retry_delay (see AdaptiveTimeouts)
+    Returns:
+        The fetch result, or None if every attempt failed
+    Raises:
+        DeadlineExceeded: If the budget ran out before an attempt could start
+    """
+    for attempt in range(max_retries):
+        if deadline and not deadline.allows_start():
+            raise DeadlineExceeded(str(target))
+        if before_attempt:
+            before_attempt()
+        try:
+            probe = breaker.wait_until_allowed(deadline)
+        except DeadlineExceeded:
+            raise DeadlineExceeded(str(target)) from None
+        controller.acquire()
+        if deadline and not deadline.allows_start():
+            controller.abandon()
+            if probe:
+                breaker.abandon_probe()
+            raise DeadlineExceeded(str(target))
+        start = time.monotonic()
+        tv_data = None
+        timeout = attempt_timeout(target, attempt) if attempt_timeout else None
+        try:
+            with stage("fetch"):
+                tv_data = (
+                    fetch(target) if timeout is None else fetch(target, timeout=timeout)
+                )
+        except Exception as e:
+            print(f"\nError fetching {target}: {e}")
+
+        success = is_success(tv_data)
+        controller.release(time.monotonic() - start, success)
+        if success:
+            breaker.record_success()
+            return tv_data
+
+        breaker.record_failure()
+        if attempt < max_retries - 1:
+            # A symbol that normally answers quickly is retried as quickly
+            delay = retry_delay if timeout is None else min(retry_delay, timeout)
+            time.sleep(delay * (attempt + 1))  # Exponential backoff
+
+    return None
+
+
+def fetch_batch_with_controls(
+    fetch: Callable,
+    symbols: List[str],
+    controller: AdaptiveConcurrencyController,
+    breaker: CircuitBreaker,
     retry_delay: float = 10.0,
     max_retries: int = 3,
+    deadline: Optional[Deadline] = None,
+    before_attempt: Optional[Callable[[int], None]] = None,
+    attempt_timeout: Optional[Callable] = None,
+) -> Optional[Dict[str, Optional[Dict]]]:
+    """
+    Fetch a batch with fetch_with_controls, re-fetching symbols that came back empty
+
+    A batch attempt counts as a success once any symbol has data, so symbols
+    left empty by a good batch (cut off by the timeout, or dropped with the
+    connection) are fetched again together in follow-up rounds, one attempt
+    each, until max_retries rounds are used or a round brings no new data.
+    Args:
+        fetch: Function taking a list of symbols and returning symbol -> data
+        symbols: TradingView symbols of the batch
+        before_attempt: Called with the number of symbols before each attempt
+            (e.g. to spend a rate budget)
+        attempt_timeout: Called with (symbols, attempt) for the attempt's
+            timeout; follow-up rounds continue the attempt count
+        (other arguments as for fetch_with_controls)
+    Returns:
+        dict: Symbol -> data (None for symbols still without data), or None
+            if every attempt of the first round failed
+    Raises:
+        DeadlineExceeded: If the budget ran out before the first attempt
+    """
+    results = None
+    pending = list(symbols)
+    for round_number in range(max_retries):
+        first_round = round_number == 0
+        try:
+            fetched = fetch_with_controls(
+                fetch,
+                pending,
+                controller,
+                breaker,
+                retry_delay,
+                max_retries if first_round else 1,
+                deadline,
+                before_attempt and partial(before_attempt, len(pending)),
+                batch_has_data,
+                attempt_timeout
+                and partial(_later_attempt, attempt_timeout, round_number),
+            )
+        except DeadlineExceeded:
+            if first_round:
+                raise
+            break
+        if not fetched:
+            break
+        results = dict(results or {})
+        results.update(fetched)
+        pending = [
+            symbol for symbol in pending if not has_financial_data(results.get(symbol))
+        ]
+        if not pending:
+            break
+    return results
+
+
+def _later_attempt(attempt_timeout: Callable, offset: int, target, attempt: int):
+    return attempt_timeout(target, attempt + offset)
+
+
+async def _write_async(
+    shard_results, shard_writes, record_write, symbols, writer_options
+):
+    """
+    Write fetch results with AsyncMongoDBHandler as they arrive
+
+    The blocking results iterator is advanced in a worker thread, so the
+    loop keeps running writes while the next shard is being fetched.
+    Returns:
+        AsyncMongoDBHandler: The (closed) writer, for its byte counters
+    """
+    import asyncio
+
+    from src.async_mongodb_handler import AsyncMongoDBHandler
+
+    writer = AsyncMongoDBHandler(**(writer_options or {}))
+    async with writer:
+        await writer.prefetch_companies(symbols)
+        slots = asyncio.Semaphore(writer.pool_size)
+
+        async def write(company, update_doc, tv_data):
+            async with slots:
+                changes = await writer.update_company_financials(
+                    company["symbol"], tv_data, update_doc
+                )
+            record_write(company, tv_data, changes, writer)
+
+        pending = set()
+        results = iter(shard_results)
+        while (item := await asyncio.to_thread(next, results, None)) is not None:
+            for company, update_doc, tv_data in shard_writes(*item):
+                task = asyncio.create_task(write(company, update_doc, tv_data))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+    return writer
+
+
+class FetchOptions:
+    """How symbols are fetched: pacing, retries, transport and timeouts"""
+
+    def __init__(
+        self,
+        rate_limit: float = 5.0,
+        retry_delay: float = 10.0,
+        max_retries: int = 3,
+        timeout: float = 15,
+        max_concurrency: int = 8,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 60.0,
+        settle_time: Optional[float] = None,
+        hedge: bool = False,
+        hedge_max_extra: float = 0.1,
+        symbols_per_connection: int = 1,
+        exchange_rate_budgets: Optional[Dict[str, float]] = None,
+        compression: bool = True,
+        bandwidth_per_field: bool = False,
+        processes: int = 1,
+        latency_history: Optional[str] = None,
+        timeout_options: Optional[Dict] = None,
+    ):
+        # Minimum seconds between fetch starts
+        self.rate_limit = rate_limit
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        # Single-symbol fetch timeout; batches get a small allowance per symbol
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.settle_time = settle_time
+        self.hedge = hedge
+        self.hedge_max_extra = hedge_max_extra
+        self.symbols_per_connection = symbols_per_connection
+        # Exchange -> symbols per second
+        self.exchange_rate_budgets = exchange_rate_budgets
+        self.compression = compression
+        self.bandwidth_per_field = bandwidth_per_field
+        self.processes = processes
+        # JSON file of observed latencies (None: fixed timeout and retry delay)
+        self.latency_history = latency_history
+        # AdaptiveTimeouts arguments: margin, floor, cap, min_samples, retry_growth
+        self.timeout_options = timeout_options
+
+
+class ProfileOptions:
+    """Which runs are profiled and where reports go (see src/profiling.py)"""
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        rate: float = 1.0,
+        output_dir: str = "profiles",
+        allocations: Optional[bool] = None,
+    ):
+        # "cprofile", "sample" or None to disable
+        self.mode = mode
+        # Fraction of runs that are profiled
+        self.rate = rate
+        self.output_dir = output_dir
+        # Trace allocations (default: cprofile only)
+        self.allocations = allocations
+
+
+class WriteOptions:
+    """Where results are written besides the companies collection"""
+
+    def __init__(
+        self,
+        async_writer: bool = False,
+        async_options: Optional[Dict] = None,
+        history_codec: Optional[str] = None,
+        change_feed: Optional[str] = None,
+        snapshot_dir: Optional[str] = None,
+    ):
+        self.async_writer = async_writer
+        # AsyncMongoDBHandler arguments: pool size, compressors, write concern
+        self.async_options = async_options
+        # See src/history_codec.py (None: MONGODB_HISTORY_CODEC, else plain arrays)
+        self.history_codec = history_codec
+        # Outbox path (.jsonl or SQLite) for field-level deltas
+        self.change_feed = change_feed
+        # Directory for columnar Arrow/Parquet snapshots of the fetched payloads
+        self.snapshot_dir = snapshot_dir
+
+
+def process_all_companies(
+    max_companies: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    priority_weights: Optional[PriorityWeights] = None,
+    providers: Optional[List[UniverseProvider]] = None,
+    fetch_options: Optional[FetchOptions] = None,
+    profile_options: Optional[ProfileOptions] = None,
+    write_options: Optional[WriteOptions] = None,
 ):
-    """Process companies with reliable single-request approach"""
-    db_handler = MongoDBHandler()
+    """Process companies with adaptive concurrency
+
+    Fetches run on a thread pool whose in-flight limit is adjusted by an
+    AIMD controller (at most max_concurrency, starts no closer together than
+    rate_limit seconds). After breaker_threshold consecutive failures all
+    fetches pause for breaker_cooldown seconds. Writes to MongoDB happen on
+    the calling thread as fetches complete.
+
+    settle_time lets a fetch finish once its data has stopped arriving
+    instead of always waiting for the timeout. With hedge enabled, symbols
+    slower than the observed p95 get a duplicate fetch, adding at most
+    hedge_max_extra extra requests per primary request.
+
+    Symbols are processed highest priority first (market cap, staleness of
+    lastUpdated, filing activity; see priority_weights). Given time_budget
+    seconds, the starting concurrency is planned to finish within it, and
+    once the budget is used up remaining symbols are deferred and reported.
+    Returns a summary dict with "processed", "total" and "deferred".
+
+    The universe comes from providers (default: the CSE company list). With
+    symbols_per_connection above 1, symbols are sharded so that each
+    connection subscribes a whole batch in one quote session, and
+    exchange_rate_budgets caps symbols per second per exchange.
+
+    Connections offer permessage-deflate unless compression is off.
+    The summary reports wire against decoded bytes per session and for the
+    heaviest symbols (and fields, with bandwidth_per_field).
+
+    With processes above 1, shards are fetched and transformed in that many
+    worker processes, each with its own share of max_concurrency, rate and
+    exchange budgets; this process remains the only MongoDB writer. Hedging
+    only applies to in-process fetches.
+
+    With latency_history (a JSON file), every fetch records each symbol's
+    time to first data and to completion there, and fetch timeouts and
+    retry delays come from those samples instead of timeout and
+    retry_delay.
+
+    With async_writer, writes go through AsyncMongoDBHandler on an event
+    loop that keeps consuming fetch results while writes are in flight.
+    When change_feed is set, every successful write also appends the
+    symbol's field-level delta to that outbox, and with snapshot_dir the
+    fetched payloads are exported as a snapshot partitioned by run date.
+
+    When profiling mode is "cprofile" or "sample", a rate fraction of runs
+    write a report to output_dir with time and allocations per stage
+    (fetch, parse, transform, write). Allocations are traced with cprofile,
+    and in sample mode only when allocations is set.
+    Args:
+        max_companies: Only process this many companies
+        time_budget: Seconds the run may take (None: unlimited)
+        priority_weights: Priority weights (default: PriorityWeights())
+        providers: Universe providers (default: the CSE company list)
+        fetch_options: Fetch settings (default: FetchOptions())
+        profile_options: Profiling settings (default: ProfileOptions())
+        write_options: Writer and export settings (default: WriteOptions())
+    """
+    fetch_options = fetch_options or FetchOptions()
+    profile_options = profile_options or ProfileOptions()
+    write_options = write_options or WriteOptions()
+
+    # Subsystems are imported here so importing this module stays cheap
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from tqdm import tqdm
+    from src.mongodb_handler import MongoDBHandler
+    from src.fetch_tradingview_financials import (
+        fetch_financial_data,
+        fetch_financial_data_batch,
+    )
+    from src.ws_transport import BandwidthStats
+
+    db_handler = MongoDBHandler(history_codec=write_options.history_codec)
+    bandwidth = BandwidthStats(per_field=fetch_options.bandwidth_per_field)
+    latency = None
+    if fetch_options.latency_history:
+        from src.latency_history import AdaptiveTimeouts, LatencyHistory
+
+        latency = LatencyHistory(fetch_options.latency_history)
+    profiler = maybe_start_profiler(
+        "sync",
+        profile_options.mode,
+        profile_options.rate,
+        profile_options.output_dir,
+        profile_options.allocations,
+    )
+    outbox = None
+    if write_options.change_feed:
+        from src.change_feed import open_outbox
+
+        outbox = open_outbox(write_options.change_feed)
+    run_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    usage_at_start = resource_usage()
 
     try:
         # Fetch company codes
         print("Fetching all company codes...")
-        company_codes = fetch_all_company_codes()
+        company_codes = load_universe(providers or [CSEUniverseProvider()])
         if not company_codes:
             print("No company codes available. Exiting.")
             return
@@ -28,59 +712,283 @@ def process_all_companies(
             if max_companies
             else len(company_codes)
         )
-        print(f"\nProcessing {total_companies} companies with {rate_limit}s delay...")
+        companies = company_codes[:total_companies]
 
-        processed = 0
-        progress_bar = tqdm(
-            company_codes[:total_companies], desc="Processing", unit="company"
+        # Most important companies first, so a budget cut defers the least important
+        weights = priority_weights or PriorityWeights()
+        scores = priority_scores(
+            companies,
+            db_handler.get_schedule_inputs(
+                (company["symbol"] for company in companies), weights.size_field
+            ),
+            weights,
         )
+        companies.sort(key=lambda company: -scores[company["symbol"]])
 
-        for company in progress_bar:
+        # A batch gets the single-symbol timeout plus a small allowance per symbol
+        shards = shard_symbols(companies, fetch_options.symbols_per_connection)
+        shard_timeout = fetch_options.timeout + 0.1 * (
+            fetch_options.symbols_per_connection - 1
+        )
+        timeouts = None
+        if latency is not None:
+            timeouts = AdaptiveTimeouts(
+                latency,
+                (company["tradingview_symbol"] for company in companies),
+                default=fetch_options.timeout,
+                **(fetch_options.timeout_options or {}),
+            )
+            print(timeouts.summary())
+
+        deadline = Deadline(time_budget, reserve_seconds=shard_timeout)
+        # A time budget starts at the concurrency it needs; otherwise the
+        # controller slow-starts and grows towards max_concurrency
+        planned_concurrency = min(
+            AdaptiveConcurrencyController.DEFAULT_INITIAL_LIMIT,
+            fetch_options.max_concurrency,
+        )
+        if time_budget:
+            planned_concurrency = plan_concurrency(
+                len(shards),
+                time_budget,
+                fetch_options.settle_time or shard_timeout,
+                fetch_options.max_concurrency,
+            )
+        print(
+            f"\nProcessing {total_companies} companies with up to "
+            f"{fetch_options.max_concurrency} concurrent fetches (starting at {planned_concurrency:g})..."
+        )
+        if time_budget and fetch_options.rate_limit * total_companies > time_budget:
+            print(
+                f"Warning: {fetch_options.rate_limit}s between fetch starts cannot fit "
+                f"{total_companies} companies in {time_budget}s"
+            )
+
+        # Load stored documents up front so each write only sends what changed
+        # (the async writer does this on its own connection)
+        if not write_options.async_writer:
+            db_handler.prefetch_companies(company["symbol"] for company in companies)
+
+        controller = AdaptiveConcurrencyController(
+            initial_limit=planned_concurrency,
+            max_limit=fetch_options.max_concurrency,
+            min_interval=fetch_options.rate_limit,
+        )
+        breaker = CircuitBreaker(
+            fetch_options.breaker_threshold, fetch_options.breaker_cooldown
+        )
+        fetch = partial(
+            fetch_financial_data,
+            timeout=fetch_options.timeout,
+            settle_time=fetch_options.settle_time,
+            bandwidth=bandwidth,
+            compression=fetch_options.compression,
+            latency=latency,
+        )
+        hedger = (
+            HedgedFetcher(fetch, max_extra_ratio=fetch_options.hedge_max_extra)
+            if fetch_options.hedge
+            else None
+        )
+        rate_budgets = ExchangeRateBudgets(fetch_options.exchange_rate_budgets)
+
+        def fetch_shard(symbols, timeout=None):
+            if len(symbols) == 1:
+                return {
+                    symbols[0]: (hedger or fetch)(
+                        symbols[0], timeout=timeout or fetch_options.timeout
+                    )
+                }
+            return fetch_financial_data_batch(
+                symbols,
+                timeout=timeout or shard_timeout,
+                settle_time=fetch_options.settle_time,
+                compression=fetch_options.compression,
+                bandwidth=bandwidth,
+                latency=latency,
+            )
+
+        def iter_thread_results():
+            with ThreadPoolExecutor(
+                max_workers=fetch_options.max_concurrency
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        fetch_batch_with_controls,
+                        fetch_shard,
+                        [entry["tradingview_symbol"] for entry in shard],
+                        controller,
+                        breaker,
+                        fetch_options.retry_delay,
+                        fetch_options.max_retries,
+                        deadline,
+                        partial(rate_budgets.acquire, shard[0]["exchange"]),
+                        timeouts and timeouts.timeout_for,
+                    ): shard
+                    for shard in shards
+                }
+                for future in as_completed(futures):
+                    try:
+                        results = future.result() or {}
+                    except DeadlineExceeded:
+                        yield futures[future], None
+                        continue
+                    yield futures[future], {
+                        symbol: (None, tv_data)
+                        for symbol, tv_data in results.items()
+                        if has_financial_data(tv_data)
+                    }
+
+        if fetch_options.processes > 1:
+            from src.process_sharding import iter_process_results, worker_options
+
+            print(f"Fetching in {fetch_options.processes} worker processes")
+            shard_results = iter_process_results(
+                shards,
+                fetch_options.processes,
+                worker_options(
+                    fetch_options,
+                    timeout=shard_timeout,
+                    initial_concurrency=planned_concurrency,
+                    time_budget=deadline.remaining() if time_budget else None,
+                    keep_payloads=bool(write_options.snapshot_dir),
+                    timeouts=timeouts,
+                ),
+                bandwidth,
+                latency,
+            )
+        else:
+            shard_results = iter_thread_results()
+
+        processed = 0
+        deferred = []
+        fetched_payloads = []
+        progress_bar = tqdm(total=total_companies, desc="Processing", unit="company")
+
+        def shard_writes(shard, results):
+            """Companies of a finished shard that have data to write"""
+            if results is None:
+                deferred.extend(
+                    (company["symbol"], scores[company["symbol"]]) for company in shard
+                )
+                progress_bar.update(len(shard))
+                return
+            for company in shard:
+                progress_bar.update(1)
+                progress_bar.set_description(f"Processed {company['name']}")
+                if company["tradingview_symbol"] not in results:
+                    print(f"\nNo data received for {company['symbol']}")
+                    continue
+                yield (company, *results[company["tradingview_symbol"]])
+
+        def record_write(company, tv_data, changes, writer):
+            nonlocal processed
             symbol = company["symbol"]
-            tradingview_symbol = f"CSELK:{symbol}"
-
-            # Update progress bar description
-            progress_bar.set_description(f"Processing {company['name']}")
-
-            for attempt in range(max_retries):
-                try:
-                    # Fetch and process data
-                    tv_data = fetch_financial_data(tradingview_symbol)
-
-                    if tv_data:
-                        if db_handler.update_company_financials(symbol, tv_data):
-                            processed += 1
-                            progress_bar.set_postfix({"success": processed})
-                            break  # Success, move to next company
-                        else:
-                            print(f"\nFailed to update {symbol} in MongoDB")
-                    else:
-                        print(f"\nNo data received for {symbol}")
-
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        print(
-                            f"\nFailed to process {symbol} after {max_retries} attempts"
-                        )
-                    else:
-                        time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-
-            # Rate limiting
-            if company != company_codes[-1]:  # Don't sleep after last company
-                time.sleep(rate_limit)
+            if changes is None:
+                print(f"\nFailed to update {symbol} in MongoDB")
+                return
+            if outbox:
+                outbox.append(symbol, changes, run_id)
+            if write_options.snapshot_dir:
+                fetched_payloads.append(tv_data)
+            processed += 1
+            progress_bar.set_postfix(
+                {
+                    "success": processed,
+                    "saved": f"{writer.last_bytes_saved}B",
+                    "limit": controller.stats()["limit"],
+                }
+            )
 
+        if write_options.async_writer:
+            import asyncio
+
+            writer = asyncio.run(
+                _write_async(
+                    shard_results,
+                    shard_writes,
+                    record_write,
+                    [company["symbol"] for company in companies],
+                    dict(
+                        write_options.async_options or {},
+                        history_codec=write_options.history_codec,
+                    ),
+                )
+            )
+        else:
+            writer = db_handler
+            for shard, results in shard_results:
+                for company, update_doc, tv_data in shard_writes(shard, results):
+                    symbol = company["symbol"]
+                    ok = db_handler.update_company_financials(
+                        symbol, tv_data, update_doc
+                    )
+                    record_write(
+                        company,
+                        tv_data,
+                        db_handler.last_changes if ok else None,
+                        writer,
+                    )
+
+        progress_bar.close()
         print(
             f"\nCompleted. Successfully updated {processed}/{total_companies} companies."
         )
+        print(
+            f"Write payload: {writer.total_bytes_sent} of "
+            f"{writer.total_bytes_full} bytes sent "
+            f"({writer.total_bytes_full - writer.total_bytes_sent} bytes saved)"
+        )
+        if fetch_options.processes <= 1:
+            print(
+                f"Concurrency: final limit {controller.stats()['limit']}, "
+                f"circuit breaker tripped {breaker.trips} times"
+            )
+        if hedger:
+            hedge_stats = hedger.stats()
+            print(
+                f"Hedging: {hedge_stats['hedges']} hedged requests for "
+                f"{hedge_stats['primaries']} symbols, {hedge_stats['hedge_wins']} won"
+            )
+
+        print(bandwidth.summary())
+        if latency is not None:
+            latency.save()
+        print(
+            f"Resources: {format_usage(resource_usage())} "
+            f"(at start: {format_usage(usage_at_start)})"
+        )
+
+        if time_budget:
+            deferred.sort(key=lambda item: -item[1])
+            print(deferred_report(deferred))
+
+        if write_options.snapshot_dir and fetched_payloads:
+            from src.snapshot_export import export_snapshot
+
+            export_snapshot(fetched_payloads, write_options.snapshot_dir)
+
+        return {
+            "processed": processed,
+            "total": total_companies,
+            "deferred": [symbol for symbol, _ in deferred],
+            "wire_bytes": bandwidth.totals()[0],
+            "decoded_bytes": bandwidth.totals()[1],
+        }
 
     finally:
+        finish_profiler(profiler)
+        if outbox:
+            outbox.close()
         db_handler.close()
 
 
 if __name__ == "__main__":
     process_all_companies(
-        rate_limit=2.0,  # 5 seconds between requests (conservative)
         max_companies=315,
-        retry_delay=10.0,  # Wait longer between retries
-        max_retries=1,
+        fetch_options=FetchOptions(
+            rate_limit=2.0,  # Minimum spacing between fetch starts
+            retry_delay=10.0,  # Wait longer between retries
+            max_retries=1,
+        ),
     )
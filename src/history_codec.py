@@ -0,0 +1,191 @@
+"""
+Compact storage of numeric history arrays as BSON binary
+
+A BSON array spends a type byte and a decimal index key on every element,
+which more than doubles the size of a short array of doubles. A numeric
+history is instead packed into one binary value:
+
+    version (1 byte) | kind (1) | flags (1) | count (uint32) | body
+
+kind is int64 when every value is an int that fits in 64 bits (e.g. period
+end timestamps) and float64 otherwise, each value stored as 8 little-endian
+bytes. flags mark a null bitmap in front of the values, delta encoding
+(int64 differences, or XOR of float64 bit patterns, which leaves long runs
+of zero bytes for similar values) and zlib compression of the body.
+
+Decoding returns equal values and None in the same positions, but the
+element type follows the kind: in a float64 history every number comes
+back as a float, so [1, 2.5] decodes to [1.0, 2.5] and ints beyond int64
+lose precision like any double.
+"""
+
+import struct
+import zlib
+from typing import Dict, List, Optional
+
+from bson.binary import Binary
+
+# User-defined BSON binary subtype marking an encoded history
+BINARY_SUBTYPE = 0x80
+VERSION = 1
+
+KIND_FLOAT64 = 0
+KIND_INT64 = 1
+
+FLAG_DELTA = 0x01
+FLAG_ZLIB = 0x02
+FLAG_NULLS = 0x04
+
+# Codec name -> (delta encoding, zlib compression)
+CODECS = {
+    "float64": (False, False),
+    "float64-zlib": (False, True),
+    "delta": (True, False),
+    "delta-zlib": (True, True),
+}
+
+_HEADER = struct.Struct("<BBBI")
+_MASK = (1 << 64) - 1
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_numeric_history(value) -> bool:
+    """True for a non-empty list of numbers and None with at least one number"""
+    if not isinstance(value, list) or not value:
+        return False
+    return all(item is None or _is_number(item) for item in value) and any(
+        item is not None for item in value
+    )
+
+
+def is_encoded_history(value) -> bool:
+    """True for a history packed by encode_history()"""
+    return isinstance(value, Binary) and value.subtype == BINARY_SUBTYPE
+
+
+def encode_history(values, codec: str = "float64") -> Optional[Binary]:
+    """
+    Pack a numeric history into a BSON binary value
+    Args:
+        values: History list (numbers and None)
+        codec: One of CODECS
+    Returns:
+        Binary: The packed history, or None if values is not a numeric history
+    """
+    if codec not in CODECS:
+        raise ValueError(
+            f"Unknown history codec {codec!r}; expected one of {list(CODECS)}"
+        )
+    if not is_numeric_history(values):
+        return None
+    delta, compress = CODECS[codec]
+    count = len(values)
+
+    kind = KIND_INT64
+    for item in values:
+        if item is None:
+            continue
+        if isinstance(item, float) or not _INT64_MIN <= item <= _INT64_MAX:
+            kind = KIND_FLOAT64
+            break
+
+    flags = 0
+    body = b""
+    if None in values:
+        flags |= FLAG_NULLS
+        bitmap = bytearray((count + 7) // 8)
+        for index, item in enumerate(values):
+            if item is None:
+                bitmap[index // 8] |= 1 << (index % 8)
+        body += bytes(bitmap)
+
+    if kind == KIND_FLOAT64:
+        filled = [0.0 if item is None else float(item) for item in values]
+        words = list(struct.unpack(f"<{count}Q", struct.pack(f"<{count}d", *filled)))
+    else:
+        words = [0 if item is None else item & _MASK for item in values]
+
+    if delta:
+        flags |= FLAG_DELTA
+        previous = 0
+        for index, word in enumerate(words):
+            if kind == KIND_FLOAT64:
+                words[index] = word ^ previous
+            else:
+                words[index] = (word - previous) & _MASK
+            previous = word
+    body += struct.pack(f"<{count}Q", *words)
+
+    if compress:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            flags |= FLAG_ZLIB
+            body = packed
+
+    return Binary(_HEADER.pack(VERSION, kind, flags, count) + body, BINARY_SUBTYPE)
+
+
+def decode_history(value):
+    """
+    Unpack a history written by encode_history(); other values pass through
+    Args:
+        value: Stored field value
+    Returns:
+        The history list, or value unchanged if it is not an encoded history
+    """
+    if not is_encoded_history(value):
+        return value
+    data = bytes(value)
+    version, kind, flags, count = _HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported history encoding version {version}")
+    body = data[_HEADER.size :]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    nulls = None
+    if flags & FLAG_NULLS:
+        bitmap_size = (count + 7) // 8
+        nulls, body = body[:bitmap_size], body[bitmap_size:]
+
+    words = struct.unpack(f"<{count}Q", body)
+    if flags & FLAG_DELTA:
+        decoded = []
+        previous = 0
+        for word in words:
+            if kind == KIND_FLOAT64:
+                previous ^= word
+            else:
+                previous = (previous + word) & _MASK
+            decoded.append(previous)
+        words = decoded
+
+    if kind == KIND_FLOAT64:
+        values: List = list(
+            struct.unpack(f"<{count}d", struct.pack(f"<{count}Q", *words))
+        )
+    else:
+        values = [word - (1 << 64) if word > _INT64_MAX else word for word in words]
+
+    if nulls is not None:
+        for index in range(count):
+            if nulls[index // 8] & (1 << (index % 8)):
+                values[index] = None
+    return values
+
+
+def decode_histories(fields: Dict) -> Dict:
+    """Copy of a field -> value mapping with every packed history unpacked"""
+    return {field: decode_history(value) for field, value in fields.items()}
+
+
+def decode_company(doc: Optional[Dict]) -> Optional[Dict]:
+    """A companies document with its tradingViewData histories unpacked"""
+    if not doc or not isinstance(doc.get("tradingViewData"), dict):
+        return doc
+    return dict(doc, tradingViewData=decode_histories(doc["tradingViewData"]))
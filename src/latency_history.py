@@ -0,0 +1,197 @@
+"""
+Per-symbol fetch latencies kept across runs, and timeouts derived from them
+
+Each fetch records a symbol's time to first data and time to complete,
+measured from the quote subscription. AdaptiveTimeouts turns the recent
+samples into a per-symbol timeout (p99 of completion times times a margin,
+between a floor and a cap), so symbols that answer in a few hundred
+milliseconds stop holding a worker for the full default timeout, and slow
+but valid symbols get room to finish. Symbols without enough samples keep
+the default timeout.
+
+Fetches that end before a symbol completes (cut off by the timeout or a
+dropped connection) are kept but flagged, and left out of the completion
+times: their elapsed time is just the timeout they were given, so counting
+them would push that symbol's timeout up to the cap run after run.
+"""
+
+import json
+import os
+import statistics
+import threading
+from typing import Dict, Iterable, List, Optional, Union
+
+# [time to first data, time to complete or cut-off (seconds), completed]
+# Files written before the flag existed hold two-element samples, read as completed
+TSample = List[Union[float, bool]]
+
+
+class LatencyHistory:
+    """
+    Recent latency samples per symbol, optionally persisted to a JSON file
+    Args:
+        path: JSON file to load from and save to (None keeps it in memory)
+        max_samples: Samples kept per symbol (oldest are dropped)
+    """
+
+    def __init__(self, path: Optional[str] = None, max_samples: int = 50):
+        self.path = path
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, List[TSample]] = {}
+        # Samples recorded since loading, for merging into another history
+        self._new: Dict[str, List[TSample]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._samples = json.load(f).get("symbols", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable latency history {path}: {e}")
+
+    def record(
+        self, symbol: str, first_data: float, complete: float, completed: bool = True
+    ):
+        """
+        Add one fetch's time to first data and to completion (seconds)
+        Args:
+            symbol: TradingView symbol
+            first_data: Seconds from subscription to the first data
+            complete: Seconds from subscription to completion, or to the
+                cut-off when the symbol did not complete
+            completed: Whether the symbol completed before the fetch ended
+        """
+        sample = [round(first_data, 3), round(complete, 3), completed]
+        with self._lock:
+            samples = self._samples.setdefault(symbol, [])
+            samples.append(sample)
+            del samples[: -self.max_samples]
+            self._new.setdefault(symbol, []).append(sample)
+
+    def samples(self, symbol: str) -> List[TSample]:
+        with self._lock:
+            return list(self._samples.get(symbol, ()))
+
+    def state(self) -> Dict[str, List[TSample]]:
+        """Samples recorded since loading (picklable, for merge())"""
+        with self._lock:
+            return {symbol: list(samples) for symbol, samples in self._new.items()}
+
+    def merge(self, state: Dict[str, List[TSample]]):
+        """Add samples recorded by another history (e.g. in a worker process)"""
+        for symbol, samples in state.items():
+            for sample in samples:
+                self.record(symbol, *sample)
+
+    def percentiles(self, symbol: str) -> Optional[Dict[str, float]]:
+        """
+        p50/p99 of time to first data and to completion, or None without samples
+        (completion percentiles leave out cut-off samples and are None when
+        every sample was cut off)
+        """
+        samples = self.samples(symbol)
+        if not samples:
+            return None
+        firsts = [sample[0] for sample in samples]
+        completes = completion_times(samples)
+        return {
+            "samples": len(samples),
+            "cut_off": len(samples) - len(completes),
+            "first_p50": statistics.median(firsts),
+            "first_p99": _p99(firsts),
+            "complete_p50": statistics.median(completes) if completes else None,
+            "complete_p99": _p99(completes) if completes else None,
+        }
+
+    def save(self):
+        """Write all samples to path (atomically replacing the old file)"""
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps({"version": 1, "symbols": self._samples})
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving latency history to {self.path}: {e}")
+
+
+def completion_times(samples: List[TSample]) -> List[float]:
+    """Times to completion of the samples whose symbol completed"""
+    return [sample[1] for sample in samples if len(sample) < 3 or sample[2]]
+
+
+def _p99(values: List[float]) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[98]
+
+
+class AdaptiveTimeouts:
+    """
+    Per-symbol fetch timeouts computed from a LatencyHistory at the start of a run
+
+    Holds only plain values, so it can be passed to worker processes.
+    Args:
+        history: Latency samples from earlier runs
+        symbols: Symbols to compute timeouts for
+        default: Timeout for symbols with fewer than min_samples completed samples
+        margin: Multiplier on the p99 completion time
+        floor: Smallest timeout
+        cap: Largest timeout, retries included
+        min_samples: Completed samples needed before a symbol gets its own
+            timeout (cut-off samples do not count)
+        retry_growth: Timeout multiplier per retry, so a symbol that was cut
+            off gets more time on its next attempt
+    """
+
+    def __init__(
+        self,
+        history: LatencyHistory,
+        symbols: Iterable[str],
+        default: float = 15.0,
+        margin: float = 1.5,
+        floor: float = 2.0,
+        cap: float = 60.0,
+        min_samples: int = 5,
+        retry_growth: float = 1.5,
+    ):
+        self.default = default
+        self.cap = cap
+        self.retry_growth = retry_growth
+        self.timeouts: Dict[str, float] = {}
+        for symbol in symbols:
+            completes = completion_times(history.samples(symbol))
+            if len(completes) < min_samples:
+                continue
+            p99 = _p99(completes)
+            self.timeouts[symbol] = round(min(cap, max(floor, p99 * margin)), 3)
+
+    def timeout_for(self, symbols: List[str], attempt: int = 0) -> float:
+        """
+        Timeout for fetching symbols together on one connection
+        Args:
+            symbols: TradingView symbols of the fetch
+            attempt: Zero-based attempt number
+        Returns:
+            float: The slowest symbol's timeout, plus the usual 0.1s per extra
+                symbol of a batch, grown per retry and capped
+        """
+        base = max(self.timeouts.get(symbol, self.default) for symbol in symbols)
+        base += 0.1 * (len(symbols) - 1)
+        return min(max(self.cap, self.default), base * self.retry_growth**attempt)
+
+    def summary(self) -> str:
+        """One-line description of the learned timeouts"""
+        if not self.timeouts:
+            return f"Timeouts: no latency history yet, all symbols use {self.default}s"
+        values = sorted(self.timeouts.values())
+        return (
+            f"Timeouts: learned for {len(values)} symbols "
+            f"(median {statistics.median(values):.1f}s, range "
+            f"{values[0]:.1f}-{values[-1]:.1f}s), others use {self.default}s"
+        )
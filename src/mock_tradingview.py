@@ -0,0 +1,334 @@
+"""
+Local stand-in for the TradingView quote WebSocket, used by benchmarks
+
+Speaks just enough of RFC 6455 and the ~m~ framed quote protocol to serve
+synthetic qsd payloads (and daily bars for chart sessions): each connection emits one symbol every
+per_symbol_delay seconds, so throughput scales with connection count the
+way a per-connection rate limited upstream does. Clients that offer
+permessage-deflate get compressed text frames unless compression is off.
+"""
+
+import base64
+import hashlib
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+from src.fetch_tradingview_financials import (
+    EMPTY_FINANCIAL_DATA,
+    create_message,
+    parse_tradingview_message,
+)
+
+_WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+
+def synthetic_values(history_length: int = 8) -> dict:
+    """Deterministic values for every requested field"""
+    values = {}
+    for index, key in enumerate(EMPTY_FINANCIAL_DATA):
+        if key == "symbol":
+            continue
+        if key == "business_description":
+            values[key] = "Synthetic company used for benchmarking. " * 4
+        elif key == "web_site_url":
+            values[key] = "https://example.com"
+        elif key.endswith("_h"):
+            values[key] = [
+                float(index * 1000 + period) for period in range(history_length)
+            ]
+        else:
+            values[key] = float(index)
+    return values
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT, rsv1: bool = False) -> bytes:
+    """Build an unmasked server-to-client frame (rsv1 marks a deflated message)"""
+    header = bytes([0x80 | (0x40 if rsv1 else 0) | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 1 << 16:
+        header += bytes([126]) + struct.pack("!H", length)
+    else:
+        header += bytes([127]) + struct.pack("!Q", length)
+    return header + payload
+
+
+def _recv_exact(sock: socket.socket, count: int) -> bytes:
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("client disconnected")
+        data += chunk
+    return data
+
+
+def read_frame(sock: socket.socket):
+    """Read one client frame; returns (opcode, payload)"""
+    first, second = _recv_exact(sock, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if second & 0x80 else None
+    payload = _recv_exact(sock, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class _QuoteHandler(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.server.track_connection(+1)
+
+    def finish(self):
+        self.server.track_connection(-1)
+
+    def handle(self):
+        sock = self.request
+        deflate = self._handshake(sock)
+        if deflate is None:
+            return
+
+        send_lock = threading.Lock()
+        pending: queue.Queue = queue.Queue()
+        stop = threading.Event()
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS) if deflate else None
+
+        def send(text: str, opcode: int = OP_TEXT):
+            payload = text.encode()
+            with send_lock:
+                if compressor is not None and opcode == OP_TEXT:
+                    payload = compressor.compress(payload)
+                    payload += compressor.flush(zlib.Z_SYNC_FLUSH)
+                    sock.sendall(encode_frame(payload[:-4], opcode, rsv1=True))
+                else:
+                    sock.sendall(encode_frame(payload, opcode))
+
+        def emit():
+            while not stop.is_set():
+                try:
+                    messages = pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if self.server.per_symbol_delay:
+                    time.sleep(self.server.per_symbol_delay)
+                try:
+                    for message in messages:
+                        send(message)
+                except OSError:
+                    return
+
+        resolved = {}
+        emitter = threading.Thread(target=emit, daemon=True)
+        emitter.start()
+        try:
+            while True:
+                opcode, payload = read_frame(sock)
+                if opcode == OP_CLOSE:
+                    send("", OP_CLOSE)
+                    return
+                if opcode == OP_PING:
+                    send(payload.decode(), OP_PONG)
+                    continue
+                if opcode != OP_TEXT:
+                    continue
+                for segment in parse_tradingview_message(payload.decode()):
+                    if segment.startswith("~h~"):
+                        continue
+                    message = json.loads(segment)
+                    method = message.get("m")
+                    if method == "quote_add_symbols":
+                        session_id, *symbols = message["p"]
+                        for symbol in symbols:
+                            pending.put(self.server.quote_messages(session_id, symbol))
+                    elif method == "resolve_symbol":
+                        _, symbol_id, spec = message["p"]
+                        resolved[symbol_id] = json.loads(spec.lstrip("="))["symbol"]
+                    elif method == "create_series":
+                        session_id, series_id, _, symbol_id, _, count = message["p"][:6]
+                        if symbol_id in resolved:
+                            pending.put(
+                                self.server.chart_messages(session_id, series_id, count)
+                            )
+        except (ConnectionError, OSError):
+            return
+        finally:
+            stop.set()
+            emitter.join()
+
+    def _handshake(self, sock: socket.socket) -> Optional[bool]:
+        """Complete the upgrade; returns whether deflate was agreed, None on failure"""
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return None
+            request += chunk
+
+        key = None
+        deflate = False
+        for line in request.decode("latin-1").split("\r\n"):
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "sec-websocket-key":
+                key = value.strip()
+            elif name == "sec-websocket-extensions":
+                deflate = "permessage-deflate" in value
+        if not key:
+            return None
+        deflate = deflate and self.server.compression
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()
+        ).decode()
+        sock.sendall(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n"
+                + (
+                    "Sec-WebSocket-Extensions: permessage-deflate\r\n"
+                    if deflate
+                    else ""
+                )
+                + "\r\n"
+            ).encode()
+        )
+        return deflate
+
+
+class MockTradingViewServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded mock quote server
+    Args:
+        port: Port to listen on (0 picks a free port)
+        per_symbol_delay: Seconds each connection spends per symbol
+        history_length: Periods in every synthetic history array
+        compression: Agree to permessage-deflate when a client offers it
+        reuse_port: Set SO_REUSEPORT so other servers can bind the same port
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        per_symbol_delay: float = 0.001,
+        history_length: int = 8,
+        compression: bool = True,
+        reuse_port: bool = False,
+    ):
+        # With reuse_port several server processes can share one port and
+        # the kernel spreads connections over them
+        self.allow_reuse_port = reuse_port
+        super().__init__(("127.0.0.1", port), _QuoteHandler)
+        self.per_symbol_delay = per_symbol_delay
+        self.compression = compression
+        self.max_bars = 5000
+        values = json.dumps(synthetic_values(history_length))
+        # Symbol and session are the only per-message parts, so splice them in
+        self._qsd_template = (
+            '{"m":"qsd","p":["%s",{"n":"%s","s":"ok","v":' + values + "}]}"
+        )
+        self._connections_lock = threading.Lock()
+        self.open_connections = 0
+        self.total_connections = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.server_address[1]}/socket.io/websocket"
+
+    def qsd_message(self, session_id: str, symbol: str) -> str:
+        return create_message(self._qsd_template % (session_id, symbol))
+
+    def quote_messages(self, session_id: str, symbol: str) -> List[str]:
+        return [
+            self.qsd_message(session_id, symbol),
+            create_message(
+                json.dumps({"m": "quote_completed", "p": [session_id, symbol]})
+            ),
+        ]
+
+    def chart_messages(self, session_id: str, series_id: str, count: int) -> List[str]:
+        """Daily bars ending today, same prices for every symbol"""
+        today = int(time.time()) // 86400
+        count = min(count, self.max_bars)
+        bars = []
+        for index in range(count):
+            day = today - (count - 1 - index)
+            price = 100.0 + day % 50
+            bars.append(
+                {
+                    "i": index,
+                    "v": [day * 86400, price, price + 2, price - 1, price + 1, 1000.0],
+                }
+            )
+        return [
+            create_message(
+                json.dumps(
+                    {
+                        "m": "timescale_update",
+                        "p": [session_id, {series_id: {"s": bars}}],
+                    }
+                )
+            ),
+            create_message(
+                json.dumps(
+                    {"m": "series_completed", "p": [session_id, series_id, "s1"]}
+                )
+            ),
+        ]
+
+    def track_connection(self, delta: int):
+        with self._connections_lock:
+            self.open_connections += delta
+            if delta > 0:
+                self.total_connections += delta
+
+    def start(self) -> "MockTradingViewServer":
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def serve(
+    port: int,
+    per_symbol_delay: float,
+    history_length: int,
+    ready=None,
+    compression: bool = True,
+    reuse_port: bool = False,
+):
+    """Run a mock server until the process is terminated (multiprocessing target)"""
+    server = MockTradingViewServer(
+        port, per_symbol_delay, history_length, compression, reuse_port
+    )
+    if ready is not None:
+        ready.put(server.server_address[1])
+    server.serve_forever()
@@ -1,31 +1,158 @@
-import os
-from typing import Dict, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
-from pymongo import MongoClient
+import bson
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.errors import PyMongoError
-from dotenv import load_dotenv
 import ssl
+from src.config import get_env
+from src.history_codec import (
+    CODECS,
+    decode_company,
+    decode_histories,
+    decode_history,
+    encode_history,
+    is_encoded_history,
+)
+from src.profiling import stage
+from src.ttl_cache import TTLCache
 
-# Load environment variables
-load_dotenv()
+# Latest-value fields carried by the covering index, so reads of these
+# fields by symbol are answered from the index without touching documents
+COVERED_LATEST_FIELDS = [
+    "totalAssets",
+    "totalLiabilities",
+    "totalEquity",
+    "totalDebt",
+    "totalRevenue",
+    "netIncome",
+    "earningsPerShare",
+    "netAssetsPerShare",
+    "priceEarningsRatio",
+    "priceToBookValue",
+    "dividendPerShare",
+    "dividendYield",
+]
 
 
-class MongoDBHandler:
-    def __init__(self):
-        self.uri = os.getenv("MONGODB_URI")
-        if not self.uri:
-            raise ValueError("MONGODB_URI not found in .env file")
+# Slim per-symbol documents with only latest values and derived ratios
+SNAPSHOT_COLLECTION = "company_snapshots"
+SNAPSHOT_FIELDS = [
+    "totalAssets",
+    "totalCurrentAssets",
+    "totalLiabilities",
+    "totalCurrentLiabilities",
+    "totalEquity",
+    "shareHoldersEquity",
+    "totalDebt",
+    "netDebt",
+    "totalRevenue",
+    "totalProfitBeforeTax",
+    "netIncome",
+    "incomeTax",
+    "returnOnAssets",
+    "returnOnEquity",
+    "netMargin",
+    "currentRatio",
+    "debtToAsset",
+    "debtToEquity",
+    "numberOfShares",
+    "earningsPerShare",
+    "netAssetsPerShare",
+    "priceEarningsRatio",
+    "priceToBookValue",
+    "dividendPerShare",
+    "dividendYield",
+    "dividendPayoutRatio",
+]
+# Derived ratio -> (numerator, denominator); a numerator of None means 1
+SNAPSHOT_RATIOS = {
+    "earningsYield": (None, "priceEarningsRatio"),
+    "liabilitiesToEquity": ("totalLiabilities", "totalEquity"),
+    "netDebtToEquity": ("netDebt", "totalEquity"),
+    "revenuePerShare": ("totalRevenue", "numberOfShares"),
+}
+# Fields screened by range, each with its own index on the snapshots
+SNAPSHOT_INDEXED_FIELDS = [
+    "priceEarningsRatio",
+    "priceToBookValue",
+    "dividendYield",
+    "returnOnEquity",
+    "netMargin",
+    "debtToEquity",
+    "earningsYield",
+]
+
+
+def database_uri() -> str:
+    """MONGODB_URI with the cse-data database forced into the path"""
+    uri = get_env("MONGODB_URI")
+    if not uri:
+        raise ValueError("MONGODB_URI not found in .env file")
 
-        # Force connection to cse-data database
-        if "/?" in self.uri:
-            self.uri = self.uri.replace("/?", "/cse-data?")
-        else:
-            self.uri = self.uri + "cse-data"
+    # Force connection to cse-data database
+    if "/?" in uri:
+        return uri.replace("/?", "/cse-data?")
+    return uri + "cse-data"
+
+
+def history_codec_setting(codec: Optional[str] = None) -> Optional[str]:
+    """
+    Validated history codec: codec if given, else MONGODB_HISTORY_CODEC
+    Returns:
+        str: A history_codec.CODECS name, or None to store plain arrays
+    """
+    codec = codec or get_env("MONGODB_HISTORY_CODEC") or None
+    if codec in (None, "none"):
+        return None
+    if codec not in CODECS:
+        raise ValueError(
+            f"Unknown history codec {codec!r}; expected none or one of {list(CODECS)}"
+        )
+    return codec
 
+
+class MongoDBHandler:
+    def __init__(
+        self,
+        cache_size: int = 1024,
+        cache_ttl: float = 300.0,
+        history_codec: Optional[str] = None,
+    ):
+        self.uri = database_uri()
+        # Numeric histories are written as packed binary with this codec
+        # (see src/history_codec.py); reads decode either form
+        self.history_codec = history_codec_setting(history_codec)
+
+        # Connection is opened on first use of self.collection
         self.client = None
         self.db = None
-        self.collection = None
-        self.connect()
+        self._collection = None
+        self._snapshots = None
+
+        # Stored tradingViewData keyed by symbol, filled by prefetch_companies()
+        self._stored_docs: Dict[str, Optional[Dict]] = {}
+        # Read-side cache in front of the query API
+        self.read_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        # Field-level delta of the most recent successful write
+        self.last_changes: Dict = {}
+        # Write payload accounting for diff-based updates
+        self.last_bytes_saved = 0
+        self.total_bytes_full = 0
+        self.total_bytes_sent = 0
+
+    @property
+    def collection(self):
+        """The companies collection, connecting lazily on first access"""
+        if self._collection is None:
+            self.connect()
+        return self._collection
+
+    @property
+    def snapshots(self):
+        """The company_snapshots collection, connecting lazily on first access"""
+        if self._snapshots is None:
+            self.connect()
+        return self._snapshots
 
     def connect(self):
         """Establish connection to MongoDB"""
@@ -36,7 +163,8 @@ class MongoDBHandler:
                 tlsAllowInvalidCertificates=True,  # Disable SSL verification for development
             )
             self.db = self.client.get_database()
-            self.collection = self.db["companies"]
+            self._collection = self.db["companies"]
+            self._snapshots = self.db[SNAPSHOT_COLLECTION]
             print("Successfully connected to MongoDB (cse-data.companies)")
         except PyMongoError as e:
             print(f"Error connecting to MongoDB: {e}")
@@ -46,8 +174,320 @@ class MongoDBHandler:
         """Close MongoDB connection"""
         if self.client:
             self.client.close()
+            self.client = None
+            self.db = None
+            self._collection = None
+            self._snapshots = None
             print("MongoDB connection closed")
 
+    def ensure_indexes(self) -> List[str]:
+        """
+        Create the indexes used by the read API and the sync writer
+        Returns:
+            list: Names of the ensured indexes
+        """
+        covering_keys = [("basicInfo.symbol", ASCENDING)] + [
+            (f"tradingViewData.{field}", ASCENDING) for field in COVERED_LATEST_FIELDS
+        ]
+        indexes = [
+            (covering_keys, "symbol_latest_covering"),
+            (
+                [("basicInfo.symbol", ASCENDING), ("lastUpdated", DESCENDING)],
+                "symbol_last_updated",
+            ),
+        ]
+
+        names = []
+        try:
+            for keys, name in indexes:
+                names.append(self.collection.create_index(keys, name=name))
+            for field in SNAPSHOT_INDEXED_FIELDS:
+                names.append(
+                    self.snapshots.create_index(
+                        [(field, ASCENDING)], name=f"snapshot_{field}"
+                    )
+                )
+        except PyMongoError as e:
+            print(f"Error creating indexes: {e}")
+        return names
+
+    @staticmethod
+    def _latest_projection(fields: Iterable[str]) -> Dict:
+        """Projection for latest values; excludes _id so covered fields stay index-only"""
+        projection = {"_id": 0, "basicInfo.symbol": 1}
+        for field in fields:
+            projection[f"tradingViewData.{field}"] = 1
+        return projection
+
+    def get_latest_fields(
+        self, symbol: str, fields: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """
+        Get latest tradingViewData values for one company
+        Args:
+            symbol: Company symbol (e.g., "AAF.N0000")
+            fields: tradingViewData field names (default: COVERED_LATEST_FIELDS)
+        Returns:
+            dict: Field name -> value, or None if the company is not found
+        """
+        return self.get_latest_fields_many([symbol], fields).get(symbol)
+
+    def get_latest_fields_many(
+        self, symbols: Iterable[str], fields: Optional[List[str]] = None
+    ) -> Dict[str, Dict]:
+        """
+        Get latest tradingViewData values for many companies in one query
+        Args:
+            symbols: Company symbols
+            fields: tradingViewData field names (default: COVERED_LATEST_FIELDS)
+        Returns:
+            dict: Symbol -> {field: value} for every company found
+        """
+        fields = tuple(fields or COVERED_LATEST_FIELDS)
+        results = {}
+        missing = []
+        for symbol in symbols:
+            cached = self.read_cache.get(("latest", symbol, fields))
+            if cached is not None:
+                results[symbol] = cached
+            else:
+                missing.append(symbol)
+
+        if not missing:
+            return results
+
+        try:
+            cursor = self.collection.find(
+                {"basicInfo.symbol": {"$in": missing}},
+                self._latest_projection(fields),
+            )
+            for doc in cursor:
+                symbol = doc["basicInfo"]["symbol"]
+                stored = doc.get("tradingViewData", {})
+                # Callers may ask for history fields, which can be packed
+                values = {field: decode_history(stored.get(field)) for field in fields}
+                self.read_cache.set(("latest", symbol, fields), values)
+                results[symbol] = values
+        except PyMongoError as e:
+            print(f"Error reading latest values: {e}")
+        return results
+
+    def get_history(
+        self, symbol: str, field: str, limit: Optional[int] = None
+    ) -> Optional[List]:
+        """
+        Get a history array, or only its newest periods
+        Args:
+            symbol: Company symbol (e.g., "AAF.N0000")
+            field: History field name (e.g., "totalAssetsHistoryYearly")
+            limit: Number of newest periods to return (default: all)
+        Returns:
+            list: History values newest-first, or None if not found
+        """
+        cache_key = ("history", symbol, field, limit)
+        cached = self.read_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        path = f"tradingViewData.{field}"
+        projection = {"_id": 0, path: {"$slice": limit} if limit else 1}
+        try:
+            doc = self.collection.find_one({"basicInfo.symbol": symbol}, projection)
+        except PyMongoError as e:
+            print(f"Error reading {field} history for {symbol}: {e}")
+            return None
+
+        history = decode_history((doc or {}).get("tradingViewData", {}).get(field))
+        # $slice does not apply to packed histories
+        if history is not None and limit:
+            history = history[:limit]
+        if history is not None:
+            self.read_cache.set(cache_key, history)
+        return history
+
+    def get_snapshot(self, symbol: str) -> Optional[Dict]:
+        """
+        Latest values and derived ratios of one company
+        Args:
+            symbol: Company symbol (e.g., "AAF.N0000")
+        Returns:
+            dict: Snapshot document, or None if there is none yet
+        """
+        try:
+            return self.snapshots.find_one({"_id": symbol})
+        except PyMongoError as e:
+            print(f"Error reading snapshot for {symbol}: {e}")
+            return None
+
+    def screen(
+        self,
+        ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+        sort: Optional[str] = None,
+        descending: bool = False,
+        limit: int = 0,
+    ) -> List[Dict]:
+        """
+        Screen the universe by value ranges on the snapshot collection
+        Args:
+            ranges: Field -> (minimum, maximum); either bound may be None
+            sort: Field to order by (best an indexed one)
+            descending: Sort order
+            limit: Maximum documents (0: all)
+        Returns:
+            list: Matching snapshot documents
+        """
+        query = {}
+        for field, (low, high) in ranges.items():
+            bounds = {}
+            if low is not None:
+                bounds["$gte"] = low
+            if high is not None:
+                bounds["$lte"] = high
+            query[field] = bounds or {"$exists": True}
+        try:
+            cursor = self.snapshots.find(query, limit=limit)
+            if sort:
+                cursor = cursor.sort(sort, DESCENDING if descending else ASCENDING)
+            return list(cursor)
+        except PyMongoError as e:
+            print(f"Error screening snapshots: {e}")
+            return []
+
+    @staticmethod
+    def build_snapshot(symbol: str, latest: Dict) -> Dict:
+        """
+        Snapshot document from latest tradingViewData values
+        Args:
+            symbol: Company symbol
+            latest: tradingViewData field -> latest value
+        Returns:
+            dict: _id, SNAPSHOT_FIELDS present in latest and SNAPSHOT_RATIOS
+        """
+        snapshot = {"_id": symbol}
+        for field in SNAPSHOT_FIELDS:
+            if latest.get(field) is not None:
+                snapshot[field] = latest[field]
+        for ratio, (numerator, denominator) in SNAPSHOT_RATIOS.items():
+            top = 1.0 if numerator is None else snapshot.get(numerator)
+            bottom = snapshot.get(denominator)
+            if isinstance(top, (int, float)) and isinstance(bottom, (int, float)):
+                if bottom:
+                    snapshot[ratio] = top / bottom
+        return snapshot
+
+    @staticmethod
+    def snapshot_update(
+        symbol: str, update_doc: Dict, stored: Dict, changes: Dict
+    ) -> Optional[Dict]:
+        """
+        Snapshot to write after an update, or None if none of its inputs changed
+        Args:
+            symbol: Company symbol
+            update_doc: Full "tradingViewData.<field>" -> value mapping
+            stored: Stored tradingViewData before the update
+            changes: field_changes(update_doc, stored)
+        Returns:
+            dict: Snapshot document, or None
+        """
+        if not any(field in changes for field in SNAPSHOT_FIELDS):
+            return None
+        latest = {field: stored.get(field) for field in SNAPSHOT_FIELDS}
+        for path, value in update_doc.items():
+            field = (
+                path.split(".", 1)[1] if path.startswith("tradingViewData.") else path
+            )
+            if field in latest:
+                latest[field] = value
+        return MongoDBHandler.build_snapshot(symbol, latest)
+
+    def rebuild_snapshots(self, batch_size: int = 500) -> int:
+        """
+        Rebuild every snapshot from the companies collection (e.g. after
+        adding fields or on first deployment)
+        Returns:
+            int: Number of snapshots written
+        """
+        from pymongo import ReplaceOne
+
+        projection = {"_id": 0, "basicInfo.symbol": 1}
+        for field in SNAPSHOT_FIELDS:
+            projection[f"tradingViewData.{field}"] = 1
+
+        written = 0
+        operations = []
+        try:
+            for doc in self.collection.find({}, projection):
+                symbol = doc.get("basicInfo", {}).get("symbol")
+                if not symbol:
+                    continue
+                snapshot = self.build_snapshot(
+                    symbol, decode_histories(doc.get("tradingViewData") or {})
+                )
+                snapshot["updatedAt"] = datetime.utcnow()
+                operations.append(ReplaceOne({"_id": symbol}, snapshot, upsert=True))
+                if len(operations) >= batch_size:
+                    self.snapshots.bulk_write(operations, ordered=False)
+                    written += len(operations)
+                    operations = []
+            if operations:
+                self.snapshots.bulk_write(operations, ordered=False)
+                written += len(operations)
+        except PyMongoError as e:
+            print(f"Error rebuilding snapshots: {e}")
+        return written
+
+    def migrate_history_encoding(
+        self, codec: Optional[str], batch_size: int = 500
+    ) -> Dict[str, int]:
+        """
+        Rewrite stored histories with a codec, or back to plain arrays
+        Args:
+            codec: History codec name, or None to decode packed histories
+            batch_size: Documents per bulk write
+        Returns:
+            dict: "documents" scanned, "updated", "fields" rewritten, and
+                tradingViewData BSON "bytes_before" / "bytes_after"
+        """
+        from pymongo import UpdateOne
+
+        stats = dict.fromkeys(
+            ("documents", "updated", "fields", "bytes_before", "bytes_after"), 0
+        )
+        operations = []
+        try:
+            cursor = self.collection.find({}, {"_id": 1, "tradingViewData": 1})
+            for doc in cursor:
+                stored = doc.get("tradingViewData")
+                if not isinstance(stored, dict):
+                    continue
+                stats["documents"] += 1
+                migrated = decode_company(doc)["tradingViewData"]
+                if codec:
+                    for field, value in migrated.items():
+                        migrated[field] = encode_history(value, codec) or value
+
+                set_ops = {
+                    f"tradingViewData.{field}": value
+                    for field, value in migrated.items()
+                    if type(value) is not type(stored[field]) or value != stored[field]
+                }
+                stats["bytes_before"] += len(bson.encode(stored))
+                stats["bytes_after"] += len(bson.encode(migrated))
+                if not set_ops:
+                    continue
+                stats["updated"] += 1
+                stats["fields"] += len(set_ops)
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": set_ops}))
+                if len(operations) >= batch_size:
+                    self.collection.bulk_write(operations, ordered=False)
+                    operations = []
+            if operations:
+                self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            print(f"Error migrating history encoding: {e}")
+        self.read_cache.clear()
+        return stats
+
     @staticmethod
     def safe_get_first_value(data_list):
         """Safely get the first value from a list or return None if empty"""
@@ -55,334 +495,645 @@ class MongoDBHandler:
             return data_list[0]
         return None
 
-    def update_company_financials(self, symbol: str, financial_data: Dict) -> bool:
+    def prefetch_companies(self, symbols: Iterable[str], batch_size: int = 500) -> int:
+        """
+        Bulk-load the stored tradingViewData of many companies so later
+        writes can be diffed without a round trip per symbol
+        Args:
+            symbols: Company symbols (e.g., ["AAF.N0000", "HAYL.N0000"])
+            batch_size: Number of symbols per $in query
+        Returns:
+            int: Number of stored documents found
+        """
+        symbols = list(symbols)
+        found = 0
+        try:
+            for start in range(0, len(symbols), batch_size):
+                batch = symbols[start : start + batch_size]
+                for symbol in batch:
+                    self._stored_docs[symbol] = None
+
+                cursor = self.collection.find(
+                    {"basicInfo.symbol": {"$in": batch}},
+                    {"_id": 0, "basicInfo.symbol": 1, "tradingViewData": 1},
+                )
+                for doc in cursor:
+                    symbol = doc.get("basicInfo", {}).get("symbol")
+                    self._stored_docs[symbol] = doc.get("tradingViewData") or {}
+                    found += 1
+        except PyMongoError as e:
+            print(f"Error prefetching stored company data: {e}")
+            self._stored_docs.clear()
+        return found
+
+    def get_schedule_inputs(
+        self, symbols: Iterable[str], size_field: str = "basicInfo.marketCap"
+    ) -> Dict[str, Dict]:
+        """
+        Load the small set of stored fields the sync scheduler ranks by
+        Args:
+            symbols: Company symbols
+            size_field: Dotted path of the market cap / liquidity value
+        Returns:
+            dict: Symbol -> projected document (the quarter-end history cut
+                to its newest period)
+        """
+        projection = {
+            "_id": 0,
+            "basicInfo.symbol": 1,
+            "lastUpdated": 1,
+            size_field: 1,
+            "tradingViewData.financialYearEndHistoryQuarterly": {"$slice": 1},
+        }
+        inputs = {}
+        try:
+            cursor = self.collection.find(
+                {"basicInfo.symbol": {"$in": list(symbols)}}, projection
+            )
+            for doc in cursor:
+                # $slice does not apply to packed histories
+                stored = doc.get("tradingViewData") or {}
+                history = decode_history(stored.get("financialYearEndHistoryQuarterly"))
+                if isinstance(history, list):
+                    stored["financialYearEndHistoryQuarterly"] = history[:1]
+                inputs[doc["basicInfo"]["symbol"]] = doc
+        except PyMongoError as e:
+            print(f"Error loading scheduling inputs: {e}")
+        return inputs
+
+    def _get_stored_financials(self, symbol: str) -> Optional[Dict]:
+        """Return stored tradingViewData for a symbol, or None if no company matches"""
+        if symbol in self._stored_docs:
+            return self._stored_docs.pop(symbol)
+
+        doc = self.collection.find_one(
+            {"basicInfo.symbol": symbol}, {"_id": 0, "tradingViewData": 1}
+        )
+        if doc is None:
+            return None
+        return doc.get("tradingViewData") or {}
+
+    @staticmethod
+    def build_minimal_update(
+        update_doc: Dict, stored: Dict, allow_push: bool = True
+    ) -> Dict:
+        """
+        Turn a full $set document into the smallest equivalent update
+        against the stored tradingViewData
+        Args:
+            update_doc: Full "tradingViewData.<field>" -> value mapping
+            stored: Currently stored tradingViewData sub-document
+            allow_push: Prepend new history periods with $push; without it
+                every changed field is $set, which is safe to repeat
+        Returns:
+            dict: Update operators ($set and/or $push)
+        """
+        set_ops = {}
+        push_ops = {}
+
+        for path, value in update_doc.items():
+            if not path.startswith("tradingViewData."):
+                set_ops[path] = value
+                continue
+
+            field = path.split(".", 1)[1]
+            old = stored.get(field)
+            if old == value:
+                continue
+
+            # Histories are newest-first, so new periods only ever appear at the head
+            if allow_push and isinstance(value, list) and isinstance(old, list):
+                new_count = len(value) - len(old)
+                if new_count > 0 and value[new_count:] == old:
+                    push = {"$each": value[:new_count], "$position": 0}
+                    # Short histories can be cheaper to rewrite than to prepend to
+                    if len(bson.encode({path: push})) < len(bson.encode({path: value})):
+                        push_ops[path] = push
+                        continue
+
+            set_ops[path] = value
+
+        update = {}
+        if set_ops:
+            update["$set"] = set_ops
+        if push_ops:
+            update["$push"] = push_ops
+        return update
+
+    @staticmethod
+    def push_guard(update: Dict, stored: Dict) -> Dict:
+        """
+        Filter conditions that match only while every $push target is still
+        the history the update was computed against
+        Args:
+            update: Update operators from build_minimal_update()
+            stored: Stored tradingViewData the update was computed against
+        Returns:
+            dict: Query conditions on the length and head of each pushed history
+        """
+        guard = {}
+        for path in update.get("$push", {}):
+            old = stored.get(path.split(".", 1)[1]) or []
+            guard[path] = {"$size": len(old)}
+            if old:
+                guard[f"{path}.0"] = old[0]
+        return guard
+
+    @staticmethod
+    def encode_update(
+        update: Dict, update_doc: Dict, stored: Dict, codec: Optional[str]
+    ) -> Dict:
+        """
+        Apply the history codec to an update from build_minimal_update()
+        Args:
+            update: Update operators built against the decoded stored data
+            update_doc: Full "tradingViewData.<field>" -> value mapping
+            stored: Stored tradingViewData as read (histories possibly packed)
+            codec: History codec name, or None to write plain arrays
+        Returns:
+            dict: Update operators; packed histories cannot be prepended to,
+                so their $push becomes a $set of the whole history
+        """
+        set_ops = dict(update.get("$set", {}))
+        push_ops = {}
+        for path, push in update.get("$push", {}).items():
+            if codec or is_encoded_history(stored.get(path.split(".", 1)[1])):
+                set_ops[path] = update_doc[path]
+            else:
+                push_ops[path] = push
+
+        if codec:
+            for path, value in set_ops.items():
+                if path.startswith("tradingViewData."):
+                    packed = encode_history(value, codec)
+                    if packed is not None:
+                        set_ops[path] = packed
+
+        encoded = {}
+        if set_ops:
+            encoded["$set"] = set_ops
+        if push_ops:
+            encoded["$push"] = push_ops
+        return encoded
+
+    @staticmethod
+    def field_changes(update_doc: Dict, stored: Dict) -> Dict:
+        """
+        Field-level delta between a payload and the stored tradingViewData
+        Args:
+            update_doc: Full "tradingViewData.<field>" -> value mapping
+            stored: Currently stored tradingViewData sub-document
+        Returns:
+            dict: Field -> {"old", "new"}, or {"prepended"} for histories that
+            only gained new periods at the head
+        """
+        changes = {}
+        for path, value in update_doc.items():
+            if not path.startswith("tradingViewData."):
+                continue
+
+            field = path.split(".", 1)[1]
+            old = stored.get(field)
+            if old == value:
+                continue
+
+            if isinstance(value, list) and isinstance(old, list):
+                new_count = len(value) - len(old)
+                if new_count > 0 and value[new_count:] == old:
+                    changes[field] = {"prepended": value[:new_count]}
+                    continue
+
+            changes[field] = {"old": old, "new": value}
+        return changes
+
+    @staticmethod
+    def _payload_sizes(update_doc: Dict, update: Dict) -> Tuple[int, int]:
+        """BSON sizes of the full $set payload and the minimal update actually sent"""
+        return len(bson.encode({"$set": update_doc})), len(bson.encode(update))
+
+    @staticmethod
+    def plan_update(
+        symbol: str,
+        update_doc: Dict,
+        stored_raw: Dict,
+        codec: Optional[str] = None,
+        allow_push: bool = True,
+    ) -> Dict:
+        """
+        Everything a write computes before its MongoDB round trip
+        Args:
+            symbol: Company symbol (e.g., "AAF.N0000")
+            update_doc: build_update_doc() result
+            stored_raw: Stored tradingViewData as read (histories possibly packed)
+            codec: History codec name, or None to write plain arrays
+            allow_push: See build_minimal_update()
+        Returns:
+            dict: "filter" and "update" for update_one(), the decoded "stored"
+                data, its "changes" (see field_changes) and the BSON sizes
+                "bytes_full" and "bytes_sent"
+        """
+        stored = decode_histories(stored_raw)
+        update = MongoDBHandler.encode_update(
+            MongoDBHandler.build_minimal_update(update_doc, stored, allow_push),
+            update_doc,
+            stored_raw,
+            codec,
+        )
+        bytes_full, bytes_sent = MongoDBHandler._payload_sizes(update_doc, update)
+        return {
+            "filter": {
+                "basicInfo.symbol": symbol,
+                **MongoDBHandler.push_guard(update, stored),
+            },
+            "update": update,
+            "stored": stored,
+            "changes": MongoDBHandler.field_changes(update_doc, stored),
+            "bytes_full": bytes_full,
+            "bytes_sent": bytes_sent,
+        }
+
+    @classmethod
+    def build_update_doc(cls, financial_data: Dict) -> Dict:
+        """
+        Map a TradingView payload to "tradingViewData.<field>" update paths
+        Args:
+            financial_data: Dictionary from TradingView
+        Returns:
+            dict: Update path -> value, without None values
+        """
+        # Prepare update document
+        update_doc = {
+            # ======================
+            # COMPANY INFORMATION
+            # ======================
+            "tradingViewData.businessSummary": financial_data.get(
+                "business_description"
+            ),
+            "tradingViewData.website": financial_data.get("web_site_url"),
+            # ======================
+            # SHARES INFORMATION
+            # ======================
+            "tradingViewData.numberOfShares": financial_data.get(
+                "total_shares_outstanding_fy"
+            ),
+            # ======================
+            # FINANCIAL YEAR INFORMATION
+            # ======================
+            "tradingViewData.financialYearHistoryYearly": financial_data.get(
+                "fiscal_period_fy_h"
+            ),
+            "tradingViewData.financialYearHistoryQuarterly": financial_data.get(
+                "fiscal_period_fq_h"
+            ),
+            "tradingViewData.financialYearEndHistoryYearly": financial_data.get(
+                "fiscal_period_end_fy_h"
+            ),
+            "tradingViewData.financialYearEndHistoryQuarterly": financial_data.get(
+                "fiscal_period_end_fq_h"
+            ),
+            # ======================
+            # BALANCE SHEET ITEMS
+            # ======================
+            # Assets
+            "tradingViewData.totalAssets": cls.safe_get_first_value(
+                financial_data.get("total_assets_fy_h")
+            ),
+            "tradingViewData.totalAssetsHistoryYearly": financial_data.get(
+                "total_assets_fy_h"
+            ),
+            "tradingViewData.totalAssetsHistoryQuarterly": financial_data.get(
+                "total_assets_fq_h"
+            ),
+            "tradingViewData.totalCurrentAssets": cls.safe_get_first_value(
+                financial_data.get("total_current_assets_fy_h")
+            ),
+            "tradingViewData.totalCurrentAssetsHistoryYearly": financial_data.get(
+                "total_current_assets_fy_h"
+            ),
+            "tradingViewData.totalCurrentAssetsHistoryQuarterly": financial_data.get(
+                "total_current_assets_fq_h"
+            ),
+            # Liabilities
+            "tradingViewData.totalLiabilities": cls.safe_get_first_value(
+                financial_data.get("total_liabilities_fy_h")
+            ),
+            "tradingViewData.totalLiabilitiesHistoryYearly": financial_data.get(
+                "total_liabilities_fy_h"
+            ),
+            "tradingViewData.totalLiabilitiesHistoryQuarterly": financial_data.get(
+                "total_liabilities_fq_h"
+            ),
+            "tradingViewData.totalCurrentLiabilities": cls.safe_get_first_value(
+                financial_data.get("total_current_liabilities_fy_h")
+            ),
+            "tradingViewData.totalCurrentLiabilitiesHistoryYearly": financial_data.get(
+                "total_current_liabilities_fy_h"
+            ),
+            "tradingViewData.totalCurrentLiabilitiesHistoryQuarterly": financial_data.get(
+                "total_current_liabilities_fq_h"
+            ),
+            # Equity
+            "tradingViewData.totalEquity": cls.safe_get_first_value(
+                financial_data.get("total_equity_fy_h")
+            ),
+            "tradingViewData.totalEquityHistoryYearly": financial_data.get(
+                "total_equity_fy_h"
+            ),
+            "tradingViewData.totalEquityHistoryQuarterly": financial_data.get(
+                "total_equity_fq_h"
+            ),
+            "tradingViewData.shareHoldersEquity": cls.safe_get_first_value(
+                financial_data.get("shrhldrs_equity_fy_h")
+            ),
+            "tradingViewData.shareHoldersEquityHistoryYearly": financial_data.get(
+                "shrhldrs_equity_fy_h"
+            ),
+            "tradingViewData.shareHoldersEquityHistoryQuarterly": financial_data.get(
+                "shrhldrs_equity_fq_h"
+            ),
+            # Debt
+            "tradingViewData.totalDebt": cls.safe_get_first_value(
+                financial_data.get("total_debt_fy_h")
+            ),
+            "tradingViewData.totalDebtHistoryYearly": financial_data.get(
+                "total_debt_fy_h"
+            ),
+            "tradingViewData.totalDebtHistoryQuarterly": financial_data.get(
+                "total_debt_fq_h"
+            ),
+            "tradingViewData.netDebt": cls.safe_get_first_value(
+                financial_data.get("net_debt_fy_h")
+            ),
+            "tradingViewData.netDebtHistoryYearly": financial_data.get("net_debt_fy_h"),
+            "tradingViewData.netDebtHistoryQuarterly": financial_data.get(
+                "net_debt_fq_h"
+            ),
+            # ======================
+            # INCOME STATEMENT ITEMS
+            # ======================
+            "tradingViewData.totalRevenue": cls.safe_get_first_value(
+                financial_data.get("total_revenue_fy_h")
+            ),
+            "tradingViewData.totalRevenueHistoryYearly": financial_data.get(
+                "total_revenue_fy_h"
+            ),
+            "tradingViewData.totalRevenueHistoryQuarterly": financial_data.get(
+                "total_revenue_fq_h"
+            ),
+            "tradingViewData.totalProfitBeforeTax": cls.safe_get_first_value(
+                financial_data.get("net_income_starting_line_fy_h")
+            ),
+            "tradingViewData.totalProfitBeforeTaxHistoryYearly": financial_data.get(
+                "net_income_starting_line_fy_h"
+            ),
+            "tradingViewData.totalProfitBeforeTaxHistoryQuarterly": financial_data.get(
+                "net_income_starting_line_fq_h"
+            ),
+            "tradingViewData.netIncome": cls.safe_get_first_value(
+                financial_data.get("net_income_fy_h")
+            ),
+            "tradingViewData.netIncomeHistoryYearly": financial_data.get(
+                "net_income_fy_h"
+            ),
+            "tradingViewData.netIncomeHistoryQuarterly": financial_data.get(
+                "net_income_fq_h"
+            ),
+            "tradingViewData.incomeTax": cls.safe_get_first_value(
+                financial_data.get("income_tax_fy_h")
+            ),
+            "tradingViewData.incomeTaxHistoryYearly": financial_data.get(
+                "income_tax_fy_h"
+            ),
+            "tradingViewData.incomeTaxHistoryQuarterly": financial_data.get(
+                "income_tax_fq_h"
+            ),
+            # ======================
+            # PROFITABILITY RATIOS
+            # ======================
+            "tradingViewData.returnOnAssets": cls.safe_get_first_value(
+                financial_data.get("return_on_assets_fy_h")
+            ),
+            "tradingViewData.returnOnAssetsHistoryYearly": financial_data.get(
+                "return_on_assets_fy_h"
+            ),
+            "tradingViewData.returnOnAssetsHistoryQuarterly": financial_data.get(
+                "return_on_assets_fq_h"
+            ),
+            "tradingViewData.returnOnEquity": cls.safe_get_first_value(
+                financial_data.get("return_on_equity_fy_h")
+            ),
+            "tradingViewData.returnOnEquityHistoryYearly": financial_data.get(
+                "return_on_equity_fy_h"
+            ),
+            "tradingViewData.returnOnEquityHistoryQuarterly": financial_data.get(
+                "return_on_equity_fq_h"
+            ),
+            "tradingViewData.netMargin": cls.safe_get_first_value(
+                financial_data.get("net_margin_fy_h")
+            ),
+            "tradingViewData.netMarginHistoryYearly": financial_data.get(
+                "net_margin_fy_h"
+            ),
+            "tradingViewData.netMarginHistoryQuarterly": financial_data.get(
+                "net_margin_fq_h"
+            ),
+            # ======================
+            # LEVERAGE/SOLVENCY RATIOS
+            # ======================
+            "tradingViewData.debtToAsset": cls.safe_get_first_value(
+                financial_data.get("debt_to_asset_fy_h")
+            ),
+            "tradingViewData.debtToAssetHistoryYearly": financial_data.get(
+                "debt_to_asset_fy_h"
+            ),
+            "tradingViewData.debtToAssetHistoryQuarterly": financial_data.get(
+                "debt_to_asset_fq_h"
+            ),
+            "tradingViewData.debtToEquity": cls.safe_get_first_value(
+                financial_data.get("debt_to_equity_fy_h")
+            ),
+            "tradingViewData.debtToEquityHistoryYearly": financial_data.get(
+                "debt_to_equity_fy_h"
+            ),
+            "tradingViewData.debtToEquityHistoryQuarterly": financial_data.get(
+                "debt_to_equity_fq_h"
+            ),
+            # ======================
+            # LIQUIDITY RATIOS
+            # ======================
+            "tradingViewData.currentRatio": cls.safe_get_first_value(
+                financial_data.get("current_ratio_fy_h")
+            ),
+            "tradingViewData.currentRatioHistoryYearly": financial_data.get(
+                "current_ratio_fy_h"
+            ),
+            "tradingViewData.currentRatioHistoryQuarterly": financial_data.get(
+                "current_ratio_fq_h"
+            ),
+            # ======================
+            # PER SHARE METRICS
+            # ======================
+            "tradingViewData.netAssetsPerShare": cls.safe_get_first_value(
+                financial_data.get("book_value_per_share_fy_h")
+            ),
+            "tradingViewData.netAssetsPerShareHistoryYearly": financial_data.get(
+                "book_value_per_share_fy_h"
+            ),
+            "tradingViewData.netAssetsPerShareHistoryQuarterly": financial_data.get(
+                "book_value_per_share_fq_h"
+            ),
+            "tradingViewData.earningsPerShare": cls.safe_get_first_value(
+                financial_data.get("earnings_per_share_diluted_fy_h")
+            ),
+            "tradingViewData.earningsPerShareHistoryYearly": financial_data.get(
+                "earnings_per_share_diluted_fy_h"
+            ),
+            "tradingViewData.earningsPerShareHistoryQuarterly": financial_data.get(
+                "earnings_per_share_diluted_fq_h"
+            ),
+            # ======================
+            # VALUATION RATIOS
+            # ======================
+            "tradingViewData.priceToBookValue": cls.safe_get_first_value(
+                financial_data.get("price_book_fy_h")
+            ),
+            "tradingViewData.priceToBookValueHistoryYearly": financial_data.get(
+                "price_book_fy_h"
+            ),
+            "tradingViewData.priceToBookValueHistoryQuarterly": financial_data.get(
+                "price_book_fq_h"
+            ),
+            "tradingViewData.priceEarningsRatio": cls.safe_get_first_value(
+                financial_data.get("price_earnings_fy_h")
+            ),
+            "tradingViewData.priceEarningsRatioHistoryYearly": financial_data.get(
+                "price_earnings_fy_h"
+            ),
+            "tradingViewData.priceEarningsRatioHistoryQuarterly": financial_data.get(
+                "price_earnings_fq_h"
+            ),
+            # ======================
+            # DIVIDEND INFORMATION
+            # ======================
+            "tradingViewData.dividendAvailability": financial_data.get(
+                "dividends_availability"
+            ),
+            "tradingViewData.dividendPerShare": cls.safe_get_first_value(
+                financial_data.get("dps_common_stock_prim_issue_fy_h")
+            ),
+            "tradingViewData.dividendPerShareHistory": financial_data.get(
+                "dividend_amount_h"
+            ),
+            "tradingViewData.dividendPerShareHistoryYearly": financial_data.get(
+                "dps_common_stock_prim_issue_fy_h"
+            ),
+            "tradingViewData.dividendPerShareHistoryQuarterly": financial_data.get(
+                "dps_common_stock_prim_issue_fq_h"
+            ),
+            "tradingViewData.dividendPayoutRatio": cls.safe_get_first_value(
+                financial_data.get("dividend_payout_ratio_fy_h")
+            ),
+            "tradingViewData.dividendPayoutRatioHistoryYearly": financial_data.get(
+                "dividend_payout_ratio_fy_h"
+            ),
+            "tradingViewData.dividendPayoutRatioHistoryQuarterly": financial_data.get(
+                "dividend_payout_ratio_fq_h"
+            ),
+            "tradingViewData.dividendYield": cls.safe_get_first_value(
+                financial_data.get("dividends_yield_fy_h")
+            ),
+            "tradingViewData.dividendYieldHistoryYearly": financial_data.get(
+                "dividends_yield_fy_h"
+            ),
+            "tradingViewData.dividendXdDate": cls.safe_get_first_value(
+                financial_data.get("dividend_ex_date_h")
+            ),
+            "tradingViewData.dividendXdDateHistory": financial_data.get(
+                "dividend_ex_date_h"
+            ),
+            "tradingViewData.dividendPaymentDate": cls.safe_get_first_value(
+                financial_data.get("dividend_payment_date_h")
+            ),
+            "tradingViewData.dividendPaymentDateHistory": financial_data.get(
+                "dividend_payment_date_h"
+            ),
+            "tradingViewData.dividendTypeHistory": financial_data.get(
+                "dividend_type_h"
+            ),
+            # ======================
+            # METADATA
+            # ======================
+            "lastUpdated": datetime.utcnow(),
+        }
+        # Remove None values
+        update_doc = {k: v for k, v in update_doc.items() if v is not None}
+        return update_doc
+
+    def update_company_financials(
+        self,
+        symbol: str,
+        financial_data: Optional[Dict],
+        update_doc: Optional[Dict] = None,
+    ) -> bool:
         """
         Update company financial data in MongoDB
         Args:
             symbol: Company symbol (e.g., "AAF.N0000")
             financial_data: Dictionary from TradingView
+            update_doc: build_update_doc(financial_data) if already built
+                (e.g. by a worker process); financial_data may then be None
         Returns:
             bool: True if update was successful
         """
-        if not financial_data:
+        if not financial_data and update_doc is None:
             print(f"No data provided for {symbol}")
             return False
 
         try:
-            # Prepare update document
-            update_doc = {
-                # ======================
-                # COMPANY INFORMATION
-                # ======================
-                "tradingViewData.businessSummary": financial_data.get(
-                    "business_description"
-                ),
-                "tradingViewData.website": financial_data.get("web_site_url"),
-                # ======================
-                # SHARES INFORMATION
-                # ======================
-                "tradingViewData.numberOfShares": financial_data.get(
-                    "total_shares_outstanding_fy"
-                ),
-                # ======================
-                # FINANCIAL YEAR INFORMATION
-                # ======================
-                "tradingViewData.financialYearHistoryYearly": financial_data.get(
-                    "fiscal_period_fy_h"
-                ),
-                "tradingViewData.financialYearHistoryQuarterly": financial_data.get(
-                    "fiscal_period_fq_h"
-                ),
-                "tradingViewData.financialYearEndHistoryYearly": financial_data.get(
-                    "fiscal_period_end_fy_h"
-                ),
-                "tradingViewData.financialYearEndHistoryQuarterly": financial_data.get(
-                    "fiscal_period_end_fq_h"
-                ),
-                # ======================
-                # BALANCE SHEET ITEMS
-                # ======================
-                # Assets
-                "tradingViewData.totalAssets": self.safe_get_first_value(
-                    financial_data.get("total_assets_fy_h")
-                ),
-                "tradingViewData.totalAssetsHistoryYearly": financial_data.get(
-                    "total_assets_fy_h"
-                ),
-                "tradingViewData.totalAssetsHistoryQuarterly": financial_data.get(
-                    "total_assets_fq_h"
-                ),
-                "tradingViewData.totalCurrentAssets": self.safe_get_first_value(
-                    financial_data.get("total_current_assets_fy_h")
-                ),
-                "tradingViewData.totalCurrentAssetsHistoryYearly": financial_data.get(
-                    "total_current_assets_fy_h"
-                ),
-                "tradingViewData.totalCurrentAssetsHistoryQuarterly": financial_data.get(
-                    "total_current_assets_fq_h"
-                ),
-                # Liabilities
-                "tradingViewData.totalLiabilities": self.safe_get_first_value(
-                    financial_data.get("total_liabilities_fy_h")
-                ),
-                "tradingViewData.totalLiabilitiesHistoryYearly": financial_data.get(
-                    "total_liabilities_fy_h"
-                ),
-                "tradingViewData.totalLiabilitiesHistoryQuarterly": financial_data.get(
-                    "total_liabilities_fq_h"
-                ),
-                "tradingViewData.totalCurrentLiabilities": self.safe_get_first_value(
-                    financial_data.get("total_current_liabilities_fy_h")
-                ),
-                "tradingViewData.totalCurrentLiabilitiesHistoryYearly": financial_data.get(
-                    "total_current_liabilities_fy_h"
-                ),
-                "tradingViewData.totalCurrentLiabilitiesHistoryQuarterly": financial_data.get(
-                    "total_current_liabilities_fq_h"
-                ),
-                # Equity
-                "tradingViewData.totalEquity": self.safe_get_first_value(
-                    financial_data.get("total_equity_fy_h")
-                ),
-                "tradingViewData.totalEquityHistoryYearly": financial_data.get(
-                    "total_equity_fy_h"
-                ),
-                "tradingViewData.totalEquityHistoryQuarterly": financial_data.get(
-                    "total_equity_fq_h"
-                ),
-                "tradingViewData.shareHoldersEquity": self.safe_get_first_value(
-                    financial_data.get("shrhldrs_equity_fy_h")
-                ),
-                "tradingViewData.shareHoldersEquityHistoryYearly": financial_data.get(
-                    "shrhldrs_equity_fy_h"
-                ),
-                "tradingViewData.shareHoldersEquityHistoryQuarterly": financial_data.get(
-                    "shrhldrs_equity_fq_h"
-                ),
-                # Debt
-                "tradingViewData.totalDebt": self.safe_get_first_value(
-                    financial_data.get("total_debt_fy_h")
-                ),
-                "tradingViewData.totalDebtHistoryYearly": financial_data.get(
-                    "total_debt_fy_h"
-                ),
-                "tradingViewData.totalDebtHistoryQuarterly": financial_data.get(
-                    "total_debt_fq_h"
-                ),
-                "tradingViewData.netDebt": self.safe_get_first_value(
-                    financial_data.get("net_debt_fy_h")
-                ),
-                "tradingViewData.netDebtHistoryYearly": financial_data.get(
-                    "net_debt_fy_h"
-                ),
-                "tradingViewData.netDebtHistoryQuarterly": financial_data.get(
-                    "net_debt_fq_h"
-                ),
-                # ======================
-                # INCOME STATEMENT ITEMS
-                # ======================
-                "tradingViewData.totalRevenue": self.safe_get_first_value(
-                    financial_data.get("total_revenue_fy_h")
-                ),
-                "tradingViewData.totalRevenueHistoryYearly": financial_data.get(
-                    "total_revenue_fy_h"
-                ),
-                "tradingViewData.totalRevenueHistoryQuarterly": financial_data.get(
-                    "total_revenue_fq_h"
-                ),
-                "tradingViewData.totalProfitBeforeTax": self.safe_get_first_value(
-                    financial_data.get("net_income_starting_line_fy_h")
-                ),
-                "tradingViewData.totalProfitBeforeTaxHistoryYearly": financial_data.get(
-                    "net_income_starting_line_fy_h"
-                ),
-                "tradingViewData.totalProfitBeforeTaxHistoryQuarterly": financial_data.get(
-                    "net_income_starting_line_fq_h"
-                ),
-                "tradingViewData.netIncome": self.safe_get_first_value(
-                    financial_data.get("net_income_fy_h")
-                ),
-                "tradingViewData.netIncomeHistoryYearly": financial_data.get(
-                    "net_income_fy_h"
-                ),
-                "tradingViewData.netIncomeHistoryQuarterly": financial_data.get(
-                    "net_income_fq_h"
-                ),
-                "tradingViewData.incomeTax": self.safe_get_first_value(
-                    financial_data.get("income_tax_fy_h")
-                ),
-                "tradingViewData.incomeTaxHistoryYearly": financial_data.get(
-                    "income_tax_fy_h"
-                ),
-                "tradingViewData.incomeTaxHistoryQuarterly": financial_data.get(
-                    "income_tax_fq_h"
-                ),
-                # ======================
-                # PROFITABILITY RATIOS
-                # ======================
-                "tradingViewData.returnOnAssets": self.safe_get_first_value(
-                    financial_data.get("return_on_assets_fy_h")
-                ),
-                "tradingViewData.returnOnAssetsHistoryYearly": financial_data.get(
-                    "return_on_assets_fy_h"
-                ),
-                "tradingViewData.returnOnAssetsHistoryQuarterly": financial_data.get(
-                    "return_on_assets_fq_h"
-                ),
-                "tradingViewData.returnOnEquity": self.safe_get_first_value(
-                    financial_data.get("return_on_equity_fy_h")
-                ),
-                "tradingViewData.returnOnEquityHistoryYearly": financial_data.get(
-                    "return_on_equity_fy_h"
-                ),
-                "tradingViewData.returnOnEquityHistoryQuarterly": financial_data.get(
-                    "return_on_equity_fq_h"
-                ),
-                "tradingViewData.netMargin": self.safe_get_first_value(
-                    financial_data.get("net_margin_fy_h")
-                ),
-                "tradingViewData.netMarginHistoryYearly": financial_data.get(
-                    "net_margin_fy_h"
-                ),
-                "tradingViewData.netMarginHistoryQuarterly": financial_data.get(
-                    "net_margin_fq_h"
-                ),
-                # ======================
-                # LEVERAGE/SOLVENCY RATIOS
-                # ======================
-                "tradingViewData.debtToAsset": self.safe_get_first_value(
-                    financial_data.get("debt_to_asset_fy_h")
-                ),
-                "tradingViewData.debtToAssetHistoryYearly": financial_data.get(
-                    "debt_to_asset_fy_h"
-                ),
-                "tradingViewData.debtToAssetHistoryQuarterly": financial_data.get(
-                    "debt_to_asset_fq_h"
-                ),
-                "tradingViewData.debtToEquity": self.safe_get_first_value(
-                    financial_data.get("debt_to_equity_fy_h")
-                ),
-                "tradingViewData.debtToEquityHistoryYearly": financial_data.get(
-                    "debt_to_equity_fy_h"
-                ),
-                "tradingViewData.debtToEquityHistoryQuarterly": financial_data.get(
-                    "debt_to_equity_fq_h"
-                ),
-                # ======================
-                # LIQUIDITY RATIOS
-                # ======================
-                "tradingViewData.currentRatio": self.safe_get_first_value(
-                    financial_data.get("current_ratio_fy_h")
-                ),
-                "tradingViewData.currentRatioHistoryYearly": financial_data.get(
-                    "current_ratio_fy_h"
-                ),
-                "tradingViewData.currentRatioHistoryQuarterly": financial_data.get(
-                    "current_ratio_fq_h"
-                ),
-                # ======================
-                # PER SHARE METRICS
-                # ======================
-                "tradingViewData.netAssetsPerShare": self.safe_get_first_value(
-                    financial_data.get("book_value_per_share_fy_h")
-                ),
-                "tradingViewData.netAssetsPerShareHistoryYearly": financial_data.get(
-                    "book_value_per_share_fy_h"
-                ),
-                "tradingViewData.netAssetsPerShareHistoryQuarterly": financial_data.get(
-                    "book_value_per_share_fq_h"
-                ),
-                "tradingViewData.earningsPerShare": self.safe_get_first_value(
-                    financial_data.get("earnings_per_share_diluted_fy_h")
-                ),
-                "tradingViewData.earningsPerShareHistoryYearly": financial_data.get(
-                    "earnings_per_share_diluted_fy_h"
-                ),
-                "tradingViewData.earningsPerShareHistoryQuarterly": financial_data.get(
-                    "earnings_per_share_diluted_fq_h"
-                ),
-                # ======================
-                # VALUATION RATIOS
-                # ======================
-                "tradingViewData.priceToBookValue": self.safe_get_first_value(
-                    financial_data.get("price_book_fy_h")
-                ),
-                "tradingViewData.priceToBookValueHistoryYearly": financial_data.get(
-                    "price_book_fy_h"
-                ),
-                "tradingViewData.priceToBookValueHistoryQuarterly": financial_data.get(
-                    "price_book_fq_h"
-                ),
-                "tradingViewData.priceEarningsRatio": self.safe_get_first_value(
-                    financial_data.get("price_earnings_fy_h")
-                ),
-                "tradingViewData.priceEarningsRatioHistoryYearly": financial_data.get(
-                    "price_earnings_fy_h"
-                ),
-                "tradingViewData.priceEarningsRatioHistoryQuarterly": financial_data.get(
-                    "price_earnings_fq_h"
-                ),
-                # ======================
-                # DIVIDEND INFORMATION
-                # ======================
-                "tradingViewData.dividendAvailability": financial_data.get(
-                    "dividends_availability"
-                ),
-                "tradingViewData.dividendPerShare": self.safe_get_first_value(
-                    financial_data.get("dps_common_stock_prim_issue_fy_h")
-                ),
-                "tradingViewData.dividendPerShareHistory": financial_data.get(
-                    "dividend_amount_h"
-                ),
-                "tradingViewData.dividendPerShareHistoryYearly": financial_data.get(
-                    "dps_common_stock_prim_issue_fy_h"
-                ),
-                "tradingViewData.dividendPerShareHistoryQuarterly": financial_data.get(
-                    "dps_common_stock_prim_issue_fq_h"
-                ),
-                "tradingViewData.dividendPayoutRatio": self.safe_get_first_value(
-                    financial_data.get("dividend_payout_ratio_fy_h")
-                ),
-                "tradingViewData.dividendPayoutRatioHistoryYearly": financial_data.get(
-                    "dividend_payout_ratio_fy_h"
-                ),
-                "tradingViewData.dividendPayoutRatioHistoryQuarterly": financial_data.get(
-                    "dividend_payout_ratio_fq_h"
-                ),
-                "tradingViewData.dividendYield": self.safe_get_first_value(
-                    financial_data.get("dividends_yield_fy_h")
-                ),
-                "tradingViewData.dividendYieldHistoryYearly": financial_data.get(
-                    "dividends_yield_fy_h"
-                ),
-                "tradingViewData.dividendXdDate": self.safe_get_first_value(
-                    financial_data.get("dividend_ex_date_h")
-                ),
-                "tradingViewData.dividendXdDateHistory": financial_data.get(
-                    "dividend_ex_date_h"
-                ),
-                "tradingViewData.dividendPaymentDate": self.safe_get_first_value(
-                    financial_data.get("dividend_payment_date_h")
-                ),
-                "tradingViewData.dividendPaymentDateHistory": financial_data.get(
-                    "dividend_payment_date_h"
-                ),
-                "tradingViewData.dividendTypeHistory": financial_data.get(
-                    "dividend_type_h"
-                ),
-                # ======================
-                # METADATA
-                # ======================
-                "lastUpdated": datetime.utcnow(),
-            }
-            # Remove None values
-            update_doc = {k: v for k, v in update_doc.items() if v is not None}
-
-            result = self.collection.update_one(
-                {"basicInfo.symbol": symbol}, {"$set": update_doc}, upsert=False
-            )
+            if update_doc is None:
+                with stage("transform"):
+                    update_doc = self.build_update_doc(financial_data)
+
+            stored_raw = self._get_stored_financials(symbol)
+            if stored_raw is None:
+                print(f"No matching company found for symbol {symbol}")
+                return False
+
+            # A $push is only applied to the history it was computed against;
+            # if another writer got there first, re-read and $set instead
+            for allow_push in (True, False):
+                with stage("transform"):
+                    plan = self.plan_update(
+                        symbol, update_doc, stored_raw, self.history_codec, allow_push
+                    )
+
+                with stage("write"):
+                    result = self.collection.update_one(
+                        plan["filter"], plan["update"], upsert=False
+                    )
+                if result.matched_count > 0 or "$push" not in plan["update"]:
+                    break
+                stored_raw = self._get_stored_financials(symbol)
+                if stored_raw is None:
+                    break
+
+            self.last_bytes_saved = plan["bytes_full"] - plan["bytes_sent"]
+            self.total_bytes_full += plan["bytes_full"]
+            self.total_bytes_sent += plan["bytes_sent"]
 
             if result.modified_count > 0:
+                changes = plan["changes"]
+                self.last_changes = changes
+                self.read_cache.invalidate_where(lambda key: key[1] == symbol)
+                snapshot = self.snapshot_update(
+                    symbol, update_doc, plan["stored"], changes
+                )
+                if snapshot is not None:
+                    snapshot["updatedAt"] = datetime.utcnow()
+                    with stage("write"):
+                        self.snapshots.replace_one(
+                            {"_id": symbol}, snapshot, upsert=True
+                        )
                 return True
             else:
                 print(f"No matching company found for symbol {symbol}")
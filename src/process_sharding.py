@@ -0,0 +1,239 @@
+"""
+Multi-process fetching for decode-heavy runs
+
+Parsing frames and building update documents for large payloads is
+CPU-bound, so a single interpreter stops scaling once enough connections
+are open. Here each worker process runs an asyncio loop over its own slice
+of the shards, fetching with its own concurrency controller and circuit
+breaker, and sends compact results (update documents, not raw payloads)
+back over a pipe to the parent, which stays the single MongoDB writer.
+"""
+
+import os
+import queue
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.universe import TUniverseEntry
+
+# Messages from workers
+_SHARD = "shard"
+_DEFERRED = "deferred"
+_DONE = "done"
+
+
+def default_process_count() -> int:
+    """One worker per available core"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _worker_main(
+    worker_id: int, shards: List[Tuple[int, List[str]]], options: Dict, out
+):
+    """Process entry point: fetch and transform a slice of shards"""
+    import asyncio
+
+    asyncio.run(_run_worker(worker_id, shards, options, out))
+
+
+async def _run_worker(worker_id, shards, options, out):
+    import asyncio
+    from functools import partial
+
+    from src.fetch_tradingview_financials import fetch_financial_data_batch
+    from src.latency_history import LatencyHistory
+    from src.financial_sync import (
+        AdaptiveConcurrencyController,
+        CircuitBreaker,
+        fetch_batch_with_controls,
+        has_financial_data,
+    )
+    from src.mongodb_handler import MongoDBHandler
+    from src.scheduler import Deadline, DeadlineExceeded
+    from src.universe import RateBudget
+    from src.ws_transport import BandwidthStats
+
+    bandwidth = BandwidthStats(per_field=options["bandwidth_per_field"])
+    controller = AdaptiveConcurrencyController(
+        initial_limit=options["initial_concurrency"],
+        max_limit=options["max_concurrency"],
+        min_interval=options["min_interval"],
+    )
+    breaker = CircuitBreaker(options["breaker_threshold"], options["breaker_cooldown"])
+    deadline = Deadline(options["time_budget"], options["timeout"])
+    rate_budgets = {
+        exchange: RateBudget(rate) for exchange, rate in options["rate_budgets"].items()
+    }
+    # Latencies are sent back to the parent, which owns the history file
+    latency = LatencyHistory() if options["timeouts"] else None
+    fetch = partial(
+        fetch_financial_data_batch,
+        timeout=options["timeout"],
+        settle_time=options["settle_time"],
+        compression=options["compression"],
+        bandwidth=bandwidth,
+        latency=latency,
+    )
+    # Threads for blocking fetches; the controller decides how many are in flight
+    slots = asyncio.Semaphore(options["max_concurrency"])
+
+    async def run_shard(index, exchange, symbols):
+        budget = rate_budgets.get(exchange)
+        async with slots:
+            try:
+                results = await asyncio.to_thread(
+                    fetch_batch_with_controls,
+                    fetch,
+                    symbols,
+                    controller,
+                    breaker,
+                    options["retry_delay"],
+                    options["max_retries"],
+                    deadline,
+                    budget and budget.acquire,
+                    options["timeouts"] and options["timeouts"].timeout_for,
+                )
+            except DeadlineExceeded:
+                out.put((_DEFERRED, index, None))
+                return
+
+        # The expensive part of the write path happens here, off the writer
+        encoded = {}
+        for symbol, tv_data in (results or {}).items():
+            if has_financial_data(tv_data):
+                encoded[symbol] = (
+                    MongoDBHandler.build_update_doc(tv_data),
+                    tv_data if options["keep_payloads"] else None,
+                )
+        out.put((_SHARD, index, encoded))
+
+    await asyncio.gather(
+        *(run_shard(index, exchange, symbols) for index, exchange, symbols in shards)
+    )
+    out.put((_DONE, worker_id, (bandwidth.state(), latency and latency.state())))
+
+
+def iter_process_results(
+    shards: List[List[TUniverseEntry]],
+    processes: int,
+    options: Dict,
+    bandwidth=None,
+    latency=None,
+) -> Iterator[Tuple[List[TUniverseEntry], Optional[Dict]]]:
+    """
+    Fetch shards in worker processes and yield their results as they arrive
+    Args:
+        shards: Symbol shards in priority order
+        processes: Number of worker processes
+        options: Fetch settings (see worker_options)
+        bandwidth: BandwidthStats that worker totals are merged into
+        latency: LatencyHistory that worker latency samples are merged into
+    Yields:
+        (shard, results) where results maps TradingView symbol to
+        (update_doc, payload or None) for symbols with data, or None if the
+        shard was deferred because the time budget ran out. Shards of workers
+        that died are yielded last with empty results (failed).
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context("spawn")
+    out = context.Queue()
+
+    # Round-robin keeps every worker's slice in priority order
+    slices = [[] for _ in range(processes)]
+    for index, shard in enumerate(shards):
+        slices[index % processes].append(
+            (
+                index,
+                shard[0]["exchange"],
+                [entry["tradingview_symbol"] for entry in shard],
+            )
+        )
+
+    workers = [
+        context.Process(
+            target=_worker_main, args=(worker_id, slices[worker_id], options, out)
+        )
+        for worker_id in range(processes)
+        if slices[worker_id]
+    ]
+    for worker in workers:
+        worker.start()
+
+    running = len(workers)
+    reported = set()
+    try:
+        while running:
+            try:
+                kind, key, payload = out.get(timeout=1.0)
+            except queue.Empty:
+                # A worker that died without reporting would otherwise hang us
+                if not any(worker.is_alive() for worker in workers):
+                    print("\nWorker processes exited before finishing their shards")
+                    break
+                continue
+            if kind == _DONE:
+                running -= 1
+                bandwidth_state, latency_state = payload
+                if bandwidth is not None:
+                    bandwidth.merge(bandwidth_state)
+                if latency is not None and latency_state:
+                    latency.merge(latency_state)
+            else:
+                reported.add(key)
+                yield shards[key], payload
+
+        for index, shard in enumerate(shards):
+            if index not in reported:
+                yield shard, {}
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        out.close()
+
+
+def worker_options(
+    fetch_options,
+    timeout: float,
+    initial_concurrency: float,
+    time_budget: Optional[float],
+    keep_payloads: bool,
+    timeouts=None,
+) -> Dict:
+    """
+    Split run-wide limits across workers so the run as a whole keeps them
+    Args:
+        fetch_options: FetchOptions of the run (processes is the worker count)
+        timeout: Timeout of one shard fetch
+        initial_concurrency: Starting concurrency of the whole run
+        time_budget: What is left of the run's time budget (None: unlimited)
+        keep_payloads: Send raw payloads back along with update documents
+        timeouts: AdaptiveTimeouts, or None for the fixed timeout
+    Returns:
+        dict: Options for each worker process
+    """
+    processes = fetch_options.processes
+    return {
+        "timeout": timeout,
+        "settle_time": fetch_options.settle_time,
+        "compression": fetch_options.compression,
+        "bandwidth_per_field": fetch_options.bandwidth_per_field,
+        "max_concurrency": max(1, fetch_options.max_concurrency // processes),
+        "initial_concurrency": max(1.0, initial_concurrency / processes),
+        "min_interval": fetch_options.rate_limit * processes,
+        "retry_delay": fetch_options.retry_delay,
+        "max_retries": fetch_options.max_retries,
+        "breaker_threshold": fetch_options.breaker_threshold,
+        "breaker_cooldown": fetch_options.breaker_cooldown,
+        "time_budget": time_budget,
+        "rate_budgets": {
+            exchange: rate / processes
+            for exchange, rate in (fetch_options.exchange_rate_budgets or {}).items()
+        },
+        "keep_payloads": keep_payloads,
+        "timeouts": timeouts,
+    }
@@ -0,0 +1,303 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_MODES = ("cprofile", "sample")
+
+# Profiler of the current run; stage() is a no-op while this is None
+_active_profiler: Optional["RunProfiler"] = None
+
+
+class RunProfiler:
+    """
+    Per-run profiler with stage attribution
+
+    "cprofile" mode traces every call on the profiling thread and on every
+    thread started while profiling (fetch and parse run on worker threads);
+    the per-thread profiles are merged into one report. "sample" mode walks
+    all thread stacks every sample_interval seconds, which is cheap enough
+    to leave enabled on production runs. Both modes record wall time per
+    stage; tracemalloc allocations are recorded when track_allocations is
+    set (default: only in cprofile mode, since tracing every allocation
+    slows the whole run down).
+    """
+
+    def __init__(
+        self,
+        run_name: str,
+        mode: str = "sample",
+        output_dir: str = "profiles",
+        sample_interval: float = 0.005,
+        top_allocations: int = 25,
+        track_allocations: Optional[bool] = None,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected {PROFILE_MODES}")
+
+        self.run_name = run_name
+        self.mode = mode
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.top_allocations = top_allocations
+        self.track_allocations = (
+            mode == "cprofile" if track_allocations is None else track_allocations
+        )
+
+        self._lock = threading.Lock()
+        self._stage_seconds: Dict[str, float] = defaultdict(float)
+        self._stage_calls: Dict[str, int] = defaultdict(int)
+        self._stage_alloc_bytes: Dict[str, int] = defaultdict(int)
+        # Thread ident -> stage currently running on that thread
+        self._current_stages: Dict[int, str] = {}
+        # Thread ident -> open stage blocks, innermost last. Blocks of
+        # asyncio tasks on one thread can close out of order.
+        self._open_stages: Dict[int, List[List[str]]] = {}
+
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._stats: Optional[pstats.Stats] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._sampling = threading.Event()
+        self._samples: Counter = Counter()
+        self._stage_samples: Counter = Counter()
+
+        self._started_at = 0.0
+        self._elapsed = 0.0
+        self._snapshot = None
+        self._peak_memory = 0
+
+    def start(self):
+        """Begin profiling and make this the active profiler"""
+        global _active_profiler
+        if self.track_allocations:
+            tracemalloc.start(1)
+        self._started_at = time.perf_counter()
+
+        if self.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            # From 3.12 cProfile uses sys.monitoring, which covers all threads;
+            # before that each thread needs a profile of its own
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_new_thread)
+            self._cprofile.enable()
+        else:
+            self._sampling.set()
+            self._sampler = threading.Thread(
+                target=self._sample_loop, name="profile-sampler", daemon=True
+            )
+            self._sampler.start()
+
+        _active_profiler = self
+
+    def stop(self):
+        """Stop profiling and capture the allocation snapshot"""
+        global _active_profiler
+        _active_profiler = None
+
+        if self._cprofile:
+            threading.setprofile(None)
+            self._cprofile.disable()
+            self._stats = pstats.Stats(self._cprofile)
+            with self._lock:
+                # Threads still running keep profiling; their calls so far count
+                for profile in self._thread_profiles:
+                    self._stats.add(profile)
+        if self._sampler:
+            self._sampling.clear()
+            self._sampler.join()
+
+        self._elapsed = time.perf_counter() - self._started_at
+        if self.track_allocations:
+            self._snapshot = tracemalloc.take_snapshot()
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def _profile_new_thread(self, frame, event, arg):
+        """Runs once in each thread started while profiling, then hands over to cProfile"""
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while self._sampling.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stage = self._current_stages.get(ident, "other")
+                code = frame.f_code
+                leaf = f"{os.path.basename(code.co_filename)}:{frame.f_lineno}({code.co_name})"
+                self._samples[(stage, leaf)] += 1
+                self._stage_samples[stage] += 1
+            time.sleep(self.sample_interval)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Attribute wall time and net allocations of a block to a stage"""
+        ident = threading.get_ident()
+        block = [name]
+        self._open_stages.setdefault(ident, []).append(block)
+        self._current_stages[ident] = name
+        alloc_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[0] - alloc_before
+            with self._lock:
+                self._stage_seconds[name] += elapsed
+                self._stage_calls[name] += 1
+                self._stage_alloc_bytes[name] += max(allocated, 0)
+            open_stages = self._open_stages[ident]
+            # Identity, not equality: another task may have the same stage open
+            del open_stages[next(i for i, b in enumerate(open_stages) if b is block)]
+            if open_stages:
+                self._current_stages[ident] = open_stages[-1][0]
+            else:
+                self._current_stages.pop(ident, None)
+                del self._open_stages[ident]
+
+    def write_report(self) -> str:
+        """
+        Write the report artifact for this run
+        Returns:
+            str: Path of the text report
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        base = os.path.join(self.output_dir, f"{self.run_name}-{self.mode}-{timestamp}")
+
+        out = io.StringIO()
+        out.write(f"Profile report: {self.run_name} ({self.mode})\n")
+        out.write(f"Wall time: {self._elapsed:.3f}s\n")
+        if self.track_allocations:
+            out.write(f"Peak traced memory: {self._peak_memory / 1024:.1f} KiB\n")
+        out.write("\n")
+
+        out.write(
+            f"{'Stage':<12}{'Calls':>8}{'Seconds':>12}{'Share':>8}{'Alloc KiB':>12}\n"
+        )
+        for name in sorted(
+            self._stage_seconds, key=self._stage_seconds.get, reverse=True
+        ):
+            seconds = self._stage_seconds[name]
+            share = seconds / self._elapsed * 100 if self._elapsed else 0.0
+            allocated = (
+                f"{self._stage_alloc_bytes[name] / 1024:>12.1f}"
+                if self.track_allocations
+                else f"{'-':>12}"
+            )
+            out.write(
+                f"{name:<12}{self._stage_calls[name]:>8}{seconds:>12.3f}"
+                f"{share:>7.1f}%{allocated}\n"
+            )
+
+        if self._stats:
+            self._stats.dump_stats(f"{base}.prof")
+            out.write("\nTop functions by cumulative time (all threads)\n")
+            self._stats.stream = out
+            self._stats.sort_stats("cumulative").print_stats(40)
+        else:
+            total = sum(self._stage_samples.values()) or 1
+            out.write(
+                f"\nSamples per stage (every {self.sample_interval * 1000:.0f}ms)\n"
+            )
+            for stage, count in self._stage_samples.most_common():
+                out.write(f"  {stage:<12}{count:>8}{count / total * 100:>7.1f}%\n")
+            out.write("\nHottest frames\n")
+            for (stage, leaf), count in self._samples.most_common(40):
+                out.write(f"  {count:>6}  [{stage}] {leaf}\n")
+
+        if self._snapshot:
+            out.write(f"\nTop {self.top_allocations} allocations\n")
+            for stat in self._snapshot.statistics("lineno")[: self.top_allocations]:
+                out.write(f"  {stat}\n")
+
+        path = f"{base}.txt"
+        with open(path, "w") as f:
+            f.write(out.getvalue())
+        return path
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute a block to a stage of the active profiler, if any"""
+    profiler = _active_profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def maybe_start_profiler(
+    run_name: str,
+    mode: Optional[str] = None,
+    sample_rate: float = 1.0,
+    output_dir: str = "profiles",
+    track_allocations: Optional[bool] = None,
+) -> Optional[RunProfiler]:
+    """
+    Start a profiler when mode is set and this run is sampled
+    Args:
+        run_name: Prefix of the report file name
+        mode: "cprofile", "sample" or None to disable
+        sample_rate: Probability of profiling this run (e.g. 0.1 for one in ten)
+        output_dir: Directory for report artifacts
+        track_allocations: Record tracemalloc allocations (default: cprofile only)
+    Returns:
+        RunProfiler: The started profiler, or None when this run is not profiled
+    """
+    if not mode or random.random() >= sample_rate:
+        return None
+
+    profiler = RunProfiler(
+        run_name,
+        mode=mode,
+        output_dir=output_dir,
+        track_allocations=track_allocations,
+    )
+    profiler.start()
+    return profiler
+
+
+def finish_profiler(profiler: Optional[RunProfiler]) -> Optional[str]:
+    """Stop a profiler started by maybe_start_profiler and write its report"""
+    if profiler is None:
+        return None
+
+    profiler.stop()
+    path = profiler.write_report()
+    print(f"Profile report written to {path}")
+    return path
+
+
+@contextmanager
+def profile_run(
+    run_name: str,
+    mode: Optional[str] = None,
+    sample_rate: float = 1.0,
+    output_dir: str = "profiles",
+    track_allocations: Optional[bool] = None,
+):
+    """Context manager form of maybe_start_profiler/finish_profiler"""
+    profiler = maybe_start_profiler(
+        run_name, mode, sample_rate, output_dir, track_allocations
+    )
+    try:
+        yield profiler
+    finally:
+        finish_profiler(profiler)
@@ -0,0 +1,70 @@
+"""
+Runtime counters for leak detection: live threads, open sockets and RSS
+"""
+
+import os
+import sys
+import threading
+from typing import Dict, Optional
+
+
+def open_socket_count() -> Optional[int]:
+    """Sockets held by this process (Linux /proc), or None if unavailable"""
+    fd_dir = "/proc/self/fd"
+    if not os.path.isdir(fd_dir):
+        return None
+    count = 0
+    for fd in os.listdir(fd_dir):
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith("socket:"):
+                count += 1
+        except OSError:
+            continue  # Closed while listing
+    return count
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size, or the peak where only that is available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def resource_usage() -> Dict:
+    """
+    Snapshot of resources that leak when fetch clients are not cleaned up
+    Returns:
+        dict: "threads", "sockets", "rss_bytes" and "websockets" (connected
+            transport sockets not yet closed)
+    """
+    transport = sys.modules.get("src.ws_transport")
+    return {
+        "threads": threading.active_count(),
+        "sockets": open_socket_count(),
+        "rss_bytes": rss_bytes(),
+        "websockets": transport.DeflateWebSocket.live if transport else 0,
+    }
+
+
+def format_usage(usage: Dict) -> str:
+    """One-line summary of resource_usage()"""
+    rss = usage["rss_bytes"]
+    rss_text = f"{rss / 1024 / 1024:.1f} MiB" if rss is not None else "n/a"
+    return (
+        f"threads {usage['threads']}, sockets {usage['sockets']}, "
+        f"websockets {usage['websockets']}, RSS {rss_text}"
+    )
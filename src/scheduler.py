@@ -0,0 +1,171 @@
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+# Quarter end older than this means a new filing is due or just published
+FILING_DUE_DAYS = 90
+
+
+class PriorityWeights:
+    """Relative weight of each priority signal (they need not sum to 1)"""
+
+    def __init__(
+        self,
+        size: float = 0.5,
+        staleness: float = 0.3,
+        filing: float = 0.2,
+        size_field: str = "basicInfo.marketCap",
+    ):
+        self.size = size
+        self.staleness = staleness
+        self.filing = filing
+        # Dotted path of the market cap / liquidity value in stored documents
+        self.size_field = size_field
+
+
+def _get_path(doc: Dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _to_datetime(value) -> Optional[datetime]:
+    """Stored dates are datetimes; TradingView period ends are unix seconds"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    return None
+
+
+def _rank_normalize(values: Dict[str, Optional[float]]) -> Dict[str, float]:
+    """Map values to [0, 1] by rank; missing values score 0"""
+    present = sorted((v, k) for k, v in values.items() if v is not None)
+    scores = {k: 0.0 for k in values}
+    if len(present) == 1:
+        scores[present[0][1]] = 1.0
+    for rank, (_, key) in enumerate(present):
+        if len(present) > 1:
+            scores[key] = rank / (len(present) - 1)
+    return scores
+
+
+def priority_scores(
+    companies: List[Dict],
+    stored_docs: Dict[str, Dict],
+    weights: Optional[PriorityWeights] = None,
+    now: Optional[datetime] = None,
+) -> Dict[str, float]:
+    """
+    Score companies by size, staleness and filing activity
+    Args:
+        companies: Company code entries (must contain "symbol")
+        stored_docs: Symbol -> stored document (see MongoDBHandler.get_schedule_inputs)
+        weights: Priority weights (default: PriorityWeights())
+        now: Reference time (default: utcnow)
+    Returns:
+        dict: Symbol -> score, higher runs first
+    """
+    weights = weights or PriorityWeights()
+    now = now or datetime.utcnow()
+
+    sizes = {}
+    staleness = {}
+    filing_due = {}
+    for company in companies:
+        symbol = company["symbol"]
+        doc = stored_docs.get(symbol, {})
+
+        size = _get_path(doc, weights.size_field)
+        sizes[symbol] = (
+            math.log1p(size) if isinstance(size, (int, float)) and size > 0 else None
+        )
+
+        # Never-synced companies are treated as the stalest
+        last_updated = _to_datetime(doc.get("lastUpdated"))
+        staleness[symbol] = (
+            (now - last_updated).total_seconds() if last_updated else float("inf")
+        )
+
+        quarter_ends = _get_path(
+            doc, "tradingViewData.financialYearEndHistoryQuarterly"
+        )
+        latest_end = _to_datetime(quarter_ends[0]) if quarter_ends else None
+        if latest_end is None:
+            filing_due[symbol] = 1.0
+        else:
+            # Ramps from 0 at FILING_DUE_DAYS to 1 at twice that
+            days = (now - latest_end).days
+            filing_due[symbol] = min(max(days / FILING_DUE_DAYS - 1.0, 0.0), 1.0)
+
+    size_scores = _rank_normalize(sizes)
+    staleness_scores = _rank_normalize(staleness)
+    return {
+        symbol: weights.size * size_scores[symbol]
+        + weights.staleness * staleness_scores[symbol]
+        + weights.filing * filing_due[symbol]
+        for symbol in sizes
+    }
+
+
+def plan_concurrency(
+    total: int,
+    budget_seconds: Optional[float],
+    expected_fetch_seconds: float,
+    max_concurrency: int,
+    headroom: float = 0.8,
+) -> int:
+    """
+    Concurrency needed to finish total fetches within the budget
+    Args:
+        total: Number of symbols to fetch
+        budget_seconds: Wall-clock budget (None: no budget)
+        expected_fetch_seconds: Typical duration of one fetch
+        max_concurrency: Upper bound on concurrency
+        headroom: Fraction of the budget to plan against
+    Returns:
+        int: Planned concurrency between 1 and max_concurrency
+    """
+    if not budget_seconds:
+        return max_concurrency
+    usable = max(budget_seconds * headroom, expected_fetch_seconds)
+    needed = math.ceil(total * expected_fetch_seconds / usable)
+    return max(1, min(max_concurrency, needed))
+
+
+class Deadline:
+    """Wall-clock budget that stops new work while leaving room for in-flight work"""
+
+    def __init__(self, budget_seconds: Optional[float], reserve_seconds: float = 0.0):
+        self.budget_seconds = budget_seconds
+        self.reserve_seconds = reserve_seconds
+        self._expires_at = time.monotonic() + budget_seconds if budget_seconds else None
+
+    def remaining(self) -> float:
+        if self._expires_at is None:
+            return float("inf")
+        return self._expires_at - time.monotonic()
+
+    def allows_start(self) -> bool:
+        """True if work started now is expected to finish within the budget"""
+        return self.remaining() > self.reserve_seconds
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a symbol is skipped because the run's time budget ran out"""
+
+
+def deferred_report(deferred: List[Tuple[str, float]], limit: int = 20) -> str:
+    """Readable summary of symbols left for the next run"""
+    if not deferred:
+        return "No symbols deferred."
+    lines = [f"Deferred {len(deferred)} symbols (highest priority first):"]
+    for symbol, score in deferred[:limit]:
+        lines.append(f"  {symbol:<20} priority {score:.2f}")
+    if len(deferred) > limit:
+        lines.append(f"  ... and {len(deferred) - limit} more")
+    return "\n".join(lines)
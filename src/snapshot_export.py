@@ -0,0 +1,169 @@
+import os
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional
+
+SNAPSHOT_FILE_NAME = "fundamentals"
+PARTITION_PREFIX = "run_date="
+
+
+def _require_pyarrow():
+    """Import pyarrow lazily; it is only needed for snapshot export/load"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Snapshot export requires pyarrow. Install it with: pip3 install pyarrow"
+        ) from e
+    return pyarrow
+
+
+def _build_column(pa, values: List):
+    """Build one Arrow column, falling back to strings for mixed-type fields"""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if any(isinstance(v, list) for v in values):
+            return pa.array(
+                [
+                    None if v is None else [None if x is None else str(x) for x in v]
+                    for v in values
+                ],
+                type=pa.list_(pa.string()),
+            )
+        return pa.array(
+            [None if v is None else str(v) for v in values], type=pa.string()
+        )
+
+
+def records_to_table(records: Iterable[Dict]):
+    """
+    Convert fetched payloads into a columnar table
+    Args:
+        records: Financial data dictionaries (one per company)
+    Returns:
+        pyarrow.Table: One column per field, list columns for histories
+    """
+    pa = _require_pyarrow()
+    records = list(records)
+
+    field_names = []
+    for record in records:
+        for key in record:
+            if key not in field_names:
+                field_names.append(key)
+
+    columns = [
+        _build_column(pa, [r.get(name) for r in records]) for name in field_names
+    ]
+    return pa.table(columns, names=field_names)
+
+
+def _partition_dir(output_dir: str, run_date: date) -> str:
+    return os.path.join(output_dir, f"{PARTITION_PREFIX}{run_date.isoformat()}")
+
+
+def export_snapshot(
+    records: Iterable[Dict],
+    output_dir: str = "snapshots",
+    run_date: Optional[date] = None,
+    formats: Iterable[str] = ("arrow", "parquet"),
+) -> List[str]:
+    """
+    Write one run's payloads as Arrow IPC and/or Parquet, partitioned by run date
+    Args:
+        records: Financial data dictionaries (one per company)
+        output_dir: Root directory of the snapshot store
+        run_date: Partition date (default: today, UTC)
+        formats: Any of "arrow" and "parquet"
+    Returns:
+        list: Paths of the written files
+    """
+    pa = _require_pyarrow()
+    table = records_to_table(records)
+    partition = _partition_dir(output_dir, run_date or datetime.utcnow().date())
+    os.makedirs(partition, exist_ok=True)
+
+    written = []
+    if "arrow" in formats:
+        path = os.path.join(partition, f"{SNAPSHOT_FILE_NAME}.arrow")
+        # Uncompressed IPC so the loader can memory-map buffers without copying
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        written.append(path)
+    if "parquet" in formats:
+        path = os.path.join(partition, f"{SNAPSHOT_FILE_NAME}.parquet")
+        pa.parquet.write_table(table, path, compression="zstd")
+        written.append(path)
+
+    print(f"Snapshot of {table.num_rows} companies written to {partition}")
+    return written
+
+
+def export_mongo_snapshot(
+    db_handler,
+    output_dir: str = "snapshots",
+    run_date: Optional[date] = None,
+    formats: Iterable[str] = ("arrow", "parquet"),
+) -> List[str]:
+    """
+    Export the stored tradingViewData of every company in one streaming read
+    Args:
+        db_handler: Connected MongoDBHandler
+        output_dir: Root directory of the snapshot store
+        run_date: Partition date (default: today, UTC)
+        formats: Any of "arrow" and "parquet"
+    Returns:
+        list: Paths of the written files
+    """
+    cursor = db_handler.collection.find(
+        {"tradingViewData": {"$exists": True}},
+        {"_id": 0, "basicInfo.symbol": 1, "tradingViewData": 1},
+        batch_size=100,
+    )
+    from src.history_codec import decode_histories
+
+    records = (
+        {
+            "symbol": doc["basicInfo"]["symbol"],
+            **decode_histories(doc["tradingViewData"]),
+        }
+        for doc in cursor
+    )
+    return export_snapshot(records, output_dir, run_date, formats)
+
+
+def list_snapshot_dates(output_dir: str = "snapshots") -> List[str]:
+    """Return available run dates (YYYY-MM-DD), oldest first"""
+    if not os.path.isdir(output_dir):
+        return []
+    return sorted(
+        name[len(PARTITION_PREFIX) :]
+        for name in os.listdir(output_dir)
+        if name.startswith(PARTITION_PREFIX)
+    )
+
+
+def load_snapshot(output_dir: str = "snapshots", run_date: Optional[str] = None):
+    """
+    Memory-map a run's Arrow snapshot for zero-copy access
+    Args:
+        output_dir: Root directory of the snapshot store
+        run_date: Run date (YYYY-MM-DD, default: latest available)
+    Returns:
+        pyarrow.Table: Table backed by the memory-mapped file
+    """
+    pa = _require_pyarrow()
+    if run_date is None:
+        dates = list_snapshot_dates(output_dir)
+        if not dates:
+            raise FileNotFoundError(f"No snapshots found in {output_dir}")
+        run_date = dates[-1]
+
+    path = os.path.join(
+        output_dir, f"{PARTITION_PREFIX}{run_date}", f"{SNAPSHOT_FILE_NAME}.arrow"
+    )
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all()
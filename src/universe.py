@@ -0,0 +1,148 @@
+import threading
+from abc import ABC, abstractmethod
+import time
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+
+class TUniverseEntry(TypedDict):
+    exchange: str
+    symbol: str  # Symbol as stored in MongoDB (basicInfo.symbol)
+    name: str
+    tradingview_symbol: str
+
+
+class UniverseProvider(ABC):
+    """
+    Source of the symbols to sync for one exchange
+
+    Subclasses implement fetch_companies(); symbol mapping between the
+    exchange's own codes and TradingView symbols can be overridden too.
+    """
+
+    exchange = ""
+
+    @abstractmethod
+    def fetch_companies(self) -> Optional[List[Dict]]:
+        """Return company entries with at least "symbol" and "name" keys"""
+
+    def to_tradingview_symbol(self, symbol: str) -> str:
+        return f"{self.exchange}:{symbol}"
+
+    def to_db_symbol(self, tradingview_symbol: str) -> str:
+        return tradingview_symbol.split(":", 1)[-1]
+
+    def load(self) -> List[TUniverseEntry]:
+        companies = self.fetch_companies() or []
+        return [
+            {
+                "exchange": self.exchange,
+                "symbol": company["symbol"],
+                "name": company.get("name", company["symbol"]),
+                "tradingview_symbol": self.to_tradingview_symbol(company["symbol"]),
+            }
+            for company in companies
+        ]
+
+
+class CSEUniverseProvider(UniverseProvider):
+    """Colombo Stock Exchange companies from CSE_ALL_COMPANY_CODES_API_URL"""
+
+    exchange = "CSELK"
+
+    def fetch_companies(self) -> Optional[List[Dict]]:
+        from src.fetch_companies import fetch_all_company_codes
+
+        return fetch_all_company_codes()
+
+
+class StaticUniverseProvider(UniverseProvider):
+    """Fixed list of symbols for one exchange (config files, benchmarks)"""
+
+    def __init__(self, exchange: str, symbols: Iterable[str]):
+        self.exchange = exchange
+        self.symbols = list(symbols)
+
+    def fetch_companies(self) -> Optional[List[Dict]]:
+        return [{"symbol": symbol, "name": symbol} for symbol in self.symbols]
+
+
+def load_universe(providers: Iterable[UniverseProvider]) -> List[TUniverseEntry]:
+    """Load and concatenate the symbols of every provider"""
+    universe = []
+    for provider in providers:
+        entries = provider.load()
+        if not entries:
+            print(f"No symbols available from {provider.exchange}")
+        universe.extend(entries)
+    return universe
+
+
+def shard_symbols(
+    entries: List[TUniverseEntry], symbols_per_connection: int
+) -> List[List[TUniverseEntry]]:
+    """
+    Split entries into per-connection shards of at most symbols_per_connection
+
+    Each shard holds a single exchange so per-exchange rate budgets apply to
+    whole shards, and input order (priority) is preserved within and
+    across shards.
+    """
+    shards = []
+    open_shards: Dict[str, List[TUniverseEntry]] = {}
+    for entry in entries:
+        shard = open_shards.get(entry["exchange"])
+        if shard is None or len(shard) >= symbols_per_connection:
+            shard = []
+            open_shards[entry["exchange"]] = shard
+            shards.append(shard)
+        shard.append(entry)
+    return shards
+
+
+class RateBudget:
+    """Token bucket limiting symbols per second for one exchange"""
+
+    def __init__(self, symbols_per_second: float, burst: Optional[float] = None):
+        if not symbols_per_second > 0:
+            raise ValueError(
+                f"Rate budget must be positive, got {symbols_per_second} symbols/s"
+            )
+        self.rate = symbols_per_second
+        self.capacity = burst if burst is not None else max(symbols_per_second, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Take tokens, blocking until the bucket is out of debt
+
+        Requests larger than the bucket are charged in full: the balance goes
+        negative and the caller sleeps until it is paid back, so a shard of
+        many symbols delays later shards as long as the rate requires.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ExchangeRateBudgets:
+    """Per-exchange rate budgets; exchanges without a budget are unlimited"""
+
+    def __init__(self, symbols_per_second: Optional[Dict[str, float]] = None):
+        self._budgets = {
+            exchange: RateBudget(rate)
+            for exchange, rate in (symbols_per_second or {}).items()
+        }
+
+    def acquire(self, exchange: str, symbols: int = 1):
+        budget = self._budgets.get(exchange)
+        if budget:
+            budget.acquire(symbols)
@@ -0,0 +1,253 @@
+"""
+WebSocket transport with permessage-deflate (RFC 7692) and byte accounting
+
+websocket-client rejects frames with RSV1 set, so DeflateWebSocket swaps in
+a frame reader that accepts them and inflates each compressed message.
+Outgoing messages are sent uncompressed, which the extension allows.
+"""
+
+import json
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import websocket
+from websocket._abnf import ABNF, frame_buffer
+
+DEFLATE_OFFER = "permessage-deflate; client_max_window_bits"
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
+
+class BandwidthStats:
+    """
+    Bytes on the wire against decoded bytes, per session, symbol and field
+
+    Wire bytes are everything read from the socket (frame headers included);
+    decoded bytes are the inflated message text. A message carrying several
+    symbols has its wire bytes split in proportion to each symbol's share of
+    the decoded text. Per-field sizes re-serialize every value, so they are
+    only collected when per_field is set.
+    """
+
+    def __init__(self, per_field: bool = False):
+        self.per_field = per_field
+        self._lock = threading.Lock()
+        self.sessions: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self.symbols: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+        self.fields: Dict[str, int] = defaultdict(int)
+        self.compressed_sessions = 0
+
+    def record_session(self, session: str, wire: int, decoded: int, compressed: bool):
+        with self._lock:
+            self.sessions[session][0] += wire
+            self.sessions[session][1] += decoded
+            if compressed:
+                self.compressed_sessions += 1
+
+    def record_symbol(self, symbol: str, wire: float, decoded: int):
+        with self._lock:
+            self.symbols[symbol][0] += wire
+            self.symbols[symbol][1] += decoded
+
+    def record_fields(self, values: Dict):
+        if not self.per_field:
+            return
+        sizes = {
+            key: len(json.dumps(value, separators=(",", ":")))
+            for key, value in values.items()
+        }
+        with self._lock:
+            for key, size in sizes.items():
+                self.fields[key] += size
+
+    def state(self) -> Dict:
+        """Plain-dict copy of the counters (e.g. to send from a worker process)"""
+        with self._lock:
+            return {
+                "sessions": {key: list(value) for key, value in self.sessions.items()},
+                "symbols": {key: list(value) for key, value in self.symbols.items()},
+                "fields": dict(self.fields),
+                "compressed_sessions": self.compressed_sessions,
+            }
+
+    def merge(self, state: Dict):
+        """Add counters from state() of another BandwidthStats"""
+        with self._lock:
+            for target, name in (
+                (self.sessions, "sessions"),
+                (self.symbols, "symbols"),
+            ):
+                for key, (wire, decoded) in state[name].items():
+                    target[key][0] += wire
+                    target[key][1] += decoded
+            for key, size in state["fields"].items():
+                self.fields[key] += size
+            self.compressed_sessions += state["compressed_sessions"]
+
+    def totals(self) -> Tuple[int, int]:
+        with self._lock:
+            wire = sum(counts[0] for counts in self.sessions.values())
+            decoded = sum(counts[1] for counts in self.sessions.values())
+        return wire, decoded
+
+    def summary(self, top: int = 5) -> str:
+        """Readable summary for the end of a run"""
+        wire, decoded = self.totals()
+        ratio = decoded / wire if wire else 0.0
+        with self._lock:
+            lines = [
+                f"Bandwidth: {wire / 1024:.1f} KiB on the wire, "
+                f"{decoded / 1024:.1f} KiB decoded ({ratio:.1f}x) over "
+                f"{len(self.sessions)} sessions "
+                f"({self.compressed_sessions} compressed)"
+            ]
+            heaviest = sorted(self.symbols.items(), key=lambda item: -item[1][0])
+            for symbol, (sym_wire, sym_decoded) in heaviest[:top]:
+                lines.append(
+                    f"  {symbol:<24}{sym_wire / 1024:>10.1f} KiB wire"
+                    f"{sym_decoded / 1024:>10.1f} KiB decoded"
+                )
+            if self.fields:
+                lines.append("  Largest fields (decoded):")
+                for key, size in sorted(self.fields.items(), key=lambda i: -i[1])[:top]:
+                    lines.append(f"    {key:<40}{size / 1024:>10.1f} KiB")
+        return "\n".join(lines)
+
+
+class _DeflateFrameBuffer(frame_buffer):
+    """Frame reader that accepts RSV1 and remembers whether a message is compressed"""
+
+    def __init__(self, recv_fn, skip_utf8_validation):
+        super().__init__(recv_fn, skip_utf8_validation)
+        self.message_compressed = False
+
+    def recv_frame(self) -> ABNF:
+        with self.lock:
+            if self.has_received_header():
+                self.recv_header()
+            fin, rsv1, rsv2, rsv3, opcode, has_mask, _ = self.header
+
+            if self.has_received_length():
+                self.recv_length()
+            length = self.length
+
+            if self.has_received_mask():
+                self.recv_mask()
+            mask_value = self.mask_value
+
+            payload = self.recv_strict(length)
+            if has_mask:
+                payload = ABNF.mask(mask_value, payload)
+            self.clear()
+
+            # RSV1 marks the first frame of a compressed message
+            if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+                self.message_compressed = bool(rsv1)
+            frame = ABNF(fin, 0, rsv2, rsv3, opcode, has_mask, payload)
+            frame.validate(True)
+        return frame
+
+
+class DeflateWebSocket(websocket.WebSocket):
+    """
+    WebSocket that negotiates permessage-deflate and counts wire bytes
+
+    DeflateWebSocket.live counts connected sockets not yet shut down, so
+    leaks show up in resource counters.
+    """
+
+    live = 0
+    _live_lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        kwargs["skip_utf8_validation"] = True
+        super().__init__(*args, **kwargs)
+        self.frame_buffer = _DeflateFrameBuffer(self._recv, True)
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.compression = False
+        self._no_context_takeover = False
+        self._inflater = None
+        self._counted = False
+
+    def connect(self, url, **options):
+        super().connect(url, **options)
+        with DeflateWebSocket._live_lock:
+            DeflateWebSocket.live += 1
+            self._counted = True
+        extensions = (self.getheaders() or {}).get("sec-websocket-extensions", "")
+        if "permessage-deflate" in extensions:
+            self.compression = True
+            self._no_context_takeover = "server_no_context_takeover" in extensions
+            self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self, *args, **kwargs):
+        # The base close returns early once the connection has dropped,
+        # which would leave the socket open
+        try:
+            super().close(*args, **kwargs)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        super().shutdown()
+        with DeflateWebSocket._live_lock:
+            if self._counted:
+                DeflateWebSocket.live -= 1
+                self._counted = False
+
+    def _recv(self, bufsize):
+        data = super()._recv(bufsize)
+        self.wire_bytes += len(data)
+        return data
+
+    def recv_data_frame(self, control_frame: bool = False) -> tuple:
+        opcode, frame = super().recv_data_frame(control_frame)
+        if opcode in (ABNF.OPCODE_TEXT, ABNF.OPCODE_BINARY):
+            if self.compression and self.frame_buffer.message_compressed:
+                if self._no_context_takeover:
+                    self._inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+                frame.data = self._inflater.decompress(frame.data + _DEFLATE_TAIL)
+            self.decoded_bytes += len(frame.data)
+        return opcode, frame
+
+
+def open_connection(
+    url: str,
+    header: Dict,
+    compression: bool = True,
+    timeout: Optional[float] = None,
+    connect_timeout: float = 10.0,
+    **options,
+):
+    """
+    Open a WebSocket, offering permessage-deflate when compression is set
+    Args:
+        url: WebSocket URL
+        header: Request headers
+        compression: Offer permessage-deflate to the server
+        timeout: Receive timeout once connected (None blocks)
+        connect_timeout: Timeout for the TCP connect and handshake
+        options: Passed to websocket.create_connection
+    Returns:
+        DeflateWebSocket: Connected socket; .compression tells if the server agreed
+    """
+    header = dict(header)
+    if compression:
+        header["Sec-WebSocket-Extensions"] = DEFLATE_OFFER
+    ws = websocket.create_connection(
+        url,
+        class_=DeflateWebSocket,
+        header=header,
+        timeout=connect_timeout,
+        **options,
+    )
+    ws.settimeout(timeout)
+    return ws
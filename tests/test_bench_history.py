@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+from src.bench_history import compare_to_baseline, load_runs, record_run
+
+NEW = {"commit": "new", "dirty": False}
+
+
+def _run(commit, **metrics):
+    return {"benchmark": "perf", "commit": commit, "dirty": False, "metrics": metrics}
+
+
+def _history(values, metric="fetch_p95_ms"):
+    """One run per commit c0, c1, ... with the given metric values"""
+    return [_run(f"c{index}", **{metric: value}) for index, value in enumerate(values)]
+
+
+class CompareToBaselineTest(unittest.TestCase):
+    def test_too_few_commits_never_fail(self):
+        report = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 1000.0}, _history([100.0]), revision=NEW
+        )
+        self.assertTrue(report["passed"])
+        self.assertEqual(report["metrics"]["fetch_p95_ms"]["status"], "no baseline")
+
+    def test_within_noise_passes(self):
+        # Median 100, standard deviation ~7.9: 3 sigmas allow up to ~123.7
+        runs = _history([90.0, 100.0, 110.0, 95.0, 105.0])
+        report = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 120.0}, runs, revision=NEW
+        )
+        self.assertTrue(report["passed"])
+        entry = report["metrics"]["fetch_p95_ms"]
+        self.assertEqual(entry["status"], "ok")
+        self.assertEqual(entry["baseline"], 100.0)
+        self.assertEqual(entry["change_pct"], 20.0)
+
+    def test_stable_metric_uses_relative_tolerance(self):
+        runs = _history([100.0, 100.0, 100.0])
+        ok = compare_to_baseline("perf", {"fetch_p95_ms": 109.0}, runs, revision=NEW)
+        regressed = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 111.0}, runs, revision=NEW
+        )
+        self.assertTrue(ok["passed"])
+        self.assertFalse(regressed["passed"])
+
+    def test_regression_on_tracked_metric_fails(self):
+        runs = _history([100.0, 102.0, 98.0, 101.0])
+        report = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 150.0}, runs, revision=NEW
+        )
+        self.assertFalse(report["passed"])
+        self.assertEqual(report["metrics"]["fetch_p95_ms"]["status"], "regressed")
+
+    def test_direction_of_higher_is_better(self):
+        runs = _history([100.0, 100.0], metric="fetches_per_second")
+        slower = compare_to_baseline(
+            "perf", {"fetches_per_second": 50.0}, runs, revision=NEW
+        )
+        faster = compare_to_baseline(
+            "perf", {"fetches_per_second": 200.0}, runs, revision=NEW
+        )
+        self.assertFalse(slower["passed"])
+        self.assertTrue(faster["passed"])
+        self.assertEqual(faster["metrics"]["fetches_per_second"]["status"], "improved")
+
+    def test_untracked_metrics_are_ignored(self):
+        runs = _history([1.0, 1.0], metric="unrelated")
+        report = compare_to_baseline("perf", {"unrelated": 100.0}, runs, revision=NEW)
+        self.assertTrue(report["passed"])
+        self.assertEqual(report["metrics"], {})
+
+    def test_runs_of_the_same_commit_are_not_baseline(self):
+        # Earlier slow runs of this commit must not hide its regression
+        runs = _history([100.0, 100.0]) + [_run("new", fetch_p95_ms=150.0)]
+        report = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 150.0}, runs, revision=NEW
+        )
+        self.assertEqual(report["baseline_commits"], ["c0", "c1"])
+        self.assertFalse(report["passed"])
+
+    def test_commit_value_is_median_of_its_runs(self):
+        runs = _history([100.0]) + [
+            _run("c1", fetch_p95_ms=value) for value in (100.0, 100.0, 500.0)
+        ]
+        report = compare_to_baseline(
+            "perf", {"fetch_p95_ms": 100.0}, runs, revision=NEW
+        )
+        self.assertEqual(report["metrics"]["fetch_p95_ms"]["baseline"], 100.0)
+
+
+class ResultsStoreTest(unittest.TestCase):
+    def test_record_and_load(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "bench", "history.jsonl")
+            record_run("perf", {"fetch_p95_ms": 1.0}, path, revision=NEW)
+            record_run("soak", {"fetches_per_second": 2.0}, path, revision=NEW)
+            with open(path, "a") as f:
+                f.write('{"benchmark": "perf", "comm')  # Partially written line
+            runs = load_runs("perf", path)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]["commit"], "new")
+        self.assertEqual(runs[0]["metrics"], {"fetch_p95_ms": 1.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+from src.change_feed import JsonlOutbox, SQLiteOutbox, open_outbox, read_changes
+
+CHANGES = {"totalAssets": {"old": 1.0, "new": 2.0}}
+
+
+class OutboxCursorTests:
+    """Cursor behaviour shared by every outbox; subclasses set SUFFIX"""
+
+    SUFFIX = ""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "changes" + self.SUFFIX)
+        self.outbox = open_outbox(self.path)
+        self.addCleanup(self.outbox.close)
+
+    def _append(self, *symbols):
+        return [self.outbox.append(symbol, CHANGES, "run-1") for symbol in symbols]
+
+    def test_empty_changes_are_skipped(self):
+        self.assertIsNone(self.outbox.append("A", {}, "run-1"))
+        self._append("B")
+        records, _ = self.outbox.read()
+        self.assertEqual([record["symbol"] for record in records], ["B"])
+
+    def test_records_carry_their_cursor(self):
+        cursors = self._append("A", "B")
+        records, cursor = self.outbox.read()
+        self.assertEqual([record["cursor"] for record in records], cursors)
+        self.assertEqual(cursor, cursors[-1])
+        self.assertEqual(records[0]["changes"], CHANGES)
+        self.assertEqual(records[0]["run_id"], "run-1")
+
+    def test_limit_and_resume(self):
+        self._append("A", "B", "C")
+        first, cursor = self.outbox.read(0, limit=2)
+        self.assertEqual([record["symbol"] for record in first], ["A", "B"])
+        rest, cursor = self.outbox.read(cursor, limit=2)
+        self.assertEqual([record["symbol"] for record in rest], ["C"])
+        # Nothing new: the cursor stays put
+        self.assertEqual(self.outbox.read(cursor), ([], cursor))
+
+        self._append("D")
+        records, _ = self.outbox.read(cursor)
+        self.assertEqual([record["symbol"] for record in records], ["D"])
+
+    def test_iter_changes(self):
+        self._append("A", "B", "C")
+        symbols = [record["symbol"] for record in self.outbox.iter_changes(0, 2)]
+        self.assertEqual(symbols, ["A", "B", "C"])
+
+    def test_read_changes_reopens_the_file(self):
+        cursors = self._append("A", "B")
+        records, cursor = read_changes(self.path, cursors[0])
+        self.assertEqual([record["symbol"] for record in records], ["B"])
+        self.assertEqual(cursor, cursors[1])
+
+
+class SQLiteOutboxTest(OutboxCursorTests, unittest.TestCase):
+    SUFFIX = ".db"
+
+    def test_opens_sqlite(self):
+        self.assertIsInstance(self.outbox, SQLiteOutbox)
+
+
+class JsonlOutboxTest(OutboxCursorTests, unittest.TestCase):
+    SUFFIX = ".jsonl"
+
+    def test_opens_jsonl(self):
+        self.assertIsInstance(self.outbox, JsonlOutbox)
+
+    def test_cursor_is_byte_offset(self):
+        cursors = self._append("A", "B")
+        self.assertEqual(cursors[-1], os.path.getsize(self.path))
+
+    def test_partial_last_line_waits_until_complete(self):
+        self._append("A")
+        with open(self.path, "ab") as f:
+            f.write(b'{"run_id":"run-1","symbol":"B"')
+        records, cursor = self.outbox.read()
+        self.assertEqual([record["symbol"] for record in records], ["A"])
+        # Re-reading from the cursor does not consume the half-written record
+        self.assertEqual(self.outbox.read(cursor), ([], cursor))
+
+        with open(self.path, "ab") as f:
+            f.write(b',"changedAt":"2026-01-01T00:00:00","changes":{}}\n')
+        records, _ = self.outbox.read(cursor)
+        self.assertEqual([record["symbol"] for record in records], ["B"])
+
+
+class ReadChangesTest(unittest.TestCase):
+    def test_missing_path_raises_and_is_not_created(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("missing.db", "missing.jsonl"):
+                path = os.path.join(tmpdir, name)
+                with self.subTest(path=name):
+                    with self.assertRaises(FileNotFoundError):
+                        read_changes(path)
+                    self.assertFalse(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
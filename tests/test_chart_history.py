@@ -0,0 +1,98 @@
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from src.chart_history import BarStore, bar_dtype, bars_to_request, timeframe_seconds
+
+DAY = 86400
+SYMBOL = "CSELK:JKH.N0000"
+
+
+def _bars(days, close=1.0):
+    return np.array(
+        [(day * DAY, 1.0, 2.0, 0.5, close, 100.0) for day in days], dtype=bar_dtype()
+    )
+
+
+@unittest.skipIf(np is None, "bar history requires numpy")
+class BarStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+        self.store = BarStore(self.directory)
+
+    def test_empty_store(self):
+        self.assertIsNone(self.store.last_time(SYMBOL))
+        self.assertIsNone(self.store.load(SYMBOL))
+        self.assertEqual(self.store.symbols(), [])
+
+    def test_append_and_load(self):
+        self.assertEqual(self.store.append(SYMBOL, _bars(range(5))), 5)
+        bars = self.store.load(SYMBOL)
+        self.assertEqual(list(bars["time"]), [day * DAY for day in range(5)])
+        self.assertEqual(self.store.last_time(SYMBOL), 4 * DAY)
+
+    def test_overlapping_append_replaces_last_bar(self):
+        self.store.append(SYMBOL, _bars(range(5)))
+        # Days 2..6 again, with today's (day 4) bar updated since the last run
+        written = self.store.append(SYMBOL, _bars(range(2, 7), close=9.0))
+        self.assertEqual(written, 2)
+        bars = self.store.load(SYMBOL)
+        self.assertEqual(list(bars["time"]), [day * DAY for day in range(7)])
+        # Older bars are kept as stored; the bar with the last stored time is replaced
+        self.assertEqual(list(bars["close"]), [1.0] * 4 + [9.0] * 3)
+
+    def test_append_of_nothing_new(self):
+        self.store.append(SYMBOL, _bars(range(3)))
+        self.assertEqual(self.store.append(SYMBOL, _bars(range(2))), 0)
+        self.assertEqual(len(self.store.load(SYMBOL)), 3)
+
+    def test_reopen(self):
+        self.store.append(SYMBOL, _bars(range(3)))
+        self.store.append("NYSE:IBM", _bars(range(2)))
+        reopened = BarStore(self.directory)
+        self.assertEqual(reopened.symbols(), ["CSELK:JKH.N0000", "NYSE:IBM"])
+        loaded = reopened.load_all()
+        self.assertEqual(
+            {symbol: len(bars) for symbol, bars in loaded.items()},
+            {"CSELK:JKH.N0000": 3, "NYSE:IBM": 2},
+        )
+        np.testing.assert_array_equal(loaded[SYMBOL], _bars(range(3)))
+
+
+@unittest.skipIf(np is None, "bar history requires numpy")
+class BarsToRequestTest(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = BarStore(tmpdir.name)
+
+    def test_new_symbol_requests_everything(self):
+        self.assertEqual(bars_to_request(self.store, SYMBOL, "1D", 5000), 5000)
+
+    def test_gap_since_last_bar_plus_margin(self):
+        self.store.append(SYMBOL, _bars(range(10)))
+        now = 14 * DAY + 3600
+        self.assertEqual(bars_to_request(self.store, SYMBOL, "1D", 5000, now), 7)
+        self.assertEqual(bars_to_request(self.store, SYMBOL, "1W", 5000, now), 2)
+
+    def test_bounds(self):
+        self.store.append(SYMBOL, _bars(range(10)))
+        self.assertEqual(bars_to_request(self.store, SYMBOL, "1D", 5000, 9 * DAY), 2)
+        self.assertEqual(bars_to_request(self.store, SYMBOL, "1D", 100, 1e9), 100)
+
+
+class TimeframeSecondsTest(unittest.TestCase):
+    def test_resolutions(self):
+        self.assertEqual(timeframe_seconds("1D"), DAY)
+        self.assertEqual(timeframe_seconds("W"), 7 * DAY)
+        self.assertEqual(timeframe_seconds("60"), 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
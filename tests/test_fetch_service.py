@@ -0,0 +1,164 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.fetch_service import FetchService, SingleFlight
+from src.ttl_cache import TTLCache
+
+DATA = {"symbol": "CSELK:JKH.N0000", "totalAssetsFY": 10.0}
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_first_claim_leads_and_others_wait(self):
+        flights = SingleFlight()
+        leader_future, leader = flights.claim("a")
+        waiter_future, waiter_leads = flights.claim("a")
+        self.assertTrue(leader)
+        self.assertFalse(waiter_leads)
+        self.assertIs(leader_future, waiter_future)
+        self.assertEqual(len(flights), 1)
+
+        flights.resolve("a", DATA)
+        self.assertEqual(waiter_future.result(timeout=1), DATA)
+        self.assertEqual(len(flights), 0)
+
+    def test_new_flight_after_resolve(self):
+        flights = SingleFlight()
+        flights.claim("a")
+        flights.resolve("a", None)
+        _, leader = flights.claim("a")
+        self.assertTrue(leader)
+
+    def test_error_reaches_waiters(self):
+        flights = SingleFlight()
+        future, _ = flights.claim("a")
+        flights.resolve("a", error=ConnectionError("upstream down"))
+        with self.assertRaises(ConnectionError):
+            future.result(timeout=1)
+
+    def test_keys_are_independent(self):
+        flights = SingleFlight()
+        _, a_leads = flights.claim("a")
+        _, b_leads = flights.claim("b")
+        self.assertTrue(a_leads)
+        self.assertTrue(b_leads)
+        self.assertEqual(len(flights), 2)
+
+
+class TTLCacheTest(unittest.TestCase):
+    def test_entries_expire(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        with mock.patch("src.ttl_cache.time.monotonic", return_value=100.0):
+            cache.set("a", 1)
+            cache.set("b", 2, ttl=5)
+        with mock.patch("src.ttl_cache.time.monotonic", return_value=106.0):
+            self.assertEqual(cache.get("a"), 1)
+            self.assertIsNone(cache.get("b"))
+            self.assertNotIn("b", cache)
+        with mock.patch("src.ttl_cache.time.monotonic", return_value=161.0):
+            self.assertEqual(cache.get("a", "gone"), "gone")
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # b is now least recently used
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache()
+        cache.set("a", 1)
+        cache.get("a")
+        cache.get("b")
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+
+class FetchServiceTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "src.fetch_tradingview_financials.fetch_financial_data_batch"
+        )
+        self.upstream = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_requests_share_one_fetch(self):
+        release = threading.Event()
+
+        def slow_fetch(symbols, **kwargs):
+            release.wait(5)
+            return {symbol: dict(DATA, symbol=symbol) for symbol in symbols}
+
+        self.upstream.side_effect = slow_fetch
+        service = FetchService()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(service.get("A")))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while service.metrics()["deduplicated"] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result["symbol"] == "A" for result in results))
+        self.assertEqual(service.metrics()["deduplicated"], 4)
+
+    def test_cached_symbols_skip_upstream(self):
+        self.upstream.side_effect = lambda symbols, **kwargs: {
+            symbol: dict(DATA, symbol=symbol) for symbol in symbols
+        }
+        service = FetchService()
+        service.get_many(["A", "B"])
+        service.get_many(["A", "B", "C"])
+        self.assertEqual(self.upstream.call_count, 2)
+        self.assertEqual(self.upstream.call_args.args[0], ["C"])
+
+    def test_errors_return_none_and_are_not_cached(self):
+        self.upstream.side_effect = ConnectionError("upstream down")
+        service = FetchService()
+        self.assertIsNone(service.get("A"))
+        self.assertEqual(service.metrics()["upstream_errors"], 1)
+
+        self.upstream.side_effect = lambda symbols, **kwargs: {"A": DATA}
+        self.assertEqual(service.get("A"), DATA)
+        self.assertEqual(len(service.flights), 0)
+
+    def test_failed_batch_releases_later_flights(self):
+        service = FetchService(symbols_per_connection=1)
+        joined = []
+
+        def interrupted(symbols, **kwargs):
+            # Another request joins B's flight while A is being fetched
+            joined.append(service.flights.claim("B"))
+            raise KeyboardInterrupt
+
+        self.upstream.side_effect = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            service.get_many(["A", "B"])
+        future, leader = joined[0]
+        self.assertFalse(leader)
+        self.assertIsNone(future.result(timeout=1))
+        self.assertEqual(len(service.flights), 0)
+
+    def test_waiting_for_another_request_times_out(self):
+        service = FetchService(wait_timeout=0.05)
+        # Another request leads A and never finishes
+        service.flights.claim("A")
+        self.assertIsNone(service.get("A"))
+        self.upstream.assert_not_called()
+        self.assertEqual(len(service.flights), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
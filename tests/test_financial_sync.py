@@ -1,9 +1,13 @@
+import threading
 import time
+import unittest
 from typing import List, Optional
 from tqdm import tqdm
 from src.fetch_companies import fetch_all_company_codes
 from src.mongodb_handler import MongoDBHandler
 from src.fetch_tradingview_financials import fetch_financial_data
+from src.financial_sync import AdaptiveConcurrencyController, CircuitBreaker
+from src.scheduler import Deadline, DeadlineExceeded
 
 def process_all_companies(
     rate_limit: float = 5.0,  # Increased from 1.0 to 5.0
@@ -65,6 +69,139 @@ def process_all_companies(
     finally:
         db_handler.close()
 
+class AdaptiveConcurrencyControllerTest(unittest.TestCase):
+    def test_limit_grows_on_success(self):
+        controller = AdaptiveConcurrencyController(initial_limit=2.0, max_limit=4.0)
+        controller.acquire()
+        controller.release(0.1, True)
+        self.assertAlmostEqual(controller.limit, 2.5)
+        for _ in range(50):
+            controller.acquire()
+            controller.release(0.1, True)
+        self.assertEqual(controller.limit, 4.0)
+
+    def test_failure_halves_limit_once_per_window(self):
+        controller = AdaptiveConcurrencyController(
+            initial_limit=8.0, max_limit=8.0, window=3
+        )
+        for _ in range(3):
+            controller.acquire()
+            controller.release(1.0, False)
+        # The burst from one slowdown only decreases once
+        self.assertEqual(controller.limit, 4.0)
+        controller.acquire()
+        controller.release(1.0, False)
+        controller.acquire()
+        controller.release(1.0, False)
+        controller.acquire()
+        controller.release(1.0, False)
+        self.assertEqual(controller.limit, 2.0)
+        self.assertEqual(controller.stats()["error_rate"], 1.0)
+
+    def test_limit_never_drops_below_floor(self):
+        controller = AdaptiveConcurrencyController(
+            initial_limit=1.0, min_limit=1.0, window=1
+        )
+        for _ in range(5):
+            controller.acquire()
+            controller.release(1.0, False)
+        self.assertEqual(controller.limit, 1.0)
+
+    def test_latency_degradation_shrinks_limit(self):
+        controller = AdaptiveConcurrencyController(
+            initial_limit=4.0, max_limit=4.0, window=2, latency_tolerance=2.0
+        )
+        for latency in (0.1, 0.1, 1.0, 1.0):
+            controller.acquire()
+            controller.release(latency, True)
+        self.assertEqual(controller.limit, 2.0)
+
+    def test_acquire_blocks_at_limit_until_release(self):
+        controller = AdaptiveConcurrencyController(initial_limit=1.0)
+        controller.acquire()
+        acquired = threading.Event()
+
+        def second():
+            controller.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=second)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        controller.abandon()
+        self.assertTrue(acquired.wait(1))
+        thread.join(1)
+        self.assertEqual(controller.in_flight, 1)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def _open_breaker(self, cooldown=0.0):
+        breaker = CircuitBreaker(failure_threshold=3, cooldown=cooldown)
+        for _ in range(3):
+            breaker.record_failure()
+        return breaker
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker.wait_until_allowed())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.trips, 1)
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = self._open_breaker()
+        self.assertTrue(breaker.wait_until_allowed())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        # A second caller waits for the probe and gives up at its deadline
+        with self.assertRaises(DeadlineExceeded):
+            breaker.wait_until_allowed(Deadline(0.2))
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker.wait_until_allowed())
+
+    def test_failed_probe_reopens(self):
+        breaker = self._open_breaker()
+        breaker.wait_until_allowed()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.trips, 2)
+
+    def test_abandoned_probe_releases_a_waiter(self):
+        breaker = self._open_breaker()
+        self.assertTrue(breaker.wait_until_allowed())
+        results = []
+        waiter = threading.Thread(
+            target=lambda: results.append(breaker.wait_until_allowed(Deadline(5)))
+        )
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(results, [])
+        breaker.abandon_probe()
+        waiter.join(2)
+        # The waiter takes over the probe instead of waiting forever
+        self.assertEqual(results, [True])
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_deadline_stops_waiting_out_cooldown(self):
+        breaker = self._open_breaker(cooldown=60)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            breaker.wait_until_allowed(Deadline(0.2))
+        self.assertLess(time.monotonic() - start, 2 * CircuitBreaker.POLL_INTERVAL)
+
+
 if __name__ == "__main__":
     process_all_companies(
         rate_limit=2.0,          # 5 seconds between requests (conservative)
@@ -0,0 +1,159 @@
+import unittest
+
+from src.history_codec import (
+    CODECS,
+    FLAG_ZLIB,
+    KIND_FLOAT64,
+    KIND_INT64,
+    decode_company,
+    decode_history,
+    encode_history,
+    is_encoded_history,
+)
+from src.mongodb_handler import MongoDBHandler
+
+PATH = "tradingViewData.totalAssetsHistoryYearly"
+OLD = [float(value) for value in range(10, 0, -1)]
+
+
+def _kind(packed):
+    return bytes(packed)[1]
+
+
+def _flags(packed):
+    return bytes(packed)[2]
+
+
+class RoundTripTest(unittest.TestCase):
+    def assertRoundTrip(self, values, expected=None):
+        expected = values if expected is None else expected
+        for codec in CODECS:
+            with self.subTest(codec=codec):
+                packed = encode_history(values, codec)
+                self.assertTrue(is_encoded_history(packed))
+                decoded = decode_history(packed)
+                self.assertEqual(decoded, expected)
+                self.assertEqual(
+                    [type(value) for value in decoded],
+                    [type(value) for value in expected],
+                )
+
+    def test_floats(self):
+        self.assertRoundTrip([1234.5, -0.25, 1e300, 0.0, -7.0])
+
+    def test_ints(self):
+        values = [1767139200, 1759190400, 1751241600, 0]
+        self.assertRoundTrip(values)
+        self.assertEqual(_kind(encode_history(values)), KIND_INT64)
+
+    def test_negative_ints(self):
+        self.assertRoundTrip([-5, 3, -(1 << 63), (1 << 63) - 1, -1])
+
+    def test_ints_beyond_int64_are_floats(self):
+        values = [1 << 70, 1]
+        packed = encode_history(values)
+        self.assertEqual(_kind(packed), KIND_FLOAT64)
+        self.assertRoundTrip(values, [float(1 << 70), 1.0])
+
+    def test_mixed_ints_and_floats_decode_as_floats(self):
+        self.assertEqual(_kind(encode_history([1, 2.5])), KIND_FLOAT64)
+        self.assertRoundTrip([1, 2.5, -3], [1.0, 2.5, -3.0])
+
+    def test_none_bitmap(self):
+        # More than 8 values so the bitmap spans several bytes
+        values = [None, 1.5] + [float(i) for i in range(8)] + [None, None, 2.0]
+        self.assertRoundTrip(values)
+        self.assertRoundTrip([None, 3, None], [None, 3, None])
+
+    def test_zlib_fallback_when_compression_does_not_help(self):
+        values = [1.0000001**i * 3.7 for i in range(1, 4)]
+        for codec in ("float64-zlib", "delta-zlib"):
+            with self.subTest(codec=codec):
+                packed = encode_history(values, codec)
+                self.assertFalse(_flags(packed) & FLAG_ZLIB)
+                self.assertEqual(decode_history(packed), values)
+
+    def test_zlib_used_when_smaller(self):
+        values = [100.0] * 64
+        packed = encode_history(values, "delta-zlib")
+        self.assertTrue(_flags(packed) & FLAG_ZLIB)
+        self.assertLess(len(packed), len(encode_history(values, "delta")))
+        self.assertEqual(decode_history(packed), values)
+
+    def test_non_histories_are_not_encoded(self):
+        for value in ([], [None], ["a", 1.0], [True, 1.0], "text", 5.0, None):
+            with self.subTest(value=value):
+                self.assertIsNone(encode_history(value))
+                self.assertEqual(decode_history(value), value)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            encode_history([1.0], "lz4")
+
+    def test_decode_company(self):
+        doc = {
+            "basicInfo": {"symbol": "A"},
+            "tradingViewData": {"h": encode_history(OLD, "delta"), "x": 1.0},
+        }
+        self.assertEqual(decode_company(doc)["tradingViewData"], {"h": OLD, "x": 1.0})
+        self.assertIsNone(decode_company(None))
+
+
+class EncodeUpdateTest(unittest.TestCase):
+    def test_push_against_packed_history_becomes_set(self):
+        value = [11.0] + OLD
+        stored_raw = {"totalAssetsHistoryYearly": encode_history(OLD, "delta")}
+        update = MongoDBHandler.encode_update(
+            {"$push": {PATH: {"$each": [11.0], "$position": 0}}},
+            {PATH: value},
+            stored_raw,
+            None,
+        )
+        self.assertEqual(update, {"$set": {PATH: value}})
+
+    def test_push_with_codec_writes_packed_history(self):
+        value = [11.0] + OLD
+        update = MongoDBHandler.encode_update(
+            {"$push": {PATH: {"$each": [11.0], "$position": 0}}},
+            {PATH: value},
+            {"totalAssetsHistoryYearly": OLD},
+            "delta-zlib",
+        )
+        self.assertEqual(list(update), ["$set"])
+        packed = update["$set"][PATH]
+        self.assertTrue(is_encoded_history(packed))
+        self.assertEqual(decode_history(packed), value)
+
+    def test_push_to_plain_history_is_kept(self):
+        push = {"$each": [11.0], "$position": 0}
+        update = MongoDBHandler.encode_update(
+            {"$push": {PATH: push}},
+            {PATH: [11.0] + OLD},
+            {"totalAssetsHistoryYearly": OLD},
+            None,
+        )
+        self.assertEqual(update, {"$push": {PATH: push}})
+
+    def test_scalars_and_other_paths_are_not_packed(self):
+        update = MongoDBHandler.encode_update(
+            {"$set": {"tradingViewData.totalAssets": 5.0, "lastUpdated": 1}},
+            {},
+            {},
+            "delta",
+        )
+        self.assertEqual(
+            update, {"$set": {"tradingViewData.totalAssets": 5.0, "lastUpdated": 1}}
+        )
+
+    def test_plan_against_packed_history_has_no_push_guard(self):
+        stored_raw = {"totalAssetsHistoryYearly": encode_history(OLD, "float64")}
+        plan = MongoDBHandler.plan_update("A", {PATH: [11.0] + OLD}, stored_raw)
+        self.assertEqual(plan["update"], {"$set": {PATH: [11.0] + OLD}})
+        self.assertEqual(plan["filter"], {"basicInfo.symbol": "A"})
+        self.assertEqual(
+            plan["changes"], {"totalAssetsHistoryYearly": {"prepended": [11.0]}}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.latency_history import AdaptiveTimeouts, LatencyHistory
+
+
+def _history(**completes):
+    """History with one completed sample per value, 0.1s to first data"""
+    history = LatencyHistory()
+    for symbol, values in completes.items():
+        for value in values:
+            history.record(symbol, 0.1, value)
+    return history
+
+
+class LatencyHistoryTest(unittest.TestCase):
+    def test_percentiles_leave_out_cut_off_samples(self):
+        history = _history(A=[1.0, 2.0, 3.0])
+        history.record("A", 0.2, 15.0, completed=False)
+        stats = history.percentiles("A")
+        self.assertEqual(stats["samples"], 4)
+        self.assertEqual(stats["cut_off"], 1)
+        self.assertEqual(stats["complete_p50"], 2.0)
+        self.assertLessEqual(stats["complete_p99"], 3.0)
+
+    def test_only_cut_off_samples(self):
+        history = LatencyHistory()
+        history.record("A", 0.5, 15.0, completed=False)
+        stats = history.percentiles("A")
+        self.assertEqual(stats["first_p50"], 0.5)
+        self.assertIsNone(stats["complete_p99"])
+        self.assertIsNone(history.percentiles("B"))
+
+    def test_max_samples(self):
+        history = LatencyHistory(max_samples=3)
+        for value in range(5):
+            history.record("A", 0.1, float(value))
+        self.assertEqual([sample[1] for sample in history.samples("A")], [2, 3, 4])
+
+    def test_save_and_reload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "latency.json")
+            history = LatencyHistory(path)
+            history.record("A", 0.1, 1.0)
+            history.record("A", 0.1, 15.0, completed=False)
+            history.save()
+            reloaded = LatencyHistory(path)
+        self.assertEqual(reloaded.samples("A"), [[0.1, 1.0, True], [0.1, 15.0, False]])
+        self.assertEqual(reloaded.state(), {})
+
+    def test_samples_without_flag_are_completed(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "latency.json")
+            with open(path, "w") as f:
+                json.dump({"version": 1, "symbols": {"A": [[0.1, 1.0]]}}, f)
+            history = LatencyHistory(path)
+        self.assertEqual(history.percentiles("A")["cut_off"], 0)
+
+    def test_merge_keeps_cut_off_flag(self):
+        worker = LatencyHistory()
+        worker.record("A", 0.1, 1.0)
+        worker.record("A", 0.1, 15.0, completed=False)
+        parent = LatencyHistory()
+        parent.merge(worker.state())
+        self.assertEqual(parent.samples("A"), worker.samples("A"))
+
+
+class AdaptiveTimeoutsTest(unittest.TestCase):
+    def test_margin_over_p99(self):
+        timeouts = AdaptiveTimeouts(_history(A=[4.0] * 5), ["A"], margin=1.5)
+        self.assertEqual(timeouts.timeout_for(["A"]), 6.0)
+
+    def test_floor_and_cap(self):
+        history = _history(FAST=[0.2] * 5, SLOW=[100.0] * 5)
+        timeouts = AdaptiveTimeouts(history, ["FAST", "SLOW"], floor=2.0, cap=60.0)
+        self.assertEqual(timeouts.timeouts, {"FAST": 2.0, "SLOW": 60.0})
+
+    def test_min_samples(self):
+        timeouts = AdaptiveTimeouts(
+            _history(A=[1.0] * 4, B=[1.0] * 5), ["A", "B", "C"], default=15.0
+        )
+        self.assertEqual(list(timeouts.timeouts), ["B"])
+        self.assertEqual(timeouts.timeout_for(["A"]), 15.0)
+        self.assertEqual(timeouts.timeout_for(["C"]), 15.0)
+
+    def test_retry_growth_is_capped(self):
+        timeouts = AdaptiveTimeouts(
+            _history(A=[4.0] * 5), ["A"], margin=1.0, cap=20.0, retry_growth=2.0
+        )
+        self.assertEqual(
+            [timeouts.timeout_for(["A"], attempt) for attempt in range(4)],
+            [4.0, 8.0, 16.0, 20.0],
+        )
+
+    def test_batch_takes_slowest_symbol(self):
+        timeouts = AdaptiveTimeouts(
+            _history(A=[2.0] * 5, B=[6.0] * 5), ["A", "B"], margin=1.0
+        )
+        self.assertAlmostEqual(timeouts.timeout_for(["A", "B", "C"]), 15.0 + 0.2)
+        self.assertAlmostEqual(timeouts.timeout_for(["A", "B"]), 6.0 + 0.1)
+
+    def test_cut_off_samples_do_not_raise_the_timeout(self):
+        # Streams data every run but never sends quote_completed
+        history = _history(A=[1.0] * 5)
+        for timeout in (2.0, 3.0, 4.5, 6.75, 10.0):
+            history.record("A", 0.1, timeout, completed=False)
+        history.record("B", 0.1, 15.0, completed=False)
+        timeouts = AdaptiveTimeouts(history, ["A", "B"], default=15.0)
+        self.assertEqual(timeouts.timeouts, {"A": 2.0})
+        self.assertEqual(timeouts.timeout_for(["B"]), 15.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import bson
+
+from src.mongodb_handler import MongoDBHandler
+
+PATH = "tradingViewData.totalAssetsHistoryYearly"
+OLD = [float(value) for value in range(10, 0, -1)]
+
+
+class BuildMinimalUpdateTest(unittest.TestCase):
+    def test_prepend_becomes_push(self):
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: [12.0, 11.0] + OLD}, {"totalAssetsHistoryYearly": OLD}
+        )
+        self.assertEqual(
+            update, {"$push": {PATH: {"$each": [12.0, 11.0], "$position": 0}}}
+        )
+
+    def test_prepend_without_push_is_set(self):
+        value = [11.0] + OLD
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: value}, {"totalAssetsHistoryYearly": OLD}, allow_push=False
+        )
+        self.assertEqual(update, {"$set": {PATH: value}})
+
+    def test_mid_array_change_is_set(self):
+        value = list(OLD)
+        value[4] = 99.0
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: value}, {"totalAssetsHistoryYearly": OLD}
+        )
+        self.assertEqual(update, {"$set": {PATH: value}})
+
+    def test_shrink_is_set(self):
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: OLD[:5]}, {"totalAssetsHistoryYearly": OLD}
+        )
+        self.assertEqual(update, {"$set": {PATH: OLD[:5]}})
+
+    def test_short_history_is_rewritten(self):
+        value = [2.0, 1.0]
+        push = {"$each": [2.0], "$position": 0}
+        self.assertGreaterEqual(
+            len(bson.encode({PATH: push})), len(bson.encode({PATH: value}))
+        )
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: value}, {"totalAssetsHistoryYearly": [1.0]}
+        )
+        self.assertEqual(update, {"$set": {PATH: value}})
+
+    def test_unchanged_fields_are_skipped(self):
+        update = MongoDBHandler.build_minimal_update(
+            {PATH: OLD, "tradingViewData.totalAssets": 10.0, "lastUpdated": 1},
+            {"totalAssetsHistoryYearly": OLD, "totalAssets": 10.0},
+        )
+        # Paths outside tradingViewData are always written
+        self.assertEqual(update, {"$set": {"lastUpdated": 1}})
+
+
+class PushGuardTest(unittest.TestCase):
+    def test_guard_matches_length_and_head(self):
+        stored = {"totalAssetsHistoryYearly": OLD}
+        update = MongoDBHandler.build_minimal_update({PATH: [11.0] + OLD}, stored)
+        self.assertEqual(
+            MongoDBHandler.push_guard(update, stored),
+            {PATH: {"$size": len(OLD)}, f"{PATH}.0": OLD[0]},
+        )
+
+    def test_no_guard_without_push(self):
+        update = {"$set": {PATH: OLD}}
+        self.assertEqual(MongoDBHandler.push_guard(update, {}), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
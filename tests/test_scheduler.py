@@ -0,0 +1,121 @@
+import unittest
+from datetime import datetime, timedelta
+
+from src.scheduler import (
+    FILING_DUE_DAYS,
+    PriorityWeights,
+    _rank_normalize,
+    plan_concurrency,
+    priority_scores,
+)
+
+NOW = datetime(2026, 6, 30)
+
+
+def _companies(*symbols):
+    return [{"symbol": symbol} for symbol in symbols]
+
+
+class RankNormalizeTest(unittest.TestCase):
+    def test_ranks_spread_over_unit_interval(self):
+        self.assertEqual(
+            _rank_normalize({"a": 10.0, "b": 1000.0, "c": 100.0}),
+            {"a": 0.0, "b": 1.0, "c": 0.5},
+        )
+
+    def test_missing_values_score_zero(self):
+        self.assertEqual(
+            _rank_normalize({"a": None, "b": 2.0, "c": 1.0}),
+            {"a": 0.0, "b": 1.0, "c": 0.0},
+        )
+
+    def test_single_value_scores_one(self):
+        self.assertEqual(_rank_normalize({"a": 5.0, "b": None}), {"a": 1.0, "b": 0.0})
+
+    def test_empty(self):
+        self.assertEqual(_rank_normalize({}), {})
+
+
+class PriorityScoresTest(unittest.TestCase):
+    def test_size_only(self):
+        docs = {
+            "BIG": {"basicInfo": {"marketCap": 1e9}},
+            "SMALL": {"basicInfo": {"marketCap": 1e6}},
+            "NONE": {"basicInfo": {}},
+        }
+        scores = priority_scores(
+            _companies("BIG", "SMALL", "NONE"),
+            docs,
+            PriorityWeights(size=1.0, staleness=0.0, filing=0.0),
+            now=NOW,
+        )
+        self.assertEqual(scores, {"BIG": 1.0, "SMALL": 0.0, "NONE": 0.0})
+
+    def test_never_synced_is_stalest(self):
+        docs = {
+            "OLD": {"lastUpdated": NOW - timedelta(days=30)},
+            "FRESH": {"lastUpdated": NOW - timedelta(hours=1)},
+        }
+        scores = priority_scores(
+            _companies("OLD", "FRESH", "NEW"),
+            docs,
+            PriorityWeights(size=0.0, staleness=1.0, filing=0.0),
+            now=NOW,
+        )
+        self.assertEqual(scores, {"OLD": 0.5, "FRESH": 0.0, "NEW": 1.0})
+
+    def test_filing_due_ramps_after_quarter_end(self):
+        def quarter_end(days_ago):
+            end = (NOW - timedelta(days=days_ago)).timestamp()
+            return {"tradingViewData": {"financialYearEndHistoryQuarterly": [end]}}
+
+        docs = {
+            "RECENT": quarter_end(30),
+            "HALF": quarter_end(FILING_DUE_DAYS * 1.5),
+            "OVERDUE": quarter_end(FILING_DUE_DAYS * 3),
+        }
+        scores = priority_scores(
+            _companies("RECENT", "HALF", "OVERDUE", "UNKNOWN"),
+            docs,
+            PriorityWeights(size=0.0, staleness=0.0, filing=1.0),
+            now=NOW,
+        )
+        self.assertEqual(scores["RECENT"], 0.0)
+        self.assertAlmostEqual(scores["HALF"], 0.5, places=1)
+        self.assertEqual(scores["OVERDUE"], 1.0)
+        self.assertEqual(scores["UNKNOWN"], 1.0)
+
+    def test_weights_combine(self):
+        docs = {
+            "A": {"basicInfo": {"marketCap": 1e9}, "lastUpdated": NOW},
+            "B": {"basicInfo": {"marketCap": 1e6}},
+        }
+        scores = priority_scores(
+            _companies("A", "B"),
+            docs,
+            PriorityWeights(size=0.5, staleness=0.3, filing=0.2),
+            now=NOW,
+        )
+        # A: largest but fresh; B: smallest but never synced
+        self.assertAlmostEqual(scores["A"], 0.5 + 0.2)
+        self.assertAlmostEqual(scores["B"], 0.3 + 0.2)
+
+
+class PlanConcurrencyTest(unittest.TestCase):
+    def test_no_budget_uses_maximum(self):
+        self.assertEqual(plan_concurrency(100, None, 2.0, 8), 8)
+
+    def test_budget_sets_needed_concurrency(self):
+        # 100 fetches of 2s in 0.8 * 100s need ceil(200 / 80) = 3 at once
+        self.assertEqual(plan_concurrency(100, 100.0, 2.0, 8), 3)
+
+    def test_bounded_by_maximum_and_one(self):
+        self.assertEqual(plan_concurrency(1000, 10.0, 2.0, 8), 8)
+        self.assertEqual(plan_concurrency(1, 3600.0, 2.0, 8), 1)
+
+    def test_budget_shorter_than_one_fetch(self):
+        self.assertEqual(plan_concurrency(4, 1.0, 2.0, 8), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+
+from src.universe import (
+    ExchangeRateBudgets,
+    RateBudget,
+    StaticUniverseProvider,
+    shard_symbols,
+)
+
+
+class FakeClock:
+    """time.monotonic and time.sleep for src.universe; sleeping advances the clock"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def patch(self, test: unittest.TestCase):
+        for name in ("monotonic", "sleep"):
+            patcher = mock.patch(f"src.universe.time.{name}", getattr(self, name))
+            patcher.start()
+            test.addCleanup(patcher.stop)
+
+
+class RateBudgetTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.clock.patch(self)
+
+    def test_burst_is_free(self):
+        budget = RateBudget(10)
+        for _ in range(10):
+            budget.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_oversized_request_is_charged_in_full(self):
+        budget = RateBudget(5)  # Capacity 5
+        budget.acquire(200)
+        # 195 tokens of debt at 5/s
+        self.assertEqual(self.clock.sleeps, [39.0])
+        # The debt is repaid, not forgiven: the next symbol waits its turn
+        budget.acquire(1)
+        self.assertEqual(self.clock.sleeps, [39.0, 0.2])
+
+    def test_debt_delays_concurrent_callers(self):
+        budget = RateBudget(10)
+        budget.acquire(30)
+        self.assertEqual(self.clock.sleeps, [2.0])
+        # A second caller arriving at the same time queues behind the debt
+        self.clock.now -= 2.0
+        budget.acquire(10)
+        self.assertEqual(self.clock.sleeps, [2.0, 3.0])
+
+    def test_balance_refills_up_to_capacity(self):
+        budget = RateBudget(2, burst=4)
+        budget.acquire(4)
+        self.clock.now += 1.0  # 2 tokens back
+        budget.acquire(2)
+        self.assertEqual(self.clock.sleeps, [])
+        self.clock.now += 60.0  # Refill stops at the burst size
+        budget.acquire(6)
+        self.assertEqual(self.clock.sleeps, [1.0])
+
+    def test_rate_must_be_positive(self):
+        for rate in (0, -1.0):
+            with self.subTest(rate=rate), self.assertRaises(ValueError):
+                RateBudget(rate)
+
+    def test_exchange_budgets(self):
+        budgets = ExchangeRateBudgets({"CSELK": 1.0})
+        budgets.acquire("CSELK", 3)
+        budgets.acquire("NYSE", 1000)  # Unlimited
+        self.assertEqual(self.clock.sleeps, [2.0])
+
+
+def _entries(exchange, count):
+    return StaticUniverseProvider(
+        exchange, [f"S{index}" for index in range(count)]
+    ).load()
+
+
+class ShardSymbolsTest(unittest.TestCase):
+    def test_shard_sizes(self):
+        shards = shard_symbols(_entries("CSELK", 7), 3)
+        self.assertEqual([len(shard) for shard in shards], [3, 3, 1])
+
+    def test_order_is_kept(self):
+        entries = _entries("CSELK", 5)
+        shards = shard_symbols(entries, 2)
+        self.assertEqual([entry for shard in shards for entry in shard], entries)
+
+    def test_shards_hold_one_exchange(self):
+        cse, nyse = _entries("CSELK", 3), _entries("NYSE", 3)
+        # Interleaved priority order across exchanges
+        entries = [cse[0], nyse[0], cse[1], nyse[1], nyse[2], cse[2]]
+        shards = shard_symbols(entries, 2)
+        self.assertEqual(
+            [[entry["tradingview_symbol"] for entry in shard] for shard in shards],
+            [
+                ["CSELK:S0", "CSELK:S1"],
+                ["NYSE:S0", "NYSE:S1"],
+                ["NYSE:S2"],
+                ["CSELK:S2"],
+            ],
+        )
+
+    def test_empty(self):
+        self.assertEqual(shard_symbols([], 10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()